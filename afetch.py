@@ -0,0 +1,113 @@
+"""Asynchronous counterpart of the fetch layer, for the awaitable variants
+   (aresolve(), aquery(), etc.) of the scraper modules. Requests are issued by
+   coroutines on a pooled aiohttp client session (one per event loop), so
+   thousands can be in flight from one thread. They share fetch's headers,
+   timeouts and host overrides, are held to the same per-host scheduler
+   limits, and are recorded as metrics fetch events; the on-disk response
+   cache is not consulted. aiohttp is imported on first use, so the
+   synchronous modules do not depend on it.
+"""
+
+import json
+import time
+import asyncio
+from scrapese import fetch, metrics, scheduler
+
+connectionLimit = 1024 # open connections kept by each client session
+aiohttp = None
+
+_sessions = {}
+
+def _getClient():
+    global aiohttp
+    if aiohttp is None:
+        try:
+            import aiohttp as client
+        except ImportError:
+            raise Exception('The asynchronous interface requires the aiohttp package')
+        aiohttp = client
+    return aiohttp
+
+class Response(object):
+    """Fully-read response, with the parts of the requests.Response interface
+       used by the scraper modules.
+    """
+
+    def __init__(self, url, status_code, headers, content):
+        self.url = url
+        self.status_code = status_code
+        self.headers = headers
+        self.content = content
+
+    @property
+    def encoding(self):
+        contentType = self.headers.get('Content-Type', '')
+        for part in contentType.split(';')[1:]:
+            k, _, v = part.strip().partition('=')
+            if k.lower() == 'charset' and len(v) > 0:
+                return v.strip('"')
+        return 'utf-8'
+
+    @property
+    def text(self):
+        return self.content.decode(self.encoding, 'replace')
+
+    def json(self):
+        return json.loads(self.content)
+
+    def raise_for_status(self):
+        if self.status_code >= 400:
+            raise Exception('HTTP %u error for url "%s"' % (self.status_code, self.url))
+
+    def close(self):
+        pass
+
+def getSession():
+    """Returns the pooled client session for the running event loop, creating
+       it on first use.
+    """
+    client = _getClient()
+    loop = asyncio.get_running_loop()
+    session = _sessions.get(loop)
+    if session is None or session.closed:
+        connector = client.TCPConnector(limit=connectionLimit)
+        headers = dict((k, v) for k, v in fetch.headers.items() if k != 'Connection')
+        session = client.ClientSession(connector=connector, headers=headers,
+            timeout=client.ClientTimeout(sock_connect=fetch.timeout[0], sock_read=fetch.timeout[1]))
+        _sessions[loop] = session
+    return session
+
+async def close():
+    """Closes the client session of the running event loop; call before the
+       loop finishes.
+    """
+    session = _sessions.pop(asyncio.get_running_loop(), None)
+    if session is not None:
+        await session.close()
+
+async def get(url, params=None, headers=None):
+    """Awaitable form of fetch.get(), returning a fully-read Response.
+    """
+    host = fetch._getHost(url)[1]
+    url = fetch._getOverride(url)
+    session = getSession()
+    async def _send():
+        async with session.get(url, params=params, headers=headers) as res:
+            content = await res.read()
+            return Response(str(res.url), res.status, res.headers, content)
+    start = time.perf_counter()
+    try:
+        res = await scheduler.arequest(host, _send)
+    except Exception as e:
+        metrics.record('fetch', time.perf_counter() - start, host=host, error=e)
+        raise
+    metrics.record('fetch', time.perf_counter() - start, host=host, bytes=len(res.content))
+    # Parsing follows the await without yielding, so it is attributed here
+    metrics.setHost(host)
+    return res
+
+async def run(func, *args):
+    """Runs a blocking function (one with no asynchronous counterpart) on the
+       default executor.
+    """
+    return await asyncio.get_running_loop().run_in_executor(None, func, *args)
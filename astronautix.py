@@ -2,17 +2,73 @@
    site astronautix.com
 """
 
-import requests
 import bs4
 import google
-import copy
 import sys
 import pprint
 import re
-import urlparse
+import json
+import os
+import functools
+import logging
+import numpy as np
 from os import path
+from collections import OrderedDict
+
+try:
+    import urlparse
+except ImportError:
+    from urllib import parse as urlparse
+from scrapese import afetch, fetch, markup, metrics
 
 url = ''
+log = logging.getLogger(__name__)
+articleStrainer = markup.strain('div', attrs={'id': 'col1'})
+numberExpression = r'[-+]?\d[\d,]*(?:\.\d*)?(?:[eE][-+]?\d+)?'
+quantityPattern = re.compile(r'^(%s)(?:\s*(?:-|\u2013|to)\s*(%s))?\s*(.*)$' % (numberExpression, numberExpression))
+unitTable = {
+    # unit: (SI unit, scale); units whose prefix differs only in case (like
+    # mN and MN) are keyed exactly, the rest in lower case
+    '': ('', 1.0),
+    'n': ('N', 1.0),
+    'kn': ('N', 1e3),
+    'MN': ('N', 1e6),
+    'mN': ('N', 1e-3),
+    'kgf': ('N', 9.80665),
+    'lbf': ('N', 4.4482216152605),
+    's': ('s', 1.0),
+    'sec': ('s', 1.0),
+    'min': ('s', 60.0),
+    'm': ('m', 1.0),
+    'km': ('m', 1e3),
+    'cm': ('m', 1e-2),
+    'mm': ('m', 1e-3),
+    'ft': ('m', 0.3048),
+    'in': ('m', 0.0254),
+    'kg': ('kg', 1.0),
+    't': ('kg', 1e3),
+    'lb': ('kg', 0.45359237),
+    'lbm': ('kg', 0.45359237),
+    'm2': ('m2', 1.0),
+    'm3': ('m3', 1.0),
+    'pa': ('Pa', 1.0),
+    'kpa': ('Pa', 1e3),
+    'MPa': ('Pa', 1e6),
+    'mPa': ('Pa', 1e-3),
+    'bar': ('Pa', 1e5),
+    'atm': ('Pa', 101325.0),
+    'psi': ('Pa', 6894.757293168),
+    'kg/s': ('kg/s', 1.0),
+    'w': ('W', 1.0),
+    'kw': ('W', 1e3),
+    'MW': ('W', 1e6),
+    'mW': ('W', 1e-3),
+    'k': ('K', 1.0),
+    'g/cc': ('kg/m3', 1e3),
+    'g/cm3': ('kg/m3', 1e3),
+    'kg/m3': ('kg/m3', 1.0),
+    'deg': ('deg', 1.0)
+}
 
 def _resolveLink(href, baseUrl=None):
     if baseUrl is None:
@@ -37,120 +93,375 @@ def _resolveLink(href, baseUrl=None):
         return href
     else:
         absUrl = pr.netloc + '/' + '/'.join(parts) + '/' + href
-    return pr.scheme + '//' + absUrl.replace('//', '/')
-    
-def _getTitle(article):
-    # BS4 will parse the title string into a br tag
-    header = article.find('h1')
-    return header.find('br').text.strip()
-    
-def _getSummary(article):
-    # The article summary is the 
-    hr = article.find('hr')
-    ns = [ch for ch in hr.children if type(ch) is bs4.element.NavigableString]
-    return ns[-1].strip().encode('ascii', 'ignore')
-
-def _getContent(article):
-    paragraphs = []
-    hr = article.find('hr')
-    p = hr.find('p')
-    while p is not None:
-        txt = next(p.children).strip()
-        if len(txt) > 0:
-            paragraphs.append(txt.encode('ascii', 'ignore'))
-        p = p.find('p')
-    return '\n\n'.join(paragraphs)
-
-def _getSpecs(article):
-    s = []
-    p = article.find('p')
-    pp = None
-    specs = {}
-    k = ''
-    v = ''
-    while p is not None:
-        i = p.find_all('i', recursive=False)
-        if i is not None and len(i) > 0:
-            for ch in p.children:
-                if ch.name == 'i':
-                    k = ch.text
-                else:
-                    if len(k) > 0:
-                        v = ch.strip().encode('ascii', 'ignore')
-                        v = re.sub('^:|[:\.]$', '', v)
-                        k = re.sub('^:|[:\.]$', '', k)
-                        specs[k] = v
-                        k = ''
-        pp = p
-        p = p.find('p')
-    p = pp.find('br')
-    while p is not None:
-        i = p.find_all('i', recursive=False)
-        if i is not None and len(i) > 0:
-            for ch in p.children:
-                if ch.name == 'i':
-                    k = ch.text
-                else:
-                    if len(k) > 0:
-                        v = ch.strip().encode('ascii', 'ignore')
-                        v = re.sub('^:|[:\.]$', '', v)
-                        k = re.sub('^:|[:\.]$', '', k)
-                        specs[k] = v
-                        k = ''
-        p = p.find('br')    
-    return specs
-   
-def _isAssoc(tag):
-    return tag.name in ['hr','b','ul']
+    return pr.scheme + '://' + absUrl.replace('//', '/')
     
-def _getAssoc(article):
-    tags = article.find_all(_isAssoc)
-    assocs = {}
-    k = ''
-    v = ''
-    for ndx, tag in enumerate(tags):
-        if tag.name == 'b' and tags[ndx-1].name == 'hr':
-            k = tag.text.strip().encode('ascii', 'ignore')
-            k = re.sub('^Associated\s*', '', k)
-            k = re.sub('^Bibliography$', '', k) # To re-enable sources, replace with a non-zero-length string
-            k = re.sub('^See also$', 'Topics', k)
-            assocs[k] = []
-        else:
-            if tag.name == 'ul' and len(k) > 0:
-                try:
-                    name = tag.find('a').text
-                    link = _resolveLink(tag.find('a').attrs['href'])
-                    assocs[k].append({name:link})
-                except Exception as e:
-                    print('Failed to parse association value from "%s"' % str(tag))
-    return assocs
-                
-articleModelMap = {
-    'title': _getTitle,
-    'summary': _getSummary,
-    'content': _getContent,
-    'specifications': _getSpecs,
-    'associations': _getAssoc
-}
+def _ascii(text):
+    return text.encode('ascii', 'ignore').decode('ascii')
+
+def _getScope(tag):
+    """Returns the element whose descendants make up the content of the given
+       tag. Older parsers nest everything following an unclosed <hr> or <br>
+       inside it; current ones treat both as void, in which case their content
+       is what follows them within their parent.
+    """
+    if len(tag.contents) > 0 or tag.parent is None:
+        return tag
+    return tag.parent
+
+def _getContents(tag):
+    """Returns the direct children making up the content of the given tag (see
+       _getScope()).
+    """
+    if len(tag.contents) > 0:
+        return tag.contents
+    return list(tag.next_siblings)
+
+def _isWithin(node, tag):
+    """Determines whether the given node (visited after tag, in document order)
+       falls within the content of tag.
+    """
+    scope = _getScope(tag)
+    for parent in node.parents:
+        if parent is scope:
+            return True
+    return False
+
+def _readSpec(children, specs, k):
+    """Reads italicized key / value pairs from the given children into specs,
+       returning the pending key (if the last key had no value yet).
+    """
+    for ch in children:
+        if ch.name == 'i':
+            k = ch.text
+        elif len(k) > 0:
+            v = _ascii(ch.text.strip() if ch.name is not None else ch.strip())
+            v = re.sub(r'^:|[:\.]$', '', v)
+            k = re.sub(r'^:|[:\.]$', '', k)
+            specs[k] = v
+            k = ''
+    return k
+
+class _Chain(object):
+    """Follows a chain of tags with the given name, each the first such tag
+       within the one before (starting from the first within root, if given),
+       as tags arrive in document order.
+    """
+
+    def __init__(self, name, root=None):
+        self.name = name
+        self.root = root
+        self.tail = None
+        self.isClosed = False
+
+    def accept(self, tag):
+        """Returns True if the given tag extends the chain.
+        """
+        if self.isClosed or tag.name != self.name:
+            return False
+        parent = self.tail if self.tail is not None else self.root
+        if parent is not None and not _isWithin(tag, parent):
+            self.isClosed = True
+            return False
+        self.tail = tag
+        return True
+
+class _TitleVisitor(object):
+    # BS4 will parse the title string into a br tag (or after it, in the h1)
+    names = ['h1', 'br']
+
+    def __init__(self, baseUrl=None):
+        self.header = None
+        self.title = None
+
+    def visit(self, tag):
+        if tag.name == 'h1':
+            if self.header is None:
+                self.header = tag
+        elif self.header is not None and self.title is None and _isWithin(tag, self.header):
+            self.title = tag.text.strip()
+            if len(self.title) == 0:
+                self.title = ''.join(ch if ch.name is None else ch.text for ch in tag.next_siblings).strip()
+
+    def getResult(self):
+        return self.title
+
+class _SummaryVisitor(object):
+    # The article summary is the last text directly following the first rule
+    names = ['hr']
+
+    def __init__(self, baseUrl=None):
+        self.summary = None
+
+    def visit(self, tag):
+        if self.summary is None:
+            ns = [ch for ch in _getContents(tag) if type(ch) is bs4.element.NavigableString and len(ch.strip()) > 0]
+            self.summary = _ascii(ns[-1].strip()) if len(ns) > 0 else ''
+
+    def getResult(self):
+        return self.summary
+
+class _ContentVisitor(object):
+    names = ['hr', 'p']
+
+    def __init__(self, baseUrl=None):
+        self.chain = None
+        self.paragraphs = []
+
+    def visit(self, tag):
+        if tag.name == 'hr':
+            if self.chain is None:
+                self.chain = _Chain('p', tag)
+        elif self.chain is not None and self.chain.accept(tag):
+            ch = next(iter(tag.children), None)
+            if type(ch) is bs4.element.NavigableString and len(ch.strip()) > 0:
+                self.paragraphs.append(_ascii(ch.strip()))
+
+    def getResult(self):
+        return '\n\n'.join(self.paragraphs)
+
+class _SpecsVisitor(object):
+    # Specifications are italicized keys in the chain of nested paragraphs,
+    # followed by any in the chain of line breaks within the last paragraph
+    names = ['p', 'br']
+
+    def __init__(self, baseUrl=None):
+        self.paragraphs = _Chain('p')
+        self.breaks = None
+        self.specs = {}
+        self.k = ''
+        self.breakSpecs = {}
+        self.breakK = ''
+
+    def visit(self, tag):
+        if tag.name == 'p':
+            if self.paragraphs.accept(tag):
+                if len(tag.find_all('i', recursive=False)) > 0:
+                    self.k = _readSpec(tag.children, self.specs, self.k)
+                self.breaks = _Chain('br', tag)
+                self.breakSpecs = {}
+                self.breakK = self.k
+        elif self.breaks is not None and self.breaks.accept(tag):
+            if len(tag.find_all('i', recursive=False)) > 0:
+                self.breakK = _readSpec(tag.children, self.breakSpecs, self.breakK)
+
+    def getResult(self):
+        specs = dict(self.specs)
+        specs.update(self.breakSpecs)
+        return specs
+
+class _AssocVisitor(object):
+    names = ['hr', 'b', 'ul']
+
+    def __init__(self, baseUrl=None):
+        self.baseUrl = baseUrl
+        self.previous = None
+        self.k = ''
+        self.assocs = {}
+
+    def visit(self, tag):
+        if tag.name == 'b' and self.previous == 'hr':
+            k = _ascii(tag.text.strip())
+            k = re.sub(r'^Associated\s*', '', k)
+            k = re.sub(r'^Bibliography$', '', k) # To re-enable sources, replace with a non-zero-length string
+            k = re.sub(r'^See also$', 'Topics', k)
+            self.k = k
+            self.assocs[k] = []
+        elif tag.name == 'ul' and len(self.k) > 0:
+            a = tag.find('a')
+            if a is not None and 'href' in a.attrs:
+                self.assocs[self.k].append({a.text: _resolveLink(a.attrs['href'], self.baseUrl)})
+            else:
+                log.warning('Failed to parse association value from "%s"', str(tag))
+        self.previous = tag.name
+
+    def getResult(self):
+        return self.assocs
+
+articleVisitors = OrderedDict([
+    ('title', _TitleVisitor),
+    ('summary', _SummaryVisitor),
+    ('content', _ContentVisitor),
+    ('specifications', _SpecsVisitor),
+    ('associations', _AssocVisitor)
+])
+
+def readArticle(article, baseUrl=None):
+    """Builds the article model (one entry per registered visitor) in a single
+       traversal of the article element, dispatching each tag to the visitors
+       registered for its name.
+    """
+    visitors = OrderedDict((k, v(baseUrl)) for k, v in articleVisitors.items())
+    byName = {}
+    for visitor in visitors.values():
+        for name in visitor.names:
+            byName.setdefault(name, []).append(visitor)
+    for node in article.descendants:
+        if node.name in byName:
+            for visitor in byName[node.name]:
+                visitor.visit(node)
+    return dict((k, v.getResult()) for k, v in visitors.items())
 
 def resolve(term):
     return google.lucky('site:astronautix.com ' + term)
 
+def readPage(content, url):
+    """Returns the article model from the given page markup (fetched from the
+       given URL, against which links are resolved). As a module-level
+       function, it can be run on a process pool (see pipeline.imap()).
+    """
+    # Extractors rely on html.parser nesting unclosed <p> tags
+    soup = markup.getSoup(content, articleStrainer, 'html.parser')
+    with metrics.timer('extract'):
+        article = soup.find('div', attrs={'id':'col1'})
+        return readArticle(article, url)
+
 def query(url):
-    res = requests.get(url)
-    soup = bs4.BeautifulSoup(res.content, 'html.parser')
-    article = soup.find('div', attrs={'id':'col1'})
-    data = copy.deepcopy(articleModelMap)
-    for k,v in articleModelMap.iteritems():
-        data[k] = v(article)
-    return data
+    res = fetch.get(url)
+    return readPage(res.content, url)
+
+async def aresolve(term):
+    """Awaitable form of resolve(). The search is made through the (blocking)
+       google package, so it runs on the default executor.
+    """
+    return await afetch.run(resolve, term)
+
+async def aquery(url):
+    """Awaitable form of query().
+    """
+    res = await afetch.get(url)
+    return readPage(res.content, url)
 
 def getValue(model, key):
     value = model['specifications'][key]
     try:
-        value = re.sub('\(.+\)', '', value)
-        value = re.sub('[^\d\.e\+\-]', '', value)
+        value = re.sub(r'\(.+\)', '', value)
+        value = re.sub(r'[^\d\.e\+\-]', '', value)
         value = float(value)
-    except:
+    except ValueError:
         pass
     return value
+
+@functools.lru_cache(maxsize=1024)
+def _parseUnit(unit):
+    """Returns the (SI unit, scale) for the given unit text, looked up in
+       unitTable; unknown units are returned as-is with unit scale.
+    """
+    unit = unit.strip().rstrip('.')
+    if unit in unitTable:
+        return unitTable[unit]
+    if unit.lower() in unitTable:
+        return unitTable[unit.lower()]
+    return unit, 1.0
+
+@functools.lru_cache(maxsize=2**14)
+def parseQuantity(text):
+    """Returns the (value, SI unit) of a specification string like '2000 kN'
+       or '4.57 m (15.00 ft)', with the value scaled to SI units, or None if no
+       number can be read from it. Parenthesized alternatives are ignored, and
+       ranges (like '1,500-2,000 kg') are read as their midpoint.
+    """
+    text = re.sub(r'\(.+?\)', '', text).strip()
+    m = quantityPattern.match(text)
+    if m is None:
+        return None
+    value = float(m.group(1).replace(',', ''))
+    if m.group(2) is not None:
+        value = (value + float(m.group(2).replace(',', ''))) / 2
+    unit, scale = _parseUnit(m.group(3) or '')
+    return value * scale, unit
+
+def getValues(models, keys):
+    """Extracts the given specification keys from many models at once,
+       returning (values, units) dictionaries keyed by specification. Each
+       value is a masked NumPy array aligned with the models, in the SI unit
+       given by units (the most common unit found for that key); entries that
+       are missing, unreadable, or in an incompatible unit are masked.
+    """
+    values = OrderedDict()
+    units = OrderedDict()
+    for key in keys:
+        quantities = []
+        for model in models:
+            text = model['specifications'].get(key)
+            quantities.append(parseQuantity(text) if text is not None else None)
+        counts = {}
+        for q in quantities:
+            if q is not None:
+                counts[q[1]] = counts.get(q[1], 0) + 1
+        unit = max(counts, key=counts.get) if len(counts) > 0 else ''
+        data = np.array([q[0] if q is not None and q[1] == unit else np.nan for q in quantities], dtype=np.float64)
+        values[key] = np.ma.masked_invalid(data)
+        units[key] = unit
+    return values, units
+
+def _getLinks(model, netloc):
+    """Returns the associated article links in the given model that point to
+       pages on the given host.
+    """
+    links = []
+    for assocs in model['associations'].values():
+        for assoc in assocs:
+            for link in assoc.values():
+                if urlparse.urlparse(link).netloc == netloc and link not in links:
+                    links.append(link)
+    return links
+
+def _loadVisited(visitedPath):
+    visited = {}
+    if visitedPath is not None and os.path.isfile(visitedPath):
+        with open(visitedPath, 'r') as f:
+            for line in f:
+                if len(line.strip()) > 0:
+                    entry = json.loads(line)
+                    visited[entry['url']] = entry['links']
+    return visited
+
+def crawl(url, depth=1, workers=4, visitedPath=None, outPath=None):
+    """Crawls the association graph breadth-first from the given article,
+       following associated articles on the same host up to depth links away
+       and querying each level's pages on a pool of workers. Yields (url,
+       depth, model, error) tuples as pages are queried; if an output path is
+       given, each model is also appended to it as a JSON line. Visited pages
+       (and their links) are appended to visitedPath, if given, so a restarted
+       crawl skips pages it has already queried while still expanding through
+       them.
+    """
+    netloc = urlparse.urlparse(url).netloc
+    visited = _loadVisited(visitedPath)
+    frontier = [url]
+    seen = set(frontier)
+    out = open(outPath, 'a') if outPath is not None else None
+    visitedFile = open(visitedPath, 'a') if visitedPath is not None else None
+    try:
+        for level in range(depth + 1):
+            nextFrontier = []
+            def _expand(links):
+                if level < depth:
+                    for link in links:
+                        if link not in seen:
+                            seen.add(link)
+                            nextFrontier.append(link)
+            pending = []
+            for u in frontier:
+                if u in visited:
+                    _expand(visited[u])
+                else:
+                    pending.append(u)
+            for u, model, error in fetch.imap(query, pending, workers):
+                if error is None:
+                    links = _getLinks(model, netloc)
+                    visited[u] = links
+                    _expand(links)
+                    if visitedFile is not None:
+                        visitedFile.write(json.dumps({'url': u, 'links': links}) + '\n')
+                        visitedFile.flush()
+                    if out is not None:
+                        out.write(json.dumps({'url': u, 'depth': level, 'model': model}) + '\n')
+                        out.flush()
+                yield u, level, model, error
+            frontier = nextFrontier
+    finally:
+        if out is not None:
+            out.close()
+        if visitedFile is not None:
+            visitedFile.close()
@@ -1,24 +1,63 @@
 """Wraps requests to celestrak.com to facilitate catalog and TLE queries.
 """
 
+import os
 import re
-import bs4
 import csv
+import pickle
 import google
-import requests
+import numpy as np
+from collections import OrderedDict
 from sgp4 import earth_gravity, io
-from scrapese import data
+from scrapese import afetch, data, fetch, markup, metrics
 
 ctUrl = 'http://celestrak.com'
 catUrl = ctUrl + '/pub/satcat.txt'
 tleUrl = ctUrl + '/cgi-bin/TLE.pl?CATNR=%05u'
+gpUrl = ctUrl + '/NORAD/elements/gp.php'
+tleTextUrl = gpUrl + '?CATNR=%u&FORMAT=TLE'
+groupUrl = gpUrl + '?GROUP=%s&FORMAT=TLE'
 catPath = data.get_path('satcat.txt')
 dbPath = data.get_path('satcat.csv')
+idxPath = data.get_path('satcat.idx')
+arrPath = data.get_path('satcat.npz')
+gramSize = 3
+
+satcatWidth = 132
+satcatColumns = [
+    ('OBJECT_NAME', 23, 47),
+    ('OBJECT_ID', 0, 11),
+    ('NORAD_CAT_ID', 13, 18),
+    ('OPS_STATUS_CODE', 21, 22),
+    ('OWNER', 49, 54),
+    ('LAUNCH_DATE', 56, 66),
+    ('LAUNCH_SITE', 68, 73),
+    ('DECAY_DATE', 75, 85),
+    ('PERIOD', 87, 94),
+    ('INCLINATION', 96, 101),
+    ('APOGEE', 103, 109),
+    ('PERIGEE', 111, 117),
+    ('RCS', 119, 127)
+]
+satcatFields = ['OBJECT_NAME', 'OBJECT_ID', 'NORAD_CAT_ID', 'OBJECT_TYPE',
+    'OPS_STATUS_CODE', 'OWNER', 'LAUNCH_DATE', 'LAUNCH_SITE', 'DECAY_DATE',
+    'PERIOD', 'INCLINATION', 'APOGEE', 'PERIGEE', 'RCS', 'DATA_STATUS_CODE',
+    'ORBIT_CENTER', 'ORBIT_TYPE']
+satcatFloatFields = ['PERIOD', 'INCLINATION', 'APOGEE', 'PERIGEE', 'RCS']
+satcatDateFields = ['LAUNCH_DATE', 'DECAY_DATE']
+dataStatusCodes = ['NCE', 'NIE', 'NEA']
+orbitCenterCodes = ['AS', 'EA', 'EL', 'EM', 'JU', 'MA', 'ME', 'MO', 'NE',
+    'PL', 'SA', 'SS', 'SU', 'UR', 'VE']
+orbitTypeCodes = {'0': 'ORB', '1': 'LAN', '2': 'IMP', '3': 'R/T'}
+
+preStrainer = markup.strain('pre')
+
+_indices = {}
 
 def _updateSatCat():
     """Pulls a new copy of the satellite catalog.
     """
-    response = requests.get(catUrl)
+    response = fetch.get(catUrl)
     with open(catPath, 'wb') as f:
         f.write(response.content)
     
@@ -39,98 +78,316 @@ def resolveTle(sscid):
         sscid = int(sscid)
     return tleUrl % sscid
 
+def _getColumn(chars, start, stop):
+    """Returns the given fixed-width column of a (rows, width) character array
+       as a stripped array of byte strings.
+    """
+    col = chars[:, start:stop].copy().view('S%u' % (stop - start)).ravel()
+    return np.char.strip(col)
+
+def _decodeDataStatus(code):
+    return code if code in dataStatusCodes else ''
+
+def _decodeOrbitCenter(code):
+    for center in orbitCenterCodes:
+        if code.startswith(center):
+            return center
+    return 'EA'
+
+def _decodeTable(col, decoder):
+    """Decodes a column of byte strings by applying the given decoder once per
+       unique value and indexing the resulting lookup table.
+    """
+    codes, inverse = np.unique(col, return_inverse=True)
+    table = np.array([decoder(c.decode('ascii', 'ignore')) for c in codes])
+    return table[inverse.ravel()]
+
+def _toString(col):
+    """Converts a column of byte strings to unicode, using a direct (ASCII) cast
+       unless the column holds other characters.
+    """
+    try:
+        return col.astype('U')
+    except UnicodeDecodeError:
+        return np.char.decode(col, 'utf-8')
+
+def _toFloat(col):
+    """Converts a column of byte strings to floats; blank or non-numeric entries
+       (like 'N/A') become NaN.
+    """
+    try:
+        return np.where(col == b'', b'nan', col).astype(np.float64)
+    except ValueError:
+        def decoder(v):
+            try:
+                return float(v)
+            except ValueError:
+                return np.nan
+        codes, inverse = np.unique(col, return_inverse=True)
+        table = np.array([decoder(c) for c in codes])
+        return table[inverse.ravel()]
+
+def _toDate(col):
+    """Converts a column of ISO date byte strings to datetime64[D] values; blank
+       entries become NaT.
+    """
+    col = _toString(col)
+    try:
+        return np.where(col == '', 'NaT', col).astype('datetime64[D]')
+    except ValueError:
+        def decoder(v):
+            try:
+                return np.datetime64(v, 'D')
+            except ValueError:
+                return np.datetime64('NaT', 'D')
+        codes, inverse = np.unique(col, return_inverse=True)
+        table = np.array([decoder(c) for c in codes])
+        return table[inverse.ravel()]
+
+def _readSatcatArray(scPath):
+    """Reads the fixed-width satellite catalog into a (rows, width) array of
+       single characters, padded with nulls.
+    """
+    with open(scPath, 'rb') as f:
+        lines = f.read().splitlines()
+    width = max(satcatWidth, max(len(l) for l in lines) if len(lines) > 0 else 0)
+    rows = np.array(lines, dtype='S%u' % width)
+    return rows.view('S1').reshape(len(lines), width)
+
+def decodeSatcat(scPath=catPath):
+    """Decodes the columns of a satcat.txt file in bulk, returning an ordered
+       dictionary of byte-string arrays keyed by the satcat.csv schema.
+    """
+    chars = _readSatcatArray(scPath)
+    columns = OrderedDict()
+    for field, start, stop in satcatColumns:
+        columns[field] = _getColumn(chars, start, stop)
+    names = columns['OBJECT_NAME']
+    code = _getColumn(chars, 129, 132)
+    columns['OBJECT_TYPE'] = np.select([
+        chars[:, 20] == b'*',
+        np.char.endswith(names, b'R/B'),
+        np.char.endswith(names, b'DEB')
+    ], [b'PAY', b'R/B', b'DEB'], b'UNK')
+    columns['DATA_STATUS_CODE'] = _decodeTable(code, _decodeDataStatus).astype('S3')
+    columns['ORBIT_CENTER'] = _decodeTable(code, _decodeOrbitCenter).astype('S2')
+    lut = np.array([b''] * 256, dtype='S3')
+    for k, v in orbitTypeCodes.items():
+        lut[ord(k)] = v
+    orbType = lut[chars[:, 131].view(np.uint8)]
+    columns['ORBIT_TYPE'] = np.where(orbType != b'', orbType,
+        np.where(code == b'DOC', b'DOC',
+        np.where(chars[:, 21] == b'D', b'IMP', b'ORB')))
+    return OrderedDict((k, columns[k]) for k in satcatFields)
+
 def convertSatcat(scPath=catPath):
     """Parses a satcat.txt file into a satcat.csv file, written to the same
-       location, using a known schema. By default, this will be dbPath.
+       location, using a known schema. By default, this will be dbPath. A typed
+       columnar copy (numeric columns as floats, dates as datetime64) is also
+       written alongside as satcat.npz; see loadSatcat().
     """
-    with open(scPath, 'r') as f:
-        lines = f.readlines()
-    entries = []
-    for line in lines:
-        objType = \
-            "PAY" if line[20] == "*" else \
-            "R/B" if line[23:47].strip().endswith("R/B") else \
-            "DEB" if line[23:47].strip().endswith("DEB") else "UNK"
-        dataStatus = \
-            "NCE" if line[129:132].strip() == "NCE" else \
-            "NIE" if line[129:132].strip() == "NIE" else \
-            "NEA" if line[129:132].strip() == "NEA" else ""
-        orbCenter = \
-            "AS" if line[129:132].strip().startswith("AS") else \
-            "EA" if line[129:132].strip().startswith("EA") else \
-            "EL" if line[129:132].strip().startswith("EL") else \
-            "EM" if line[129:132].strip().startswith("EM") else \
-            "JU" if line[129:132].strip().startswith("JU") else \
-            "MA" if line[129:132].strip().startswith("MA") else \
-            "ME" if line[129:132].strip().startswith("ME") else \
-            "MO" if line[129:132].strip().startswith("MO") else \
-            "NE" if line[129:132].strip().startswith("NE") else \
-            "PL" if line[129:132].strip().startswith("PL") else \
-            "SA" if line[129:132].strip().startswith("SA") else \
-            "SS" if line[129:132].strip().startswith("SS") else \
-            "SU" if line[129:132].strip().startswith("SU") else \
-            "UR" if line[129:132].strip().startswith("UR") else \
-            "VE" if line[129:132].strip().startswith("VE") else "EA"
-        orbType = \
-            "ORB" if line[131] == "0" else \
-            "LAN" if line[131] == "1" else \
-            "IMP" if line[131] == "2" else \
-            "R/T" if line[131] == "3" else \
-            "DOC" if line[129:132].strip() == "DOC" else \
-            "IMP" if line[21] == "D" else "ORB" 
-        entries.append({
-            "OBJECT_NAME": line[23:47].strip(),
-            "OBJECT_ID": line[0:11].strip(),
-            "NORAD_CAT_ID": line[13:18].strip(),
-            "OBJECT_TYPE": objType,
-            "OPS_STATUS_CODE": line[21].strip(),
-            "OWNER": line[49:54].strip(),
-            "LAUNCH_DATE": line[56:66].strip(),
-            "LAUNCH_SITE": line[68:73].strip(),
-            "DECAY_DATE": line[75:85].strip(),
-            "PERIOD": line[87:94].strip(),
-            "INCLINATION": line[96:101].strip(),
-            "APOGEE": line[103:109].strip(),
-            "PERIGEE": line[111:117].strip(),
-            "RCS": line[119:127].strip(),
-            "DATA_STATUS_CODE": dataStatus,
-            "ORBIT_CENTER": orbCenter,
-            "ORBIT_TYPE": orbType
-        })
+    columns = decodeSatcat(scPath)
+    strings = [_toString(columns[k]) for k in satcatFields]
     csvPath = re.sub(r"\.txt", ".csv", scPath)
     with open(csvPath, 'w') as f:
-        dw = csv.DictWriter(f, fieldnames=entries[0].keys(), lineterminator="\n")
-        dw.writeheader()
-        dw.writerows(entries)
+        cw = csv.writer(f, lineterminator="\n")
+        cw.writerow(satcatFields)
+        cw.writerows(zip(*[s.tolist() for s in strings]))
+    typed = {}
+    for k, s in zip(satcatFields, strings):
+        if k in satcatFloatFields:
+            typed[k] = _toFloat(columns[k])
+        elif k in satcatDateFields:
+            typed[k] = _toDate(columns[k])
+        else:
+            typed[k] = s
+    typed['NORAD_CAT_ID'] = np.where(columns['NORAD_CAT_ID'] == b'', b'-1', columns['NORAD_CAT_ID']).astype(np.int64)
+    np.savez(re.sub(r"\.txt", ".npz", scPath), **typed)
 
-def resolve(term):
-    """Uses the satellite catalog page (preferably cached) to return a URL to
-       the TLE resource for the given satellite, which can be resolved by name,
-       international designator, or NORAD catalog number. Until caching is
-       implemented, we use a locally-stored version.
-    """
-    with open(catPath, 'r') as f:
-        txt = f.read()
-    lines = txt.splitlines()
-    sscid = ''
-    for line in lines:
-        if len(sscid) is 0:
+def loadSatcat(npzPath=arrPath):
+    """Returns the typed columnar satellite catalog written by convertSatcat()
+       as a dictionary of NumPy arrays keyed by the satcat.csv schema.
+    """
+    with np.load(npzPath) as npz:
+        return dict((k, npz[k]) for k in npz.files)
+
+def _getGrams(text):
+    """Returns the set of n-grams (of length gramSize) in the given text.
+    """
+    return set(text[i:i+gramSize] for i in range(len(text) - gramSize + 1))
+
+def _getSignature(scPath):
+    st = os.stat(scPath)
+    return st.st_size, st.st_mtime
+
+def _buildIndex(scPath=catPath):
+    """Reads the satellite catalog once into lookup tables: catalog numbers and
+       lower-cased names by row, hash maps from international designator and
+       NORAD catalog number to rows, and an n-gram index over object names.
+    """
+    index = {
+        'signature': _getSignature(scPath),
+        'catNums': [],
+        'names': [],
+        'ids': {},
+        'sscids': {},
+        'grams': {}
+    }
+    with open(scPath, 'r') as f:
+        for row, line in enumerate(f):
             name, id, catNum = _readSatCatLine(line)
-            if term.lower() in name.lower():
-                sscid = catNum
-            elif term.lower() == id.lower():
-                sscid = catNum
-            elif term.lower() == catNum.lower():
-                sscid = catNum
-    if len(sscid) is 0:
+            name = name.lower()
+            index['catNums'].append(catNum)
+            index['names'].append(name)
+            index['ids'].setdefault(id.lower(), []).append(row)
+            index['sscids'].setdefault(catNum.lower(), []).append(row)
+            for gram in _getGrams(name):
+                index['grams'].setdefault(gram, []).append(row)
+    return index
+
+def _getIndex(scPath=None, ixPath=None):
+    """Returns the lookup index for the given catalog (catPath by default),
+       loading the persisted copy when it matches the catalog file and
+       rebuilding it (and writing it back) when the catalog has changed.
+    """
+    if scPath is None:
+        scPath = catPath
+    if ixPath is None:
+        ixPath = idxPath
+    signature = _getSignature(scPath)
+    index = _indices.get(scPath)
+    if index is not None and index['signature'] == signature:
+        return index
+    index = None
+    if os.path.isfile(ixPath):
+        with open(ixPath, 'rb') as f:
+            index = pickle.load(f)
+        if index.get('path') != scPath or index['signature'] != signature:
+            index = None
+    if index is None:
+        index = _buildIndex(scPath)
+        index['path'] = scPath
+        with open(ixPath, 'wb') as f:
+            pickle.dump(index, f, pickle.HIGHEST_PROTOCOL)
+    _indices[scPath] = index
+    return index
+
+def _findRows(index, term):
+    """Returns the (sorted) catalog rows matching the given term by name
+       substring, international designator, or NORAD catalog number.
+    """
+    term = term.lower()
+    rows = set(index['ids'].get(term, []))
+    rows.update(index['sscids'].get(term, []))
+    names = index['names']
+    if len(term) < gramSize:
+        rows.update(row for row, name in enumerate(names) if term in name)
+    else:
+        postings = sorted((index['grams'].get(g, []) for g in _getGrams(term)), key=len)
+        candidates = set(postings[0])
+        for p in postings[1:]:
+            candidates.intersection_update(p)
+        rows.update(row for row in candidates if term in names[row])
+    return sorted(rows)
+
+def resolveAll(term):
+    """Returns TLE resource URLs for every satellite in the catalog matching
+       the given term, in catalog order. Terms are matched against object name
+       (substring), international designator, or NORAD catalog number using an
+       index built from (and persisted alongside) the locally-stored catalog.
+    """
+    index = _getIndex()
+    return [resolveTle(index['catNums'][row]) for row in _findRows(index, term)]
+
+def resolve(term):
+    """Returns a URL to the TLE resource for the first satellite in the catalog
+       matching the given term by name, international designator, or NORAD
+       catalog number (see resolveAll()). An exception is raised when nothing
+       in the catalog matches.
+    """
+    urls = resolveAll(term)
+    if len(urls) == 0:
         raise Exception('Unable to resolve resource for term "%s"' % term)
-    return resolveTle(sscid)
+    return urls[0]
     
+def _readTle(content):
+    bs = markup.getSoup(content, preStrainer)
+    with metrics.timer('extract'):
+        pre = bs.find('pre')
+        return pre.string.strip().splitlines()
+
 def query(url):
     """Returns the TLE stored at the given URL. Will technically contain three
        lines, not two, as the first line is the full name of the object.
     """
-    response = requests.get(url)
-    bs = bs4.BeautifulSoup(response.content, 'html.parser')
-    pre = bs.find('pre')
-    return pre.string.strip().splitlines()
+    response = fetch.get(url)
+    return _readTle(response.content)
+
+async def aresolve(term):
+    """Awaitable form of resolve(). Terms are resolved from the local catalog
+       index, so the lookup runs on the default executor.
+    """
+    return await afetch.run(resolve, term)
+
+async def aquery(url):
+    """Awaitable form of query().
+    """
+    response = await afetch.get(url)
+    return _readTle(response.content)
+
+def _parseTles(lines):
+    """Groups an iterable of plain-text TLE lines into three-line entries (the
+       name line followed by the two element lines), yielding each as soon as
+       its second element line has been read.
+    """
+    name = ''
+    line1 = None
+    for line in lines:
+        if isinstance(line, bytes):
+            line = line.decode('ascii', 'ignore')
+        line = line.rstrip()
+        if line.startswith('1 ') and len(line) >= 69:
+            line1 = line
+        elif line.startswith('2 ') and len(line) >= 69 and line1 is not None:
+            yield [name, line1, line]
+            name = ''
+            line1 = None
+        elif len(line) > 0:
+            name = line.strip()
+            line1 = None
+
+def queryText(url):
+    """Returns the TLEs served as plain text from the given URL (like those
+       from tleTextUrl or groupUrl) as a list of three-line entries.
+    """
+    response = fetch.get(url)
+    response.raise_for_status()
+    with metrics.timer('extract'):
+        return list(_parseTles(response.text.splitlines()))
+
+def queryMany(sscids, workers=8, ordered=False):
+    """Fetches the TLEs for many SSCIDs concurrently, with at most workers
+       requests in flight, from CelesTrak's plain-text endpoint. Yields
+       (sscid, tle, error) tuples as responses arrive (or, if ordered, in the
+       order of sscids); tle has the same three-line form returned by query(),
+       and error is the exception raised for that SSCID (if any).
+    """
+    def _queryOne(sscid):
+        tles = queryText(tleTextUrl % int(sscid))
+        if len(tles) == 0:
+            raise Exception('No TLE returned for SSCID %s' % sscid)
+        return tles[0]
+    return fetch.imap(_queryOne, sscids, workers, ordered=ordered)
+
+def queryGroup(group):
+    """Yields the TLEs for every object in the given CelesTrak group (like
+       'stations', 'starlink', or 'active'), parsed from the plain-text bulk
+       endpoint as the response body streams in.
+    """
+    response = fetch.get(groupUrl % group, stream=True)
+    response.raise_for_status()
+    try:
+        for tle in _parseTles(response.iter_lines()):
+            yield tle
+    finally:
+        response.close()
@@ -0,0 +1,122 @@
+"""Close-approach screening over TLE catalogs propagated with the propagate
+   module. At each time step, satellite positions are binned into a uniform
+   spatial grid (cells no smaller than the screening threshold), so only points
+   in the same or adjacent cells are compared rather than every pair. Pairs can
+   also be pre-filtered by their apogee/perigee shells, as extracted into the
+   satellite catalog by celestrak.convertSatcat().
+"""
+
+import numpy as np
+from sgp4.api import SatrecArray
+from scrapese import propagate
+
+stepsPerBlock = 64 # time steps propagated per SatrecArray call
+cellBits = 21 # bits per axis used to pack grid cell coordinates into one key
+
+_offsets = np.array([(dx, dy, dz)
+    for dx in (-1, 0, 1) for dy in (-1, 0, 1) for dz in (-1, 0, 1)
+    if (dx, dy, dz) > (0, 0, 0)], dtype=np.int64)
+
+def _expand(lo, hi):
+    """For per-point ranges [lo, hi) of sorted positions, returns the (a, b)
+       arrays listing every (point, position) combination.
+    """
+    counts = hi - lo
+    total = counts.sum()
+    a = np.repeat(np.arange(len(lo)), counts)
+    b = np.arange(total) - np.repeat(np.cumsum(counts) - counts, counts) + np.repeat(lo, counts)
+    return a, b
+
+def findPairs(r, threshold, apsides=None, pad=0.0):
+    """Returns (i, j, d) arrays of the index pairs (i < j) of rows in the (n, 3)
+       position array that are closer than threshold, along with their
+       distances. Rows with non-finite positions are ignored. If (perigee,
+       apogee) apsides are given, candidate pairs are passed through
+       filterApsides() before any distances are computed.
+    """
+    valid = np.nonzero(np.all(np.isfinite(r), axis=1))[0]
+    if len(valid) < 2:
+        empty = np.zeros(0, dtype=np.int64)
+        return empty, empty, np.zeros(0)
+    p = r[valid]
+    lower = p.min(axis=0)
+    span = (p.max(axis=0) - lower).max()
+    size = max(threshold, span / (2**cellBits - 3))
+    cells = np.floor((p - lower) / size).astype(np.int64) + 1
+    shifts = np.array([2 * cellBits, cellBits, 0], dtype=np.int64)
+    keys = (cells << shifts).sum(axis=1)
+    order = np.argsort(keys, kind='stable')
+    sortedKeys = keys[order]
+    n = len(sortedKeys)
+    a, b = [], []
+    start = np.searchsorted(sortedKeys, sortedKeys, 'left')
+    ai, bi = _expand(start, np.arange(n))
+    a.append(ai)
+    b.append(bi)
+    for offset in _offsets:
+        neighbor = sortedKeys + (offset << shifts).sum()
+        lo = np.searchsorted(sortedKeys, neighbor, 'left')
+        hi = np.searchsorted(sortedKeys, neighbor, 'right')
+        ai, bi = _expand(lo, hi)
+        a.append(ai)
+        b.append(bi)
+    a = order[np.concatenate(a)]
+    b = order[np.concatenate(b)]
+    if apsides is not None:
+        keep = filterApsides(valid[a], valid[b], apsides[0], apsides[1], pad)
+        a, b = a[keep], b[keep]
+    d = np.linalg.norm(p[a] - p[b], axis=1)
+    close = d < threshold
+    i = valid[a[close]]
+    j = valid[b[close]]
+    swap = i > j
+    i[swap], j[swap] = j[swap], i[swap]
+    return i, j, d[close]
+
+def getApsides(sscids, catalog=None):
+    """Returns (perigee, apogee) altitude arrays (km) aligned with the given
+       SSCIDs, looked up in the typed satellite catalog (see
+       celestrak.loadSatcat()). Objects missing from the catalog get NaN, which
+       disables the apsis filter for any pair involving them.
+    """
+    if catalog is None:
+        from scrapese import celestrak
+        catalog = celestrak.loadSatcat()
+    ids = catalog['NORAD_CAT_ID']
+    order = np.argsort(ids)
+    sscids = np.asarray(sscids, dtype=np.int64)
+    ndx = np.clip(np.searchsorted(ids, sscids, sorter=order), 0, len(ids) - 1)
+    found = ids[order[ndx]] == sscids
+    perigee = np.where(found, catalog['PERIGEE'][order[ndx]], np.nan)
+    apogee = np.where(found, catalog['APOGEE'][order[ndx]], np.nan)
+    return perigee, apogee
+
+def filterApsides(i, j, perigee, apogee, pad=0.0):
+    """Returns a boolean mask over the (i, j) pairs keeping those whose
+       perigee-apogee shells come within pad (km) of overlapping. Pairs
+       involving objects with unknown apsides are kept.
+    """
+    overlap = (perigee[i] - pad <= apogee[j]) & (perigee[j] - pad <= apogee[i])
+    unknown = np.isnan(perigee[i] + apogee[i] + perigee[j] + apogee[j])
+    return overlap | unknown
+
+def screen(tles, jd, fr, threshold, apsides=None, pad=None):
+    """Screens the given TLE entries for close approaches over the (jd, fr)
+       time grid, yielding (k, i, j, d) for each time step k with at least one
+       pair (i < j, indexing tles) closer than threshold (km), where d holds
+       their distances. If (perigee, apogee) apsides are given (see
+       getApsides()), pairs whose altitude shells do not come within pad (km,
+       defaulting to the threshold) of each other are discarded up front.
+    """
+    satrecs = SatrecArray(propagate.getSatrecs(tles))
+    jd = np.atleast_1d(np.asarray(jd, dtype=np.float64))
+    fr = np.atleast_1d(np.asarray(fr, dtype=np.float64))
+    if pad is None:
+        pad = threshold
+    for start in range(0, len(jd), stepsPerBlock):
+        stop = start + stepsPerBlock
+        _, r, _ = satrecs.sgp4(jd[start:stop], fr[start:stop])
+        for k in range(r.shape[1]):
+            i, j, d = findPairs(r[:, k], threshold, apsides, pad)
+            if len(i) > 0:
+                yield start + k, i, j, d
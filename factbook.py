@@ -2,36 +2,113 @@
 """
 
 import os
-import bs4
-import requests
+import time
+import hashlib
+from email import utils
+from scrapese import fetch, markup
 
 FACTBOOK_URL = "https://www.cia.gov/library/publications/the-world-factbook"
+CHUNK_SIZE = 64 * 1024
+FLAG_STRAINER = markup.strain("div", class_=markup.hasClass("flag-image"))
 
-def getFlags(destPath=None):
-    """Scraps country flags from the factbook into the specified icon folder.
+def _getChecksum(path):
+    """Returns the SHA-1 hex digest of the file at the given path.
+    """
+    sha = hashlib.sha1()
+    with open(path, "rb") as f:
+        for chunk in iter(lambda: f.read(CHUNK_SIZE), b""):
+            sha.update(chunk)
+    return sha.hexdigest()
+
+def _isCurrent(res, flagDest):
+    """Determines, from the headers of a (streaming) response, whether the
+       local copy at the given path already matches it.
+    """
+    if not os.path.isfile(flagDest):
+        return False
+    length = res.headers.get("Content-Length")
+    modified = res.headers.get("Last-Modified")
+    if length is None or modified is None or int(length) != os.path.getsize(flagDest):
+        return False
+    return utils.mktime_tz(utils.parsedate_tz(modified)) <= os.path.getmtime(flagDest)
+
+def _getFlag(flag):
+    """Downloads a single flag image (described by a manifest entry) to its
+       destination path, streaming the body to disk in chunks. Local copies are
+       revalidated with a conditional request and left in place when unchanged.
+    """
+    headers = {}
+    if os.path.isfile(flag["path"]):
+        headers["If-Modified-Since"] = utils.formatdate(os.path.getmtime(flag["path"]), usegmt=True)
+    res = fetch.get(flag["url"], headers=headers, stream=True)
+    try:
+        if res.status_code == 304 or (res.status_code == 200 and _isCurrent(res, flag["path"])):
+            flag["status"] = "unchanged"
+        else:
+            res.raise_for_status()
+            sha = hashlib.sha1()
+            tmpPath = flag["path"] + ".part"
+            try:
+                with open(tmpPath, "wb") as f:
+                    for chunk in res.iter_content(CHUNK_SIZE):
+                        sha.update(chunk)
+                        f.write(chunk)
+            except BaseException:
+                # Leave no partial download behind
+                if os.path.isfile(tmpPath):
+                    os.remove(tmpPath)
+                raise
+            if os.path.isfile(flag["path"]) and _getChecksum(flag["path"]) == sha.hexdigest():
+                os.remove(tmpPath)
+                flag["status"] = "unchanged"
+            else:
+                os.replace(tmpPath, flag["path"])
+                flag["status"] = "downloaded"
+            modified = res.headers.get("Last-Modified")
+            if modified is not None:
+                mtime = utils.mktime_tz(utils.parsedate_tz(modified))
+                os.utime(flag["path"], (time.time(), mtime))
+    finally:
+        res.close()
+    flag["bytes"] = os.path.getsize(flag["path"])
+    return flag
+
+def getFlags(destPath=None, workers=8):
+    """Scraps country flags from the factbook into the specified icon folder,
+       downloading up to workers images at once. Flags already present and
+       unchanged are skipped. Returns a manifest listing, for each flag, its
+       name, url, path, status ("downloaded", "unchanged", or "failed"), size
+       in bytes, and any error message.
     """
     if destPath is None:
         modPath, _ = os.path.split(os.path.abspath(__file__))
         destPath = modPath + "/flags"
-        print("Defaulting flag destination to '%s'..." % destPath)
     if not os.path.isdir(destPath):
         os.mkdir(destPath)
     pathUrl = FACTBOOK_URL + "/docs"
-    res = requests.get(pathUrl + "/flagsoftheworld.html")
-    soup = bs4.BeautifulSoup(res.content, "html.parser")
+    res = fetch.get(pathUrl + "/flagsoftheworld.html")
+    soup = markup.getSoup(res.content, FLAG_STRAINER)
     flagDivs = soup.find_all("div", {"class": "flag-image"})
-    print("Scraping %u nation flags..." % len(flagDivs))
-    for ndx, flagDiv in enumerate(flagDivs):
+    manifest = []
+    for flagDiv in flagDivs:
         img = flagDiv.find("img")
         src = img.get_attribute_list("src")[0]
-        res = requests.get(pathUrl + "/" + src)
         _, fileName = os.path.split(src)
         name, ext = os.path.splitext(fileName)
         parts = name.split("-")
-        flagDest = destPath + "/%s%s" % (parts[0], ext)
-        with open(flagDest, "wb") as f:
-            f.write(res.content)
-        print("%u. Scraped and saved flag for %s" % (ndx, parts[0]))
+        manifest.append({
+            "name": parts[0],
+            "url": pathUrl + "/" + src,
+            "path": destPath + "/%s%s" % (parts[0], ext),
+            "status": None,
+            "bytes": 0,
+            "error": None
+        })
+    for flag, _, error in fetch.imap(_getFlag, manifest, workers):
+        if error is not None:
+            flag["status"] = "failed"
+            flag["error"] = str(error)
+    return manifest
 
 if __name__ == "__main__":
     getFlags()
@@ -0,0 +1,198 @@
+"""Shared HTTP fetch layer used by every scraper module. Requests are routed
+   through one pooled requests.Session per host, so repeated scrapes against
+   the same site reuse keep-alive connections instead of paying a new TCP/TLS
+   handshake for every page.
+"""
+
+import time
+import atexit
+import threading
+from concurrent import futures
+import requests
+from requests.adapters import HTTPAdapter
+from scrapese import httpcache, metrics, scheduler
+
+try:
+    from urllib.parse import urlparse
+except ImportError:
+    from urlparse import urlparse
+
+poolConnections = 4 # number of distinct connection pools cached per session
+poolMaxSize = 16 # maximum number of keep-alive connections kept per pool
+maxRetries = 0 # passed to the urllib3 adapter for connection-level retries
+timeout = (10, 60) # (connect, read) seconds; applied when none is given
+headers = {
+    'Accept-Encoding': 'gzip, deflate',
+    'Connection': 'keep-alive'
+}
+
+responseCache = None # httpcache.ResponseCache, once enabled
+hostOverrides = {} # host => base URL that requests for the host are sent to instead
+
+_sessions = {}
+_lock = threading.Lock()
+
+def _getHost(url):
+    """Returns the (scheme, netloc) pair used to key the session pool.
+    """
+    pr = urlparse(url)
+    return pr.scheme.lower(), pr.netloc.lower()
+
+def _newSession():
+    """Builds a new session with adapters sized from the module settings.
+    """
+    session = requests.Session()
+    session.headers.update(headers)
+    adapter = HTTPAdapter(pool_connections=poolConnections, pool_maxsize=poolMaxSize, max_retries=maxRetries)
+    session.mount('http://', adapter)
+    session.mount('https://', adapter)
+    return session
+
+def _getOverride(url):
+    """Rewrites the given URL when its host has an entry in hostOverrides (a
+       mirror, or a local stand-in server), keeping the host as the first path
+       segment under the override's base URL.
+    """
+    if len(hostOverrides) == 0:
+        return url
+    pr = urlparse(url)
+    base = hostOverrides.get(pr.netloc.lower())
+    if base is None:
+        return url
+    return base + pr.netloc.lower() + '/' + url.split(pr.netloc, 1)[1].lstrip('/')
+
+def getSession(url):
+    """Returns the pooled session for the host of the given URL, creating it on
+       first use. Sessions are shared across threads; the underlying urllib3
+       pools are thread-safe.
+    """
+    key = _getHost(url)
+    session = _sessions.get(key)
+    if session is None:
+        with _lock:
+            session = _sessions.get(key)
+            if session is None:
+                session = _newSession()
+                _sessions[key] = session
+    return session
+
+class _ScheduledSession(object):
+    """Wraps a pooled session so its requests pass through the scheduler for
+       the given host. The response cache is handed this wrapper, so requests
+       it answers from disk are never held back.
+    """
+
+    def __init__(self, session, host):
+        self.session = session
+        self.host = host
+
+    def get(self, url, **kwargs):
+        return scheduler.request(self.host, lambda: self.session.get(url, **kwargs))
+
+def reset():
+    """Closes and discards all pooled sessions. Pool settings changed after a
+       session was created only take effect once the pool is reset.
+    """
+    with _lock:
+        for session in _sessions.values():
+            session.close()
+        _sessions.clear()
+
+def enableCache(path=None, maxBytes=None, ttls=None, defaultTtl=None):
+    """Routes subsequent (non-streaming) requests through a persistent on-disk
+       response cache; see httpcache.ResponseCache for the arguments. Returns
+       the cache instance.
+    """
+    global responseCache
+    responseCache = httpcache.ResponseCache(path, maxBytes, ttls, defaultTtl)
+    return responseCache
+
+def disableCache():
+    """Stops routing requests through the response cache.
+    """
+    global responseCache
+    if responseCache is not None:
+        responseCache.flush()
+    responseCache = None
+
+@atexit.register
+def _flushCache():
+    if responseCache is not None:
+        responseCache.flush()
+
+def _getBytes(res):
+    if res._content_consumed:
+        return len(res.content)
+    return int(res.headers.get('Content-Length', 0))
+
+def _getCacheOutcome(res):
+    if getattr(res, 'revalidated', False):
+        return 'revalidated'
+    return 'hit' if getattr(res, 'fromCache', False) else 'miss'
+
+def get(url, **kwargs):
+    """Issues a GET request for the given URL through the pooled session for
+       its host. Keyword arguments are passed on to requests; a default timeout
+       is applied when none is given, and hosts listed in hostOverrides are
+       redirected. When the response cache is enabled, non-streaming requests
+       are served or revalidated through it. Requests that reach the network
+       are held to the per-host limits of the scheduler module, which also
+       retries throttled (429/503) responses. Each call is recorded as a
+       metrics fetch event for the calling module and host.
+    """
+    kwargs.setdefault('timeout', timeout)
+    host = _getHost(url)[1]
+    metrics.setHost(host)
+    url = _getOverride(url)
+    session = _ScheduledSession(getSession(url), host)
+    isCached = responseCache is not None and not kwargs.get('stream', False)
+    start = time.perf_counter()
+    try:
+        if isCached:
+            res = responseCache.get(session, url, **kwargs)
+        else:
+            res = session.get(url, **kwargs)
+    except Exception as e:
+        metrics.record('fetch', time.perf_counter() - start, host=host, error=e)
+        raise
+    metrics.record('fetch', time.perf_counter() - start, host=host, bytes=_getBytes(res), cache=_getCacheOutcome(res) if isCached else None)
+    return res
+
+def imap(func, items, workers=8, window=None, ordered=False):
+    """Applies func to each of the given items on a pool of worker threads,
+       yielding (item, result, error) tuples as calls complete (error is None
+       on success; otherwise result is None). At most window calls (default
+       twice the worker count) are in flight at once, so items may be a lazy
+       iterable of any length. If ordered, tuples are yielded in the order of
+       the items instead, each as soon as it and those before it complete
+       (calls waiting to be yielded count against the window).
+    """
+    if window is None:
+        window = 2 * workers
+    items = iter(items)
+    pending = {}
+    done = {}
+    count = 0
+    head = 0
+    with futures.ThreadPoolExecutor(max_workers=workers) as pool:
+        while True:
+            if len(pending) + len(done) < window:
+                for item in items:
+                    pending[pool.submit(func, item)] = count, item
+                    count += 1
+                    if len(pending) + len(done) >= window:
+                        break
+            if len(pending) == 0:
+                return
+            finished, _ = futures.wait(pending, return_when=futures.FIRST_COMPLETED)
+            for f in finished:
+                n, item = pending.pop(f)
+                error = f.exception()
+                result = item, None if error is not None else f.result(), error
+                if ordered:
+                    done[n] = result
+                else:
+                    yield result
+            while head in done:
+                yield done.pop(head)
+                head += 1
@@ -0,0 +1,277 @@
+"""Persistent on-disk HTTP response cache used by the fetch layer. Bodies are
+   stored zlib-compressed under the hash of their content, so identical pages
+   served from several URLs share one blob; a JSON index maps each URL to its
+   blob along with the validators (ETag/Last-Modified) needed to revalidate it.
+   Stale entries are revalidated with conditional requests, and the total blob
+   size is held under a cap by evicting least-recently-used entries.
+"""
+
+import os
+import json
+import time
+import zlib
+import hashlib
+import threading
+import requests
+from requests.structures import CaseInsensitiveDict
+from scrapese import data
+
+try:
+    from urllib.parse import urlparse
+except ImportError:
+    from urlparse import urlparse
+
+cachePath = data.get_path('httpcache')
+maxBytes = 256 * 2**20 # size cap for stored (compressed) bodies
+defaultTtl = 0 # seconds a stored response is served without revalidation
+hostTtls = {
+    'celestrak.com': 2 * 3600,
+    'en.wikipedia.org': 24 * 3600,
+    'www.astronautix.com': 7 * 24 * 3600,
+    'simbad.u-strasbg.fr': 7 * 24 * 3600
+}
+storedHeaders = ['Content-Type', 'ETag', 'Last-Modified']
+flushEvery = 100 # index changes between writes of the index (also written at exit)
+evictTarget = 0.9 # fraction of the size cap that eviction brings the total down to
+
+def _hash(value):
+    return hashlib.sha1(value).hexdigest()
+
+def getKey(url, params=None):
+    """Returns the full URL (including any query parameters) under which a
+       response is cached.
+    """
+    pr = requests.models.PreparedRequest()
+    pr.prepare_url(url, params)
+    return pr.url
+
+class ResponseCache(object):
+    """On-disk response store rooted at the given path. Instances are safe to
+       share between fetch threads.
+    """
+
+    def __init__(self, path=None, maxBytes=None, ttls=None, defaultTtl=None):
+        self.path = cachePath if path is None else path
+        self.maxBytes = globals()['maxBytes'] if maxBytes is None else maxBytes
+        self.ttls = dict(hostTtls) if ttls is None else ttls
+        self.defaultTtl = globals()['defaultTtl'] if defaultTtl is None else defaultTtl
+        self.indexPath = os.path.join(self.path, 'index.json')
+        self.lock = threading.RLock()
+        self.isDirty = False
+        if not os.path.isdir(self.path):
+            os.makedirs(self.path)
+        self.changes = 0
+        self.index = {}
+        if os.path.isfile(self.indexPath):
+            with open(self.indexPath, 'r') as f:
+                self.index = json.load(f)
+        self.refs = {}
+        self.size = 0
+        for meta in self.index.values():
+            self._addRef(meta)
+
+    def _addRef(self, meta):
+        count = self.refs.get(meta['digest'], 0)
+        if count == 0:
+            self.size += meta['size']
+        self.refs[meta['digest']] = count + 1
+
+    def _dropRef(self, meta):
+        """Releases an index entry's reference to its blob, removing the blob
+           once nothing refers to it.
+        """
+        count = self.refs[meta['digest']] - 1
+        if count > 0:
+            self.refs[meta['digest']] = count
+            return
+        del self.refs[meta['digest']]
+        self.size -= meta['size']
+        blobPath = self._getBlobPath(meta['digest'])
+        if os.path.isfile(blobPath):
+            os.remove(blobPath)
+
+    def _changed(self):
+        """Marks the index as changed, writing it once flushEvery changes have
+           accumulated.
+        """
+        self.isDirty = True
+        self.changes += 1
+        if self.changes >= flushEvery:
+            self.flush()
+
+    def getTtl(self, url):
+        """Returns the freshness lifetime (seconds) for the host of the given
+           URL; host entries also match their subdomains.
+        """
+        host = (urlparse(url).hostname or '').lower()
+        for h, ttl in self.ttls.items():
+            if host == h or host.endswith('.' + h):
+                return ttl
+        return self.defaultTtl
+
+    def getSize(self):
+        """Returns the total size (bytes) of all stored blobs.
+        """
+        return self.size
+
+    def _getBlobPath(self, digest):
+        return os.path.join(self.path, digest[0:2], digest + '.z')
+
+    def _readBody(self, meta):
+        with open(self._getBlobPath(meta['digest']), 'rb') as f:
+            return zlib.decompress(f.read())
+
+    def _writeBody(self, body):
+        digest = _hash(body)
+        blobPath = self._getBlobPath(digest)
+        if not os.path.isfile(blobPath):
+            blobDir = os.path.dirname(blobPath)
+            if not os.path.isdir(blobDir):
+                os.makedirs(blobDir)
+            tmpPath = blobPath + '.%u.tmp' % threading.current_thread().ident
+            with open(tmpPath, 'wb') as f:
+                f.write(zlib.compress(body))
+            os.replace(tmpPath, blobPath)
+        return digest, os.path.getsize(blobPath)
+
+    def _build(self, url, meta):
+        """Constructs a requests.Response from a stored entry, or returns None
+           (dropping the entry) if its blob has gone missing, as when another
+           thread evicts it between the lookup and the read.
+        """
+        try:
+            content = self._readBody(meta)
+        except FileNotFoundError:
+            self.remove(url, meta)
+            return None
+        res = requests.Response()
+        res.status_code = 200
+        res.url = url
+        res.headers = CaseInsensitiveDict(meta['headers'])
+        res.encoding = meta.get('encoding')
+        res._content = content
+        res.fromCache = True
+        return res
+
+    def lookup(self, key):
+        """Returns the stored metadata for the given key (or None), marking the
+           entry as recently used.
+        """
+        with self.lock:
+            meta = self.index.get(key)
+            if meta is not None:
+                meta['accessed'] = time.time()
+                self.isDirty = True
+            return meta
+
+    def store(self, key, res):
+        """Stores the body and validators of a successful response.
+        """
+        digest, size = self._writeBody(res.content)
+        now = time.time()
+        meta = {
+            'digest': digest,
+            'size': size,
+            'stored': now,
+            'accessed': now,
+            'encoding': res.encoding,
+            'headers': dict((h, res.headers[h]) for h in storedHeaders if h in res.headers)
+        }
+        with self.lock:
+            self._addRef(meta)
+            old = self.index.get(key)
+            self.index[key] = meta
+            if old is not None:
+                self._dropRef(old)
+            if self.size > self.maxBytes:
+                self.evict()
+            self._changed()
+
+    def evict(self):
+        """Drops least-recently-used entries (and any blobs no longer
+           referenced) until the stored size is under the cap; once over it,
+           entries are dropped down to evictTarget of the cap, so eviction runs
+           once per batch of stores rather than on every store.
+        """
+        with self.lock:
+            if self.size <= self.maxBytes:
+                return
+            target = evictTarget * self.maxBytes
+            for key in sorted(self.index, key=lambda k: self.index[k]['accessed']):
+                if self.size <= target:
+                    break
+                self._dropRef(self.index.pop(key))
+            self.isDirty = True
+
+    def remove(self, key, meta=None):
+        """Drops the entry for the given key (if any, and if given, only while
+           it is still the given entry).
+        """
+        with self.lock:
+            if key not in self.index or meta is not None and self.index[key] is not meta:
+                return
+            self._dropRef(self.index.pop(key))
+            self._changed()
+
+    def flush(self):
+        """Writes the index to disk if it has changed.
+        """
+        with self.lock:
+            if not self.isDirty:
+                return
+            tmpPath = self.indexPath + '.tmp'
+            with open(tmpPath, 'w') as f:
+                json.dump(self.index, f)
+            os.replace(tmpPath, self.indexPath)
+            self.isDirty = False
+            self.changes = 0
+
+    def clear(self):
+        """Removes every entry and blob from the cache.
+        """
+        with self.lock:
+            for meta in self.index.values():
+                blobPath = self._getBlobPath(meta['digest'])
+                if os.path.isfile(blobPath):
+                    os.remove(blobPath)
+            self.index = {}
+            self.refs = {}
+            self.size = 0
+            self.isDirty = True
+            self.flush()
+
+    def get(self, session, url, **kwargs):
+        """Returns the response for the given URL, served from disk while the
+           stored copy is fresh and otherwise revalidated (or fetched) with the
+           given session. Keyword arguments are passed on to requests.
+        """
+        key = getKey(url, kwargs.get('params'))
+        meta = self.lookup(key)
+        if meta is not None and time.time() - meta['stored'] < self.getTtl(key):
+            cached = self._build(key, meta)
+            if cached is not None:
+                return cached
+            meta = None
+        extraHeaders = kwargs.pop('headers', None)
+        headers = dict(extraHeaders or {})
+        if meta is not None:
+            if 'ETag' in meta['headers']:
+                headers['If-None-Match'] = meta['headers']['ETag']
+            if 'Last-Modified' in meta['headers']:
+                headers['If-Modified-Since'] = meta['headers']['Last-Modified']
+        res = session.get(url, headers=headers, **kwargs)
+        if res.status_code == 304 and meta is not None:
+            with self.lock:
+                meta['stored'] = time.time()
+                for h in storedHeaders:
+                    if h in res.headers:
+                        meta['headers'][h] = res.headers[h]
+                self._changed()
+            cached = self._build(key, meta)
+            if cached is not None:
+                cached.revalidated = True
+                return cached
+            res = session.get(url, headers=extraHeaders, **kwargs)
+        if res.status_code == 200:
+            self.store(key, res)
+        return res
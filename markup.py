@@ -0,0 +1,40 @@
+"""Shared construction of BeautifulSoup trees for the scraper modules. Each
+   extractor declares the region of the page it needs as a SoupStrainer, so
+   only that region is built into a tree, and the parser backend is chosen
+   package-wide: lxml when it is installed, the pure-Python html.parser
+   otherwise.
+"""
+
+import re
+import bs4
+from scrapese import metrics
+
+try:
+    import lxml
+    parser = 'lxml'
+except ImportError:
+    parser = 'html.parser'
+
+def hasClass(name):
+    """Returns a pattern matching a class attribute that includes the given
+       class name, for use in a SoupStrainer (strainers see the raw attribute
+       value, not the split list of classes).
+    """
+    return re.compile(r'(^|\s)%s(\s|$)' % re.escape(name))
+
+def strain(name=None, attrs=None, **kwargs):
+    """Returns a SoupStrainer for the given tag name and attributes.
+    """
+    return bs4.SoupStrainer(name, dict(attrs or {}), **kwargs)
+
+def getSoup(content, only=None, treeBuilder=None):
+    """Parses the given markup into a BeautifulSoup tree, limited to the region
+       matched by the given SoupStrainer (if any). The tree builder defaults to
+       the package-wide parser setting. Parsing is recorded as a metrics parse
+       event for the calling module.
+    """
+    if treeBuilder is None:
+        treeBuilder = parser
+    with metrics.timer('parse') as t:
+        t.event['bytes'] = len(content)
+        return bs4.BeautifulSoup(content, treeBuilder, parse_only=only)
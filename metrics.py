@@ -0,0 +1,222 @@
+"""Package-wide instrumentation of the resolve -> query -> model pipeline.
+   Each measured call (an HTTP fetch, a parse of fetched markup, or the
+   extraction of a model from the parsed tree) is recorded as an event with
+   its module, host, stage, duration, bytes, and (for fetches) cache outcome.
+   Events are totalled per (module, host, stage) in the registry, which can be
+   exported as Prometheus text or JSON, and are passed to any registered sinks
+   (callables, like a LogSink or JsonLinesSink) as they happen.
+
+   Parse and extract stages are attributed to the host most recently fetched
+   by the same thread, so a job can be broken down into network-bound and
+   parse-bound time without a profiler.
+"""
+
+import sys
+import json
+import time
+import logging
+import threading
+from collections import OrderedDict
+
+enabled = True # when False, timers and fetches record nothing
+stages = ['fetch', 'parse', 'extract']
+cacheOutcomes = ['hit', 'revalidated', 'miss']
+sinks = []
+
+_local = threading.local()
+_skipModules = set(['metrics', 'fetch', 'afetch', 'httpcache', 'markup', 'scheduler'])
+
+def getModule(depth=1):
+    """Returns the short name of the scraper module making the current call:
+       the first module, starting depth frames above the caller, that is not
+       part of the shared fetch/parse plumbing.
+    """
+    frame = sys._getframe(depth + 1)
+    while frame is not None:
+        name = frame.f_globals.get('__name__', '').rsplit('.', 1)[-1]
+        if name not in _skipModules:
+            return name
+        frame = frame.f_back
+    return ''
+
+def getHost():
+    """Returns the host most recently fetched by the current thread.
+    """
+    return getattr(_local, 'host', '')
+
+def setHost(host):
+    _local.host = host
+
+class Registry(object):
+    """Running totals of recorded events, per (module, host, stage).
+    """
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.records = OrderedDict()
+
+    def add(self, event):
+        key = event['module'], event['host'], event['stage']
+        with self.lock:
+            record = self.records.get(key)
+            if record is None:
+                record = OrderedDict([
+                    ('module', key[0]),
+                    ('host', key[1]),
+                    ('stage', key[2]),
+                    ('calls', 0),
+                    ('errors', 0),
+                    ('seconds', 0.0),
+                    ('bytes', 0)
+                ])
+                record.update((k, 0) for k in cacheOutcomes)
+                self.records[key] = record
+            record['calls'] += 1
+            record['errors'] += 1 if event['error'] is not None else 0
+            record['seconds'] += event['seconds']
+            record['bytes'] += event['bytes']
+            if event['cache'] is not None:
+                record[event['cache']] += 1
+
+    def merge(self, records):
+        """Adds totals recorded elsewhere (like another process's registry).
+        """
+        with self.lock:
+            for r in records:
+                key = r['module'], r['host'], r['stage']
+                record = self.records.get(key)
+                if record is None:
+                    self.records[key] = OrderedDict(r)
+                    continue
+                for k in ['calls', 'errors', 'seconds', 'bytes'] + cacheOutcomes:
+                    record[k] += r[k]
+
+    def getRecords(self):
+        with self.lock:
+            return [OrderedDict(r) for r in self.records.values()]
+
+    def reset(self):
+        with self.lock:
+            self.records.clear()
+
+registry = Registry()
+
+def record(stage, seconds, module=None, host=None, bytes=0, cache=None, error=None):
+    """Records a single event, adding it to the registry and passing it to
+       every registered sink. Module and host default to the calling scraper
+       module and the thread's most recently fetched host.
+    """
+    if not enabled:
+        return
+    event = OrderedDict([
+        ('time', time.time()),
+        ('module', getModule(1) if module is None else module),
+        ('host', getHost() if host is None else host),
+        ('stage', stage),
+        ('seconds', seconds),
+        ('bytes', bytes),
+        ('cache', cache),
+        ('error', None if error is None else repr(error))
+    ])
+    registry.add(event)
+    for sink in sinks:
+        sink(event)
+
+class timer(object):
+    """Context manager timing the enclosed block as one event of the given
+       stage. Bytes (and any other event field) can be set on the yielded
+       timer's event dictionary before the block exits; exceptions are recorded
+       as errors and re-raised.
+    """
+
+    def __init__(self, stage, module=None, host=None):
+        self.stage = stage
+        self.event = {'module': getModule(1) if module is None else module, 'host': host, 'bytes': 0, 'cache': None}
+
+    def __enter__(self):
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, type, value, traceback):
+        record(self.stage, time.perf_counter() - self.start, error=value, **self.event)
+        return False
+
+def addSink(sink):
+    sinks.append(sink)
+    return sink
+
+def removeSink(sink):
+    if sink in sinks:
+        sinks.remove(sink)
+
+class LogSink(object):
+    """Sink writing each event as one line to the given logger.
+    """
+
+    def __init__(self, logger=None, level=logging.DEBUG):
+        self.logger = logging.getLogger('scrapese.metrics') if logger is None else logger
+        self.level = level
+
+    def __call__(self, event):
+        self.logger.log(self.level, '%s %s %s %.1f ms %u bytes%s%s', event['module'], event['host'], event['stage'],
+            1e3 * event['seconds'], event['bytes'],
+            '' if event['cache'] is None else ' cache=' + event['cache'],
+            '' if event['error'] is None else ' error=' + event['error'])
+
+class JsonLinesSink(object):
+    """Sink appending each event as a line of JSON to the file at the given
+       path.
+    """
+
+    def __init__(self, path):
+        self.lock = threading.Lock()
+        self.file = open(path, 'a')
+
+    def __call__(self, event):
+        line = json.dumps(event) + '\n'
+        with self.lock:
+            self.file.write(line)
+            self.file.flush()
+
+    def close(self):
+        self.file.close()
+
+def _escape(value):
+    return value.replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+def toPrometheus(records=None, prefix='scrapese'):
+    """Returns the registry totals in the Prometheus text exposition format
+       (for a textfile collector or a scrape endpoint).
+    """
+    if records is None:
+        records = registry.getRecords()
+    series = [
+        ('calls_total', 'counter', 'Measured calls', lambda r: r['calls']),
+        ('errors_total', 'counter', 'Measured calls that raised', lambda r: r['errors']),
+        ('seconds_total', 'counter', 'Time spent in measured calls', lambda r: r['seconds']),
+        ('bytes_total', 'counter', 'Response bytes fetched', lambda r: r['bytes'])
+    ]
+    lines = []
+    for name, kind, help, getValue in series:
+        lines.append('# HELP %s_%s %s' % (prefix, name, help))
+        lines.append('# TYPE %s_%s %s' % (prefix, name, kind))
+        for r in records:
+            labels = ','.join('%s="%s"' % (k, _escape(r[k])) for k in ['module', 'host', 'stage'])
+            lines.append('%s_%s{%s} %s' % (prefix, name, labels, repr(getValue(r))))
+    lines.append('# HELP %s_cache_total Fetches by response cache outcome' % prefix)
+    lines.append('# TYPE %s_cache_total counter' % prefix)
+    for r in records:
+        if r['stage'] == 'fetch':
+            for outcome in cacheOutcomes:
+                lines.append('%s_cache_total{module="%s",host="%s",outcome="%s"} %u' % (prefix, _escape(r['module']), _escape(r['host']), outcome, r[outcome]))
+    return '\n'.join(lines) + '\n'
+
+def toJson(records=None):
+    """Returns the registry totals as a JSON array of records.
+    """
+    if records is None:
+        records = registry.getRecords()
+    return json.dumps(records, indent=4)
+
+def reset():
+    registry.reset()
@@ -13,11 +13,14 @@
    constraints imposed by existing selections.
 """
 
+import os
 import sys
-import requests
-import bs4
 import re
+import json
+import sqlite3
+import threading
 from collections import OrderedDict
+from scrapese import afetch, data, fetch, markup, metrics
 
 baseUrl = 'http://www.newegg.com/Product/'
 searchPath = 'ProductList.aspx?Submit=ENE&IsNodeId=1&'
@@ -47,6 +50,33 @@ searchNodes = {
 
 entriesPerScrape = 90 # or 15 or 30 or 60
 sortBy = 'RATING' # or PRICE or REVIEWS or BESTSELLING
+checkpointEvery = 25 # completed products between checkpoint writes
+dbPath = data.get_path('newegg.db')
+
+specFields = {
+    'socket': ['CPU Socket Type', 'CPU Socket', 'Socket'],
+    'formFactor': ['Form Factor', 'Motherboard Compatibility', 'Motherboard Support'],
+    'memoryType': ['Memory Standard', 'Memory Type', 'Type'],
+    'wattage': ['Maximum Power', 'Wattage', 'Max Power', 'Thermal Design Power']
+}
+formFactors = [
+    ('EATX', re.compile(r'^(E-?ATX|EXTENDED ATX)$')),
+    ('MICRO ATX', re.compile(r'^(MICRO[- ]?ATX|M-?ATX|U-?ATX)$')),
+    ('MINI ITX', re.compile(r'^(MINI[- ]?ITX)$')),
+    ('ATX', re.compile(r'^ATX$'))
+]
+compatibilityRules = {
+    # (candidate category, selected category): fields whose values must overlap
+    ('motherboard', 'processors'): ['socket'],
+    ('processors', 'motherboard'): ['socket'],
+    ('motherboard', 'case'): ['formFactor'],
+    ('case', 'motherboard'): ['formFactor'],
+    ('motherboard', 'memory'): ['memoryType'],
+    ('memory', 'motherboard'): ['memoryType']
+}
+
+listStrainer = markup.strain('div', class_=markup.hasClass('itemCell'))
+productStrainer = markup.strain(id=['grpDescrip_h', 'frmSeller', 'Specs'])
 
 def _isItem(tag):
     return tag.name == 'div' and 'class' in tag.attrs and 'itemCell' in tag.attrs['class']
@@ -54,21 +84,37 @@ def _isItem(tag):
 def _isTitle(tag):
     return tag.name == 'a' and 'title' in tag.attrs and tag.attrs['title'].lower() == 'view details'
 
-def _getList(term, category='systems'):
+def _getNodes(category):
+    nodes = searchNodes[category]
+    return nodes if isinstance(nodes, list) else [nodes]
+
+def _getListUrl(term, category='systems', page=1, node=None):
+    if node is None:
+        node = _getNodes(category)[0]
     term = term.replace(' ', '+')
-    url = baseUrl + searchPath + ('Order=%s&PageSize=%u&' % (sortBy, entriesPerScrape)) + ('N=%u&SrchInDesc=%s' % (searchNodes[category], term))
-    res = requests.get(url)
-    soup = bs4.BeautifulSoup(res.content, 'html.parser')
-    items = soup.find_all(_isItem)
+    return baseUrl + searchPath + ('Order=%s&PageSize=%u&Page=%u&' % (sortBy, entriesPerScrape, page)) + ('N=%u&SrchInDesc=%s' % (node, term))
+
+def _getList(term, category='systems', page=1, node=None):
+    res = fetch.get(_getListUrl(term, category, page, node))
+    return _readList(res.content)
+
+async def _agetList(term, category='systems', page=1, node=None):
+    res = await afetch.get(_getListUrl(term, category, page, node))
+    return _readList(res.content)
+
+def _readList(content):
+    soup = markup.getSoup(content, listStrainer)
     results = OrderedDict()
-    for ndx, item in enumerate(items):
-        a = item.find(_isTitle)
-        m = re.search('Item=([^&]+)', a['href'])
-        if m is not None:
-            # We skip cases in which list entries are not specific items
-            k = m.groups()[0].encode('ascii', 'ignore')
-            v = a.find('span').text.encode('ascii', 'ignore')
-            results[k] = v
+    with metrics.timer('extract'):
+        items = soup.find_all(_isItem)
+        for ndx, item in enumerate(items):
+            a = item.find(_isTitle)
+            m = re.search('Item=([^&]+)', a['href'])
+            if m is not None:
+                # We skip cases in which list entries are not specific items
+                k = m.groups()[0].encode('ascii', 'ignore').decode('ascii')
+                v = a.find('span').text.encode('ascii', 'ignore').decode('ascii')
+                results[k] = v
     return results
     
 def _getTitle(soup):
@@ -93,15 +139,284 @@ def _getSpecs(soup):
 def getCategories():
     return searchNodes.keys()
         
-def resolve(term, category='systems'):
-    itemList = _getList(term, category)
-    itemCode = itemList.keys()[0]
+def getUrl(itemCode):
     return baseUrl + productPath + 'Item=%s' % itemCode
-    
-def query(url):
-    res = requests.get(url)
-    soup = bs4.BeautifulSoup(res.content, 'html.parser')
-    specs = _getSpecs(soup)
-    specs['title'] = _getTitle(soup)
-    specs['price'] = _getPrice(soup)
+
+def _getFirst(itemList, term):
+    if len(itemList) == 0:
+        raise Exception('Unable to resolve item for term "%s"' % term)
+    itemCode = next(iter(itemList))
+    return getUrl(itemCode)
+
+def resolve(term, category='systems'):
+    return _getFirst(_getList(term, category), term)
+
+def readProduct(content, url=None):
+    """Returns the specifications (with title and price) from the given
+       product page markup. As a module-level function, it can be run on a
+       process pool (see pipeline.imap()).
+    """
+    soup = markup.getSoup(content, productStrainer)
+    with metrics.timer('extract'):
+        specs = _getSpecs(soup)
+        specs['title'] = _getTitle(soup)
+        specs['price'] = _getPrice(soup)
     return specs
+
+def query(url):
+    res = fetch.get(url)
+    return readProduct(res.content, url)
+
+async def aresolve(term, category='systems'):
+    """Awaitable form of resolve().
+    """
+    return _getFirst(await _agetList(term, category), term)
+
+async def aquery(url):
+    """Awaitable form of query().
+    """
+    res = await afetch.get(url)
+    return readProduct(res.content, url)
+
+def _loadCheckpoint(checkpointPath, category, term):
+    checkpoint = {'category': category, 'term': term, 'pages': {}, 'done': [], 'pending': []}
+    if checkpointPath is not None and os.path.isfile(checkpointPath):
+        with open(checkpointPath, 'r') as f:
+            saved = json.load(f)
+        if saved.get('category') == category and saved.get('term') == term:
+            checkpoint.update(saved)
+    return checkpoint
+
+def _saveCheckpoint(checkpointPath, checkpoint, done, pending):
+    if checkpointPath is None:
+        return
+    checkpoint['done'] = sorted(done)
+    checkpoint['pending'] = sorted(pending)
+    tmpPath = checkpointPath + '.tmp'
+    with open(tmpPath, 'w') as f:
+        json.dump(checkpoint, f)
+    os.replace(tmpPath, checkpointPath)
+
+def crawl(category, term='', workers=8, checkpointPath=None, maxPages=None):
+    """Pages through every listing in the given category (optionally narrowed
+       by a search term) and queries each product page on a pool of workers,
+       yielding (url, specs, error) tuples as products are parsed (error is the
+       exception raised for that product, if any). If a checkpoint path is
+       given, listed pages and completed products are recorded there, along
+       with products listed but not completed (failed, or still in flight
+       when the crawl stopped). A crawl restarted with the same path,
+       category, and term requeues those products first, then resumes listing
+       after the last page listed.
+    """
+    checkpoint = _loadCheckpoint(checkpointPath, category, term)
+    done = set(checkpoint['done'])
+    pending = set(checkpoint['pending']) - done
+    def _listItems():
+        for code in sorted(pending):
+            yield code
+        for node in _getNodes(category):
+            page = checkpoint['pages'].get(str(node), 0) + 1
+            seen = done | pending
+            while maxPages is None or page <= maxPages:
+                items = _getList(term, category, page, node)
+                codes = [k for k in items if k not in seen]
+                if len(codes) == 0:
+                    break
+                seen.update(codes)
+                # Listed products are recorded as pending before any is
+                # queried, so the page need not be listed again on resume
+                pending.update(codes)
+                checkpoint['pages'][str(node)] = page
+                for code in codes:
+                    yield code
+                if len(items) < entriesPerScrape:
+                    break
+                page += 1
+    count = 0
+    try:
+        for code, specs, error in fetch.imap(lambda c: query(getUrl(c)), _listItems(), workers):
+            if error is None:
+                done.add(code)
+                pending.discard(code)
+                count += 1
+                if count % checkpointEvery == 0:
+                    _saveCheckpoint(checkpointPath, checkpoint, done, pending)
+            yield getUrl(code), specs, error
+    finally:
+        _saveCheckpoint(checkpointPath, checkpoint, done, pending)
+
+def _getSpec(specs, field):
+    for key in specFields[field]:
+        if key in specs:
+            return specs[key]
+    return None
+
+def _splitValues(value):
+    return [v.strip() for v in re.split('[/,;|]', value) if len(v.strip()) > 0]
+
+def _normalizeSocket(value):
+    sockets = []
+    for v in _splitValues(value):
+        v = re.sub(r'(?i)\bsocket\b', '', v)
+        sockets.append(re.sub(r'\s+', '', v).upper())
+    return sockets
+
+def _normalizeFormFactor(value):
+    names = []
+    for v in _splitValues(value):
+        v = re.sub(r'\s+', ' ', v.upper())
+        for name, pattern in formFactors:
+            if pattern.match(v):
+                names.append(name)
+                break
+    return names
+
+def _normalizeMemoryType(value):
+    return sorted(set(m.upper() for m in re.findall(r'(?i)\bDDR\d?(?=\b|SDRAM)', value)))
+
+def _normalizeWattage(value):
+    m = re.search(r'(\d+(\.\d+)?)\s*W\b', value)
+    return float(m.group(1)) if m is not None else None
+
+def normalize(specs):
+    """Returns the typed fields used to filter components from a spec dict (as
+       returned by query()): lists of socket, formFactor, and memoryType values
+       (components like cases and motherboards support several), wattage in
+       watts, price, and title. Fields missing from the specs are empty or None.
+    """
+    fields = {
+        'title': specs.get('title'),
+        'price': specs.get('price'),
+        'wattage': None,
+        'socket': [],
+        'formFactor': [],
+        'memoryType': []
+    }
+    for field, normalizer in [('socket', _normalizeSocket), ('formFactor', _normalizeFormFactor), ('memoryType', _normalizeMemoryType), ('wattage', _normalizeWattage)]:
+        value = _getSpec(specs, field)
+        if value is not None:
+            fields[field] = normalizer(value)
+    return fields
+
+class ComponentDb(object):
+    """Local SQLite store of queried components, with their normalized fields
+       indexed for constraint filtering. Multi-valued fields (socket,
+       formFactor, memoryType) are stored as (field, value) attribute rows
+       indexed by value, so compatibility queries are answered from indexes
+       rather than by scanning every record.
+    """
+
+    def __init__(self, path=None):
+        self.path = dbPath if path is None else path
+        self.lock = threading.Lock()
+        self.db = sqlite3.connect(self.path, check_same_thread=False)
+        self.db.executescript("""
+            CREATE TABLE IF NOT EXISTS components (
+                id INTEGER PRIMARY KEY,
+                url TEXT UNIQUE NOT NULL,
+                category TEXT NOT NULL,
+                title TEXT,
+                price REAL,
+                wattage REAL,
+                specs TEXT,
+                fields TEXT
+            );
+            CREATE INDEX IF NOT EXISTS componentsByPrice ON components (category, price);
+            CREATE INDEX IF NOT EXISTS componentsByWattage ON components (category, wattage);
+            CREATE TABLE IF NOT EXISTS attributes (
+                component INTEGER NOT NULL REFERENCES components (id) ON DELETE CASCADE,
+                field TEXT NOT NULL,
+                value TEXT NOT NULL,
+                PRIMARY KEY (field, value, component)
+            ) WITHOUT ROWID;
+            CREATE INDEX IF NOT EXISTS attributesByComponent ON attributes (component);
+        """)
+        columns = [row[1] for row in self.db.execute('PRAGMA table_info(components)')]
+        if 'fields' not in columns:
+            # Stores created before normalized fields were kept are normalized on read
+            self.db.execute('ALTER TABLE components ADD COLUMN fields TEXT')
+
+    def close(self):
+        self.db.close()
+
+    def addMany(self, entries):
+        """Stores (category, url, specs) entries, replacing any previous record
+           for the same URL, in a single transaction.
+        """
+        with self.lock, self.db:
+            for category, url, specs in entries:
+                fields = normalize(specs)
+                row = self.db.execute('SELECT id FROM components WHERE url = ?', (url,)).fetchone()
+                if row is not None:
+                    self.db.execute('DELETE FROM attributes WHERE component = ?', row)
+                    self.db.execute('DELETE FROM components WHERE id = ?', row)
+                cursor = self.db.execute('INSERT INTO components (url, category, title, price, wattage, specs, fields) VALUES (?, ?, ?, ?, ?, ?, ?)',
+                    (url, category, fields['title'], fields['price'], fields['wattage'], json.dumps(specs), json.dumps(fields)))
+                for field in ['socket', 'formFactor', 'memoryType']:
+                    self.db.executemany('INSERT OR IGNORE INTO attributes (component, field, value) VALUES (?, ?, ?)',
+                        [(cursor.lastrowid, field, v) for v in fields[field]])
+
+    def add(self, category, url, specs):
+        self.addMany([(category, url, specs)])
+
+    def _getRecord(self, row):
+        id, url, category, specs, fields = row
+        record = {'url': url, 'category': category, 'specs': json.loads(specs)}
+        record.update(normalize(record['specs']) if fields is None else json.loads(fields))
+        return record
+
+    def get(self, url):
+        """Returns the stored record (url, category, specs, and normalized
+           fields) for the given product URL, or None.
+        """
+        with self.lock:
+            row = self.db.execute('SELECT id, url, category, specs, fields FROM components WHERE url = ?', (url,)).fetchone()
+        return None if row is None else self._getRecord(row)
+
+    def find(self, category, maxPrice=None, minWattage=None, **constraints):
+        """Returns the records in the given category matching every constraint,
+           cheapest first. Keyword constraints name a normalized field
+           (socket, formFactor, or memoryType) and give one value or a list of
+           acceptable values; values are normalized as for normalize().
+        """
+        sql = 'SELECT c.id, c.url, c.category, c.specs, c.fields FROM components c WHERE c.category = ?'
+        args = [category]
+        if maxPrice is not None:
+            sql += ' AND c.price <= ?'
+            args.append(maxPrice)
+        if minWattage is not None:
+            sql += ' AND c.wattage >= ?'
+            args.append(minWattage)
+        for field, values in constraints.items():
+            if field not in ['socket', 'formFactor', 'memoryType']:
+                raise Exception('Unable to filter on field "%s"' % field)
+            if not isinstance(values, (list, tuple, set)):
+                values = [values]
+            normalizer = {'socket': _normalizeSocket, 'formFactor': _normalizeFormFactor, 'memoryType': _normalizeMemoryType}[field]
+            values = sorted(set(n for v in values for n in normalizer(v)))
+            if len(values) == 0:
+                return []
+            # Uncorrelated, so each constraint is answered once from the
+            # attributes key rather than probed per component
+            sql += ' AND c.id IN (SELECT component FROM attributes WHERE field = ? AND value IN (%s))' % ', '.join('?' * len(values))
+            args.append(field)
+            args.extend(values)
+        sql += ' ORDER BY c.price'
+        with self.lock:
+            rows = self.db.execute(sql, args).fetchall()
+        return [self._getRecord(row) for row in rows]
+
+    def findCompatible(self, category, selections, maxPrice=None, minWattage=None):
+        """Returns the records in the given category compatible with every one
+           of the selected records (as returned by get() or find()), according
+           to compatibilityRules, cheapest first.
+        """
+        constraints = {}
+        for selection in selections:
+            for field in compatibilityRules.get((category, selection['category']), []):
+                constraints.setdefault(field, set(selection[field]))
+                constraints[field] &= set(selection[field])
+        for field, values in constraints.items():
+            if len(values) == 0:
+                return []
+        return self.find(category, maxPrice, minWattage, **dict((f, list(v)) for f, v in constraints.items()))
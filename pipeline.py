@@ -0,0 +1,97 @@
+"""Two-stage scraping pipeline for bulk jobs: pages are fetched on a pool of
+   I/O threads, and their raw bytes are parsed into models on a pool of
+   processes, so markup parsing (pure-Python work that holds the GIL) scales
+   across cores. Parse functions are module-level readers taking (content,
+   url), like astronautix.readPage, newegg.readProduct, or wm.readTable, and
+   return compact models (dictionaries and lists) rather than parse trees.
+"""
+
+import os
+import multiprocessing
+from concurrent import futures
+from scrapese import fetch, metrics
+
+# Worker processes are never forked from the calling process, which by the
+# time parsing starts has fetch threads running (a forked child could inherit
+# a lock one of them holds, and deadlock on it)
+startMethod = 'forkserver' if 'forkserver' in multiprocessing.get_all_start_methods() else 'spawn'
+
+def _fetch(url):
+    res = fetch.get(url)
+    res.raise_for_status()
+    return res.content
+
+def _parse(parse, content, url, host):
+    """Runs in a worker process: parses the content, returning the model along
+       with the metrics recorded while parsing (merged by the caller).
+    """
+    metrics.registry.reset()
+    metrics.setHost(host)
+    model = parse(content, url)
+    return model, metrics.registry.getRecords()
+
+def getPool(workers=None):
+    """Returns a process pool of the given size (default: one per core) for
+       parsing, started with startMethod. Pools passed to imap() should be
+       created this way. Since workers are not forked, they import the
+       calling script afresh, so scripts using the pipeline must guard their
+       entry point with if __name__ == '__main__'.
+    """
+    return futures.ProcessPoolExecutor(max_workers=workers, mp_context=multiprocessing.get_context(startMethod))
+
+def imap(parse, urls, fetchWorkers=8, parseWorkers=None, window=None, pool=None):
+    """Fetches each of the given URLs on fetchWorkers threads and parses each
+       response with parse(content, url) on a pool of parseWorkers processes
+       (default: one per core), yielding (url, model, error) tuples as models
+       arrive (error is the exception raised fetching or parsing that URL, if
+       any). At most window URLs (default twice the total worker count) are in
+       either stage at once, so fetching waits on parsing when the processes
+       fall behind, and urls may be a lazy iterable of any length. An existing
+       process pool (see getPool()) can be given, and is left running, to
+       avoid starting one per call.
+    """
+    if parseWorkers is None:
+        parseWorkers = os.cpu_count() or 1
+    if window is None:
+        window = 2 * (fetchWorkers + parseWorkers)
+    urls = iter(urls)
+    pending = {}
+    cpu = getPool(parseWorkers) if pool is None else pool
+    io = futures.ThreadPoolExecutor(max_workers=fetchWorkers)
+    try:
+        while True:
+            if len(pending) < window:
+                for url in urls:
+                    pending[io.submit(_fetch, url)] = url, True
+                    if len(pending) >= window:
+                        break
+            if len(pending) == 0:
+                return
+            done, _ = futures.wait(pending, return_when=futures.FIRST_COMPLETED)
+            for f in done:
+                url, isFetch = pending.pop(f)
+                error = f.exception()
+                if error is not None:
+                    yield url, None, error
+                elif isFetch:
+                    host = fetch._getHost(url)[1]
+                    pending[cpu.submit(_parse, parse, f.result(), url, host)] = url, False
+                else:
+                    model, records = f.result()
+                    metrics.registry.merge(records)
+                    yield url, model, None
+    finally:
+        io.shutdown(wait=False, cancel_futures=True)
+        if pool is None:
+            cpu.shutdown(wait=False, cancel_futures=True)
+
+def query(parse, urls, fetchWorkers=8, parseWorkers=None, pool=None):
+    """Returns a dictionary of the models parsed from the given URLs (see
+       imap()), raising the first error encountered.
+    """
+    models = {}
+    for url, model, error in imap(parse, urls, fetchWorkers, parseWorkers, pool=pool):
+        if error is not None:
+            raise error
+        models[url] = model
+    return models
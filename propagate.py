@@ -0,0 +1,90 @@
+"""Batch SGP4 propagation for TLEs retrieved through the celestrak module (from
+   query(), queryMany(), or queryGroup()). Satellites are gathered into
+   vectorized sgp4 SatrecArray objects and propagated over a whole time grid in
+   one call, in chunks of satellites so memory stays bounded for the full
+   catalog. Positions (km) and velocities (km/s) are returned in the TEME frame.
+"""
+
+import datetime
+import numpy as np
+from sgp4.api import Satrec, SatrecArray, WGS72, jday
+
+chunkSize = 1024 # number of satellites propagated per SatrecArray call
+
+def getSatrec(tle):
+    """Returns a Satrec for the given TLE entry, which may have three lines (the
+       first being the object name, as returned by celestrak.query) or two.
+    """
+    if isinstance(tle, Satrec):
+        return tle
+    line1, line2 = tle[-2:]
+    return Satrec.twoline2rv(line1, line2, WGS72)
+
+def getSatrecs(tles):
+    """Returns a list of Satrec objects for the given TLE entries.
+    """
+    return [getSatrec(tle) for tle in tles]
+
+def getTimes(start, stop, step):
+    """Returns the (jd, fr) arrays of whole and fractional Julian dates for a
+       uniform time grid from the start datetime up to (and including, when it
+       falls on the grid) the stop datetime, spaced by step seconds.
+    """
+    n = int(np.floor((stop - start).total_seconds() / step)) + 1
+    jd0, fr0 = jday(start.year, start.month, start.day, start.hour, start.minute,
+        start.second + start.microsecond * 1e-6)
+    fr = fr0 + np.arange(n) * (step / 86400.0)
+    whole = np.floor(fr)
+    return jd0 + whole, fr - whole
+
+def propagateChunks(tles, jd, fr, chunkSize=chunkSize):
+    """Propagates the given TLE entries over the (jd, fr) time grid, chunkSize
+       satellites at a time. Yields (start, e, r, v) for each chunk, where start
+       is the index of the chunk's first satellite, e is the (n, t) array of
+       sgp4 error codes, and r and v are (n, t, 3) position and velocity arrays.
+    """
+    jd = np.asarray(jd, dtype=np.float64)
+    fr = np.asarray(fr, dtype=np.float64)
+    chunk = []
+    start = 0
+    for tle in tles:
+        chunk.append(getSatrec(tle))
+        if len(chunk) == chunkSize:
+            e, r, v = SatrecArray(chunk).sgp4(jd, fr)
+            yield start, e, r, v
+            start += len(chunk)
+            chunk = []
+    if len(chunk) > 0:
+        e, r, v = SatrecArray(chunk).sgp4(jd, fr)
+        yield start, e, r, v
+
+def propagate(tles, jd, fr, chunkSize=chunkSize):
+    """Propagates all of the given TLE entries over the (jd, fr) time grid,
+       returning the (n, t) error-code array and (n, t, 3) position and velocity
+       arrays, as sgp4 computes them: entries whose propagation failed have a
+       non-zero error code, and hold NaN for most codes (but not for decayed
+       satellites, code 6, whose computed state is returned anyway).
+    """
+    satrecs = getSatrecs(tles)
+    n = len(satrecs)
+    t = np.size(jd)
+    e = np.zeros((n, t), dtype=np.uint8)
+    r = np.empty((n, t, 3))
+    v = np.empty((n, t, 3))
+    for start, ce, cr, cv in propagateChunks(satrecs, jd, fr, chunkSize):
+        stop = start + ce.shape[0]
+        e[start:stop] = ce
+        r[start:stop] = cr
+        v[start:stop] = cv
+    return e, r, v
+
+def propagateAt(tles, when=None, chunkSize=chunkSize):
+    """Convenience form of propagate() for a single datetime (defaults to the
+       current UTC time), returning (n,) error codes and (n, 3) positions and
+       velocities.
+    """
+    if when is None:
+        when = datetime.datetime.now(datetime.timezone.utc)
+    jd, fr = getTimes(when, when, 1.0)
+    e, r, v = propagate(tles, jd, fr, chunkSize)
+    return e[:, 0], r[:, 0], v[:, 0]
@@ -0,0 +1,225 @@
+"""Per-host request scheduling for the fetch layer. Every request that reaches
+   the network passes through the scheduler for its host, which holds it to
+   that host's token bucket (sustained rate and burst) and concurrency cap.
+   Responses with a throttling status (429/503) pause the host, for the
+   Retry-After period when one is given and with jittered exponential backoff
+   otherwise, cut its rate, and are retried; the rate recovers as requests
+   succeed again. Hosts are scheduled independently, so a slow or throttled
+   site never holds back requests to any other. Coroutines are scheduled by
+   the same per-host state through arequest().
+"""
+
+import time
+import asyncio
+import random
+import threading
+from email import utils
+
+defaultLimits = {'rate': None, 'burst': 1, 'concurrency': 8}
+hostLimits = {
+    # rate is in requests per second (None for no limit); entries also match
+    # their subdomains
+    'celestrak.com': {'rate': 1.0, 'burst': 2, 'concurrency': 2},
+    'simbad.u-strasbg.fr': {'rate': 5.0, 'burst': 5, 'concurrency': 4},
+    'wikipedia.org': {'rate': 10.0, 'burst': 10, 'concurrency': 4},
+    'www.newegg.com': {'rate': 2.0, 'burst': 2, 'concurrency': 4},
+    'www.astronautix.com': {'rate': 2.0, 'burst': 2, 'concurrency': 2}
+}
+retryStatuses = [429, 503]
+maxRetries = 4 # retries of a throttled request before its response is returned
+backoffBase = 1.0 # seconds of backoff after the first throttled attempt
+backoffMax = 120.0 # cap (seconds) on any single pause, including Retry-After
+rateDecrease = 0.5 # factor applied to a host's rate on each throttled response
+rateRecovery = 0.05 # fraction of the configured rate restored per success
+minRate = 0.1 # floor (requests per second) for an adapted rate
+
+_hosts = {}
+_lock = threading.Lock()
+
+def getRetryAfter(res):
+    """Returns the delay (seconds) requested by a response's Retry-After header,
+       given either in seconds or as an HTTP date, or None.
+    """
+    value = res.headers.get('Retry-After')
+    if value is None:
+        return None
+    value = value.strip()
+    if value.isdigit():
+        return float(value)
+    parsed = utils.parsedate_tz(value)
+    if parsed is None:
+        return None
+    return max(0.0, utils.mktime_tz(parsed) - time.time())
+
+class TokenBucket(object):
+    """Token bucket refilled at rate tokens per second up to burst tokens. A
+       rate of None never limits.
+    """
+
+    def __init__(self, rate, burst=1):
+        self.rate = rate
+        self.burst = max(burst, 1)
+        self.tokens = float(self.burst)
+        self.stamp = time.monotonic()
+        self.lock = threading.Lock()
+
+    def reserve(self):
+        """Takes a token, returning the time (seconds) the caller must wait
+           before using it; tokens may be reserved ahead of the refill, so
+           concurrent callers are spaced out rather than released together.
+        """
+        with self.lock:
+            if self.rate is None:
+                return 0.0
+            now = time.monotonic()
+            self.tokens = min(self.burst, self.tokens + (now - self.stamp) * self.rate)
+            self.stamp = now
+            self.tokens -= 1
+            return 0.0 if self.tokens >= 0 else -self.tokens / self.rate
+
+    def setRate(self, rate):
+        with self.lock:
+            now = time.monotonic()
+            if self.rate is not None:
+                self.tokens = min(self.burst, self.tokens + (now - self.stamp) * self.rate)
+            self.stamp = now
+            self.rate = rate
+
+class HostScheduler(object):
+    """Schedules the requests made to a single host.
+    """
+
+    def __init__(self, host, rate=None, burst=1, concurrency=8):
+        self.host = host
+        self.limit = rate
+        self.bucket = TokenBucket(rate, burst)
+        self.concurrency = concurrency
+        self.slots = threading.BoundedSemaphore(concurrency)
+        self.asyncSlots = None
+        self.lock = threading.Lock()
+        self.pausedUntil = 0.0
+        self.throttled = 0
+
+    def pause(self, seconds):
+        """Holds back every request to this host for the given time.
+        """
+        with self.lock:
+            self.pausedUntil = max(self.pausedUntil, time.monotonic() + seconds)
+
+    def _getPause(self):
+        with self.lock:
+            return self.pausedUntil - time.monotonic()
+
+    def _wait(self):
+        delay = self._getPause()
+        while delay > 0:
+            time.sleep(delay)
+            delay = self._getPause()
+        delay = self.bucket.reserve()
+        if delay > 0:
+            time.sleep(delay)
+
+    async def _await(self):
+        delay = self._getPause()
+        while delay > 0:
+            await asyncio.sleep(delay)
+            delay = self._getPause()
+        delay = self.bucket.reserve()
+        if delay > 0:
+            await asyncio.sleep(delay)
+
+    def _getAsyncSlots(self):
+        # asyncio semaphores belong to one event loop
+        loop = asyncio.get_running_loop()
+        with self.lock:
+            if self.asyncSlots is None or self.asyncSlots[0] is not loop:
+                self.asyncSlots = (loop, asyncio.Semaphore(self.concurrency))
+            return self.asyncSlots[1]
+
+    def _onThrottled(self, res, attempt):
+        with self.lock:
+            self.throttled += 1
+        if self.bucket.rate is not None:
+            self.bucket.setRate(max(minRate, self.bucket.rate * rateDecrease))
+        delay = getRetryAfter(res)
+        if delay is None:
+            delay = backoffBase * 2**attempt * random.uniform(0.5, 1.0)
+        self.pause(min(delay, backoffMax))
+
+    def _onSuccess(self):
+        rate = self.bucket.rate
+        if self.limit is not None and rate < self.limit:
+            self.bucket.setRate(min(self.limit, rate + rateRecovery * self.limit))
+
+    def request(self, send):
+        """Calls send() (which issues the request and returns its response)
+           once this host's schedule allows, retrying throttled responses up
+           to maxRetries times.
+        """
+        for attempt in range(maxRetries + 1):
+            self._wait()
+            with self.slots:
+                res = send()
+            if res.status_code not in retryStatuses:
+                self._onSuccess()
+                return res
+            if attempt == maxRetries:
+                return res
+            self._onThrottled(res, attempt)
+            res.close()
+
+    async def arequest(self, send):
+        """Awaitable form of request(), where send is a coroutine function.
+           Waits are asyncio sleeps, and the concurrency cap applies to the
+           coroutines of the running event loop (separately from threads).
+        """
+        slots = self._getAsyncSlots()
+        for attempt in range(maxRetries + 1):
+            await self._await()
+            async with slots:
+                res = await send()
+            if res.status_code not in retryStatuses:
+                self._onSuccess()
+                return res
+            if attempt == maxRetries:
+                return res
+            self._onThrottled(res, attempt)
+            res.close()
+
+def getLimits(host):
+    """Returns the limits (rate, burst, concurrency) for the given host (netloc
+       or hostname).
+    """
+    hostname = host.lower().rsplit('@', 1)[-1].split(':')[0]
+    limits = dict(defaultLimits)
+    for h, l in hostLimits.items():
+        if hostname == h or hostname.endswith('.' + h):
+            limits.update(l)
+            break
+    return limits
+
+def getScheduler(host):
+    """Returns the scheduler for the given host, creating it (with the limits
+       configured at that time) on first use.
+    """
+    scheduler = _hosts.get(host)
+    if scheduler is None:
+        with _lock:
+            scheduler = _hosts.get(host)
+            if scheduler is None:
+                scheduler = HostScheduler(host, **getLimits(host))
+                _hosts[host] = scheduler
+    return scheduler
+
+def request(host, send):
+    return getScheduler(host).request(send)
+
+async def arequest(host, send):
+    return await getScheduler(host).arequest(send)
+
+def reset():
+    """Discards all host schedulers. Limits changed after a host's scheduler
+       was created only take effect once the schedulers are reset.
+    """
+    with _lock:
+        _hosts.clear()
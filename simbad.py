@@ -1,17 +1,37 @@
 """Interface to the SIMBAD star catalog database
 """
 
-import bs4
-import requests
+import os
+import json
+import threading
+from scrapese import afetch, data, fetch, markup, metrics
+
+simbadUrl = 'http://simbad.u-strasbg.fr/simbad/'
+cachePath = data.get_path('simbad.json')
+tableStrainer = markup.strain('table')
+
+_cache = None
+_cacheLock = threading.Lock()
 
 def _getUrl(url):
-    req = requests.get(url)
-    soup = bs4.BeautifulSoup(req.content, 'html.parser')
+    req = fetch.get(url)
+    return _readIds(req.content, url)
+
+async def _agetUrl(url):
+    req = await afetch.get(url)
+    return _readIds(req.content, url)
+
+def _readIds(content, url):
+    soup = markup.getSoup(content, tableStrainer)
     tables = soup.find_all('table')
+    idNdx = None
     for ndx, table in enumerate(tables):
         b = table.find_all('b')
         if len(b) == 1 and b[0].text.strip().startswith('Identifiers'):
             idNdx = ndx + 1
+            break
+    if idNdx is None or idNdx >= len(tables):
+        raise Exception('No identifiers found at "%s"' % url)
     tti = tables[idNdx].find_all('tt')
     ids = {}
     for tt in tti:
@@ -20,11 +40,108 @@ def _getUrl(url):
         v = a.next_sibling.string.strip()
         ids[k] = v
     return ids
-    
+
 def getSao(id):
-    url = 'http://simbad.u-strasbg.fr/simbad/sim-id?Ident=SAO+' + str(id)
+    url = simbadUrl + 'sim-id?Ident=SAO+' + str(id)
     return _getUrl(url)
-    
+
 def getOther(field, value):
-    url = 'http://simbad.u-strasbg.fr/simbad/sim-id?Ident=%s+%u' % (field, value)
+    url = simbadUrl + 'sim-id?Ident=%s+%u' % (field, value)
     return _getUrl(url)
+
+async def agetSao(id):
+    """Awaitable form of getSao().
+    """
+    return await _agetUrl(simbadUrl + 'sim-id?Ident=SAO+' + str(id))
+
+async def agetOther(field, value):
+    """Awaitable form of getOther().
+    """
+    return await _agetUrl(simbadUrl + 'sim-id?Ident=%s+%u' % (field, value))
+
+def _parseIdList(text, ident):
+    """Parses the plain-text identifier list returned by a SIMBAD script into
+       the same catalog-to-designation dictionary returned by getSao().
+    """
+    if '::error::' in text:
+        raise Exception('Unable to identify "%s": %s' % (ident, text.split('::error::')[-1].strip(': \n')))
+    ids = {}
+    for line in text.splitlines():
+        parts = line.strip().split(None, 1)
+        if len(parts) == 2:
+            ids[parts[0]] = parts[1]
+    if len(ids) == 0:
+        raise Exception('No identifiers returned for "%s"' % ident)
+    return ids
+
+def _getScript(ident):
+    return '\n'.join([
+        'output console=off script=off',
+        'format object "%IDLIST"',
+        'query id ' + ident
+    ])
+
+def getIds(ident):
+    """Returns the identifiers of the object with the given identifier (like
+       'SAO 151881' or 'HD 48915'), using SIMBAD's plain-text script output
+       rather than the HTML page.
+    """
+    res = fetch.get(simbadUrl + 'sim-script', params={'script': _getScript(ident)})
+    res.raise_for_status()
+    with metrics.timer('extract'):
+        return _parseIdList(res.text, ident)
+
+async def agetIds(ident):
+    """Awaitable form of getIds().
+    """
+    res = await afetch.get(simbadUrl + 'sim-script', params={'script': _getScript(ident)})
+    res.raise_for_status()
+    with metrics.timer('extract'):
+        return _parseIdList(res.text, ident)
+
+def _getCache():
+    global _cache
+    if _cache is None:
+        _cache = {}
+        if os.path.isfile(cachePath):
+            with open(cachePath, 'r') as f:
+                _cache = json.load(f)
+    return _cache
+
+def _saveCache():
+    tmpPath = cachePath + '.tmp'
+    with open(tmpPath, 'w') as f:
+        json.dump(_cache, f)
+    os.replace(tmpPath, cachePath)
+
+def crossMatch(idents, workers=8):
+    """Cross-identifies many objects, yielding (ident, ids, error) tuples where
+       ids is the dictionary returned by getIds() (error is the exception
+       raised for that identifier, if any). Each given identifier is yielded
+       as given, once per occurrence. Identifiers already in the local cache
+       are yielded first without any request; the rest are fetched (once per
+       distinct identifier, ignoring whitespace differences) with at most
+       workers requests in flight, and their results added to the cache.
+    """
+    with _cacheLock:
+        cached = dict(_getCache())
+    pending = {}
+    for ident in idents:
+        key = ' '.join(ident.split())
+        if key in cached:
+            yield ident, cached[key], None
+        else:
+            pending.setdefault(key, []).append(ident)
+    found = 0
+    try:
+        for key, ids, error in fetch.imap(getIds, pending, workers):
+            if error is None:
+                with _cacheLock:
+                    _getCache()[key] = ids
+                found += 1
+            for ident in pending[key]:
+                yield ident, ids, error
+    finally:
+        if found > 0:
+            with _cacheLock:
+                _saveCache()
@@ -0,0 +1,151 @@
+"""Local SQLite store for the models returned by the scraper modules,
+   implementing the "cache" and "catalog" operations of reqs/api.txt. Each
+   source (module name, like 'astronautix' or 'celestrak') gets its own table
+   keyed on that source's unique ID field (URL, SSCID, etc.), with models
+   stored as JSON. IDs are stored (and returned) as strings.
+"""
+
+import re
+import json
+import time
+import sqlite3
+import threading
+from scrapese import data
+
+storePath = data.get_path('models.db')
+batchSize = 500 # IDs bound per lookup statement, under SQLite's variable limit
+sourcePattern = re.compile(r'^[A-Za-z_][A-Za-z0-9_]*$')
+
+_store = None
+_storeLock = threading.Lock()
+
+class ModelStore(object):
+    """SQLite database of models, with one table per source. Tables are
+       created on first use, clustered on the ID field (so lookups are a single
+       index probe), and written in one transaction per call.
+    """
+
+    def __init__(self, path=None):
+        self.path = storePath if path is None else path
+        self.lock = threading.Lock()
+        self.db = sqlite3.connect(self.path, check_same_thread=False)
+        self.db.execute('PRAGMA journal_mode=WAL')
+        self.tables = set(self._getSources())
+
+    def close(self):
+        self.db.close()
+
+    def _getSources(self):
+        rows = self.db.execute("SELECT name FROM sqlite_master WHERE type = 'table'").fetchall()
+        return [row[0] for row in rows]
+
+    def _getTable(self, source, create=False):
+        if not sourcePattern.match(source):
+            raise Exception('Invalid source name "%s"' % source)
+        if source not in self.tables:
+            if not create:
+                return None
+            with self.db:
+                self.db.execute('CREATE TABLE IF NOT EXISTS "%s" (id TEXT PRIMARY KEY, model TEXT NOT NULL, updated REAL NOT NULL) WITHOUT ROWID' % source)
+            self.tables.add(source)
+        return '"%s"' % source
+
+    def sources(self):
+        """Returns the names of the sources with a table in this store.
+        """
+        with self.lock:
+            return sorted(self.tables)
+
+    def cacheMany(self, source, entries):
+        """Stores (id, model) entries for the given source, replacing any model
+           previously stored under the same ID, in a single transaction.
+           Returns the number of entries stored.
+        """
+        now = time.time()
+        rows = [(str(id), json.dumps(model), now) for id, model in entries]
+        with self.lock:
+            table = self._getTable(source, True)
+            with self.db:
+                self.db.executemany('INSERT OR REPLACE INTO %s (id, model, updated) VALUES (?, ?, ?)' % table, rows)
+        return len(rows)
+
+    def cache(self, source, id, model):
+        self.cacheMany(source, [(id, model)])
+
+    def catalog(self, source):
+        """Returns the (sorted) list of IDs stored for the given source.
+        """
+        with self.lock:
+            table = self._getTable(source)
+            if table is None:
+                return []
+            return [row[0] for row in self.db.execute('SELECT id FROM %s ORDER BY id' % table)]
+
+    def get(self, source, id):
+        """Returns the model stored for the given source and ID, or None.
+        """
+        return self.getMany(source, [id]).get(str(id))
+
+    def getMany(self, source, ids):
+        """Returns a dictionary of the models stored for the given IDs; IDs
+           with no stored model are omitted.
+        """
+        ids = [str(id) for id in ids]
+        models = {}
+        with self.lock:
+            table = self._getTable(source)
+            if table is None:
+                return models
+            for i in range(0, len(ids), batchSize):
+                batch = ids[i:i+batchSize]
+                sql = 'SELECT id, model FROM %s WHERE id IN (%s)' % (table, ','.join('?' * len(batch)))
+                for id, model in self.db.execute(sql, batch):
+                    models[id] = json.loads(model)
+        return models
+
+    def load(self, source):
+        """Returns every model stored for the given source, as a dictionary
+           keyed by ID, for tools that work on the whole set in memory.
+        """
+        with self.lock:
+            table = self._getTable(source)
+            if table is None:
+                return {}
+            return dict((id, json.loads(model)) for id, model in self.db.execute('SELECT id, model FROM %s' % table))
+
+    def remove(self, source, ids):
+        with self.lock:
+            table = self._getTable(source)
+            if table is None:
+                return
+            with self.db:
+                self.db.executemany('DELETE FROM %s WHERE id = ?' % table, [(str(id),) for id in ids])
+
+def getStore():
+    """Returns the package-wide store at storePath, opening it on first use.
+    """
+    global _store
+    with _storeLock:
+        if _store is None:
+            _store = ModelStore()
+        return _store
+
+def cache(source, id, model):
+    """Stores the given model under its source and unique ID.
+    """
+    getStore().cache(source, id, model)
+
+def cacheMany(source, entries):
+    """Stores many (id, model) entries for a source in one transaction.
+    """
+    return getStore().cacheMany(source, entries)
+
+def catalog(source):
+    """Returns the list of unique IDs stored for the given source.
+    """
+    return getStore().catalog(source)
+
+def lookup(source, id):
+    """Returns the model stored for the given source and ID, or None.
+    """
+    return getStore().get(source, id)
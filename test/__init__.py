@@ -14,8 +14,22 @@ else:
 		return isinstance(c, type) and issubclass(c, unittest.TestCase)
 
 __all__ = [
+    'aio',
     'ax',
-    'ne'
+    'cj',
+    'ct',
+    'fb',
+    'hc',
+    'mk',
+    'mt',
+    'pg',
+    'ne',
+    'pl',
+    'rp',
+    'sc',
+    'sb',
+    'st',
+    'wm'
 ]
 
 def suite():
@@ -0,0 +1,79 @@
+"""Test cases for the awaitable scraper interfaces, comparing them with their
+   synchronous forms against recorded fixtures
+"""
+
+import os
+import shutil
+import asyncio
+import tempfile
+import threading
+import unittest
+from scrapese import afetch, newegg, simbad, wm
+from scrapese.test import replay
+
+try:
+    import aiohttp
+except ImportError:
+    aiohttp = None
+
+def _run(coroutine):
+    async def _main():
+        try:
+            return await coroutine
+        finally:
+            await afetch.close()
+    return asyncio.run(_main())
+
+@unittest.skipIf(aiohttp is None, 'aiohttp is not installed')
+class Awaitable(unittest.TestCase):
+    def setUp(self):
+        # Title lookups are cached in a temporary directory, not the package
+        self.path = tempfile.mkdtemp()
+        self.curidPath = wm.curidPath
+        self.curids = wm._curids, wm._unsavedCurids
+        wm.curidPath = os.path.join(self.path, 'curids.json')
+        wm._curids = None
+
+    def tearDown(self):
+        wm.curidPath = self.curidPath
+        wm._curids, wm._unsavedCurids = self.curids
+        shutil.rmtree(self.path)
+
+    def test_newegg(self):
+        with replay.Replay('newegg') as rp:
+            url = newegg.resolve('Devil Canyon', 'processors')
+            expected = newegg.query(url)
+            self.assertEqual(_run(newegg.aresolve('Devil Canyon', 'processors')), url)
+            self.assertEqual(_run(newegg.aquery(url)), expected)
+        self.assertEqual(rp.misses, [])
+
+    def test_wm(self):
+        with replay.Replay('wm') as rp:
+            titles = ['Saturn V', 'Space Shuttle', 'Falcon 9', 'Ariane 5']
+            urls = _run(wm.agetUrls(titles))
+            self.assertEqual(list(urls.keys()), titles)
+            expected = [wm.getInfoBox(url) for url in urls.values()]
+            async def _getAll():
+                return await asyncio.gather(*[wm.agetInfoBox(url) for url in urls.values()])
+            self.assertEqual(_run(_getAll()), expected)
+        self.assertEqual(rp.misses, [])
+
+    def test_concurrency(self):
+        idents = ['SAO 151881', 'HD 48915', 'HIP 32349', 'SAO 113271'] * 100
+        # Counted relative to the threads already running (like stand-in
+        # handlers left over from earlier tests)
+        threads = [threading.active_count()]
+        async def _getAll():
+            results = asyncio.gather(*[simbad.agetIds(ident) for ident in idents])
+            await asyncio.sleep(0)
+            threads.append(threading.active_count())
+            return await results
+        with replay.Replay('simbad'):
+            expected = simbad.getIds('SAO 151881')
+            results = _run(_getAll())
+        self.assertEqual(len(results), len(idents))
+        self.assertEqual(results[0], expected)
+        self.assertTrue(threads[1] - threads[0] < 20)
+
+if __name__ == '__main__':
+    unittest.main()
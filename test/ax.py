@@ -1,8 +1,55 @@
 """Test cases for Astronautix scraping
 """
 
+import os
+import shutil
+import tempfile
+import bs4
 import unittest
+import numpy as np
 from scrapese import astronautix
+from scrapese.test import server
+
+ARTICLE = """<h1><br>RS-25%s</h1>
+<hr>American high-pressure engine. Space Shuttle main engine.
+<p>Staged combustion engine developed for the Shuttle.
+<p>Flown on every Shuttle mission. <i>Thrust:</i> 2,279 kN.
+<br><i>Area Ratio:</i> 77.5
+<br><i>Chamber Pressure:</i> 206 bar.
+<hr><b>Associated Stages</b>
+<ul><a href="../s/shuttleorbiter.html">Shuttle Orbiter</a></ul>
+<hr><b>See also</b>
+<ul><a href="../l/lox.html">LOX</a></ul>
+<ul><a href="http://example.com/x">External</a></ul>
+%s"""
+
+# Current parsers treat <hr> and <br> as void; older ones nest everything
+# following them inside, closing them only with their parent
+VOID = '<html><body><div id="col1">%s</div></body></html>' % (ARTICLE % ('', ''))
+NESTED = '<div id="col1">%s</div>' % (ARTICLE % ('</br>', '</hr></hr></br></br></p></p></hr>'))
+
+ARTICLE_URL = 'http://www.astronautix.com/r/rs-25.html'
+
+GRAPH = {
+    'root': ['a', 'b'],
+    'a': ['c', 'root'],
+    'b': ['a'],
+    'c': ['d'],
+    'd': []
+}
+
+PAGE = """<html><body><div id="col1"><h1><br>%s</h1>
+<hr>%s summary.
+<hr><b>Associated Engines</b>
+%s
+</div></body></html>"""
+
+def _handle(path, query):
+    name = path.replace('/s/', '').replace('.html', '')
+    if name not in GRAPH:
+        return 404, {}, 'Not found'
+    links = ''.join('<ul><a href="%s.html">%s</a></ul>' % (n, n) for n in GRAPH[name])
+    return 200, {'Content-Type': 'text/html'}, PAGE % (name, name, links)
 
 class Engine(unittest.TestCase):
     def test_resolve(self):
@@ -37,5 +84,112 @@ class Props(unittest.TestCase):
         expected = 316.0
         self.assertTrue(abs(expected - Isp_sl) / expected < 1e-3)
 
+class Quantities(unittest.TestCase):
+    def _assertQuantity(self, text, value, unit):
+        q = astronautix.parseQuantity(text)
+        self.assertTrue(q is not None, text)
+        self.assertAlmostEqual(q[0], value, places=6, msg=text)
+        self.assertEqual(q[1], unit, text)
+
+    def test_units(self):
+        self._assertQuantity('2,279 kN', 2.279e6, 'N')
+        self._assertQuantity('1.8 MN', 1.8e6, 'N')
+        self._assertQuantity('25 mN', 0.025, 'N')
+        self._assertQuantity('4.57 m (15.00 ft)', 4.57, 'm')
+        self._assertQuantity('452 s.', 452., 's')
+        self._assertQuantity('20.6 MPa', 2.06e7, 'Pa')
+        self._assertQuantity('3,177 kg', 3177., 'kg')
+        self._assertQuantity('77.5', 77.5, '')
+        self._assertQuantity('12 furlongs', 12., 'furlongs')
+
+    def test_ranges(self):
+        self._assertQuantity('1,500-2,000 kg', 1750., 'kg')
+        self._assertQuantity(u'10\u201312 m', 11., 'm')
+        self._assertQuantity('2 to 4 kN', 3e3, 'N')
+        self._assertQuantity('-5 deg', -5., 'deg')
+
+    def test_missing(self):
+        self.assertTrue(astronautix.parseQuantity('') is None)
+        self.assertTrue(astronautix.parseQuantity('Unknown') is None)
+        self.assertTrue(astronautix.parseQuantity('(see text)') is None)
+
+    def test_getValues(self):
+        models = [
+            {'specifications': {'Thrust': '2,279 kN', 'Mass': '3,177 kg'}},
+            {'specifications': {'Thrust': '1.8 MN'}},
+            {'specifications': {'Thrust': '500,000 lbf', 'Mass': 'Unknown'}},
+            {'specifications': {'Thrust': '12 s', 'Mass': '1,500-2,000 kg'}}
+        ]
+        values, units = astronautix.getValues(models, ['Thrust', 'Mass', 'Span'])
+        self.assertEqual(list(values.keys()), ['Thrust', 'Mass', 'Span'])
+        self.assertEqual(units, {'Thrust': 'N', 'Mass': 'kg', 'Span': ''})
+        thrust = values['Thrust']
+        self.assertTrue(isinstance(thrust, np.ma.MaskedArray))
+        self.assertEqual(list(thrust.mask), [False, False, False, True])
+        self.assertTrue(np.allclose(thrust.compressed(), [2.279e6, 1.8e6, 500000 * 4.4482216152605]))
+        self.assertEqual(list(values['Mass'].mask), [False, True, True, False])
+        self.assertEqual(list(values['Mass'].compressed()), [3177., 1750.])
+        self.assertTrue(values['Span'].mask.all())
+        self.assertEqual(len(values['Span']), len(models))
+
+class Article(unittest.TestCase):
+    def _check(self, model):
+        self.assertEqual(model['title'], 'RS-25')
+        self.assertEqual(model['summary'], 'American high-pressure engine. Space Shuttle main engine.')
+        self.assertEqual(model['content'], 'Staged combustion engine developed for the Shuttle.\n\nFlown on every Shuttle mission.')
+        self.assertEqual(model['specifications'], {'Thrust': '2,279 kN', 'Area Ratio': '77.5', 'Chamber Pressure': '206 bar'})
+        self.assertEqual(model['associations'], {
+            'Stages': [{'Shuttle Orbiter': 'http://www.astronautix.com/s/shuttleorbiter.html'}],
+            'Topics': [{'LOX': 'http://www.astronautix.com/l/lox.html'}, {'External': 'http://example.com/x'}]
+        })
+
+    def test_void(self):
+        self._check(astronautix.readPage(VOID, ARTICLE_URL))
+
+    def test_nested(self):
+        article = bs4.BeautifulSoup(NESTED, 'xml').find('div')
+        self.assertTrue(len(article.find('hr').contents) > 0)
+        self._check(astronautix.readArticle(article, ARTICLE_URL))
+
+class Crawl(unittest.TestCase):
+    def setUp(self):
+        self.path = tempfile.mkdtemp()
+
+    def tearDown(self):
+        shutil.rmtree(self.path)
+
+    def _getQueried(self, si, start):
+        return sorted(r[0].replace('/s/', '').replace('.html', '') for r in si.requests[start:])
+
+    def test_crawl(self):
+        visitedPath = os.path.join(self.path, 'visited.jsonl')
+        outPath = os.path.join(self.path, 'models.jsonl')
+        with server.StandIn(_handle) as si:
+            results = list(astronautix.crawl(si.url + 's/root.html', depth=2, workers=2, visitedPath=visitedPath, outPath=outPath))
+            self.assertEqual(self._getQueried(si, 0), ['a', 'b', 'c', 'root'])
+            levels = dict((u.split('/')[-1], level) for u, level, _, _ in results)
+            self.assertEqual(levels, {'root.html': 0, 'a.html': 1, 'b.html': 1, 'c.html': 2})
+            self.assertTrue(all(error is None for _, _, _, error in results))
+            self.assertEqual(dict((u.split('/')[-1], m['title']) for u, _, m, _ in results)['c.html'], 'c')
+            with open(outPath, 'r') as f:
+                self.assertEqual(len(f.readlines()), 4)
+
+            # Restarted deeper, only the new level is queried
+            count = len(si.requests)
+            results = list(astronautix.crawl(si.url + 's/root.html', depth=3, workers=2, visitedPath=visitedPath))
+            self.assertEqual(self._getQueried(si, count), ['d'])
+            self.assertEqual([(u.split('/')[-1], level) for u, level, _, _ in results], [('d.html', 3)])
+
+    def test_errors(self):
+        GRAPH['e'] = ['missing']
+        try:
+            with server.StandIn(_handle) as si:
+                results = list(astronautix.crawl(si.url + 's/e.html', depth=1))
+        finally:
+            del GRAPH['e']
+        errors = dict((u.split('/')[-1], error) for u, _, _, error in results)
+        self.assertTrue(errors['e.html'] is None)
+        self.assertTrue(errors['missing.html'] is not None)
+
 if __name__ == '__main__':
     unittest.main()
@@ -0,0 +1,274 @@
+"""Network-free performance baseline for the scraper modules. Each scenario
+   runs against its recorded fixtures (see replay.py), measuring resolve and
+   query latency, query throughput at several concurrency levels, and peak
+   (traced) memory at each level. Run as:
+
+       python -m scrapese.test.bench [--record] [--out baseline.json] [name ...]
+
+   where --record first re-captures the named scenarios' fixtures from the
+   live sites.
+"""
+
+import os
+import sys
+import json
+import time
+import shutil
+import argparse
+import tempfile
+import tracemalloc
+from collections import OrderedDict
+from scrapese import fetch
+from scrapese.test import replay
+
+repeats = 5 # timed calls per latency measurement
+concurrencyLevels = [1, 4, 16]
+throughputCalls = 64 # query calls per throughput measurement
+
+class Scenario(object):
+    """Base scenario: resolve() returns an item (URL or identifier) accepted by
+       query(), and getItems() the items cycled through when measuring
+       throughput. Scenarios without a replayable resolve() leave it as None.
+    """
+    name = None
+    resolve = None
+
+    def setUp(self):
+        self.tmpPath = tempfile.mkdtemp()
+
+    def tearDown(self):
+        shutil.rmtree(self.tmpPath, True)
+
+    def getPath(self, name):
+        return os.path.join(self.tmpPath, name)
+
+class CelestrakScenario(Scenario):
+    name = 'celestrak'
+    term = 'SHIJIAN'
+
+    def setUp(self):
+        Scenario.setUp(self)
+        from scrapese import celestrak
+        self.module = celestrak
+        self.paths = celestrak.catPath, celestrak.idxPath
+        celestrak.catPath = self.getPath('satcat.txt')
+        celestrak.idxPath = self.getPath('satcat.idx')
+        celestrak._updateSatCat()
+
+    def tearDown(self):
+        self.module.catPath, self.module.idxPath = self.paths
+        Scenario.tearDown(self)
+
+    def resolve(self):
+        return self.module.resolve(self.term)
+
+    def query(self, url):
+        return self.module.query(url)
+
+    def getItems(self):
+        return self.module.resolveAll(self.term)
+
+class AstronautixScenario(Scenario):
+    # resolve() searches through the google package, not fetch, so only
+    # articles at known URLs are replayed
+    name = 'astronautix'
+    urls = [
+        'http://www.astronautix.com/r/rs-25.html',
+        'http://www.astronautix.com/x/x-37b.html',
+        'http://www.astronautix.com/l/lox.html'
+    ]
+
+    def setUp(self):
+        Scenario.setUp(self)
+        from scrapese import astronautix
+        self.module = astronautix
+
+    def query(self, url):
+        return self.module.query(url)
+
+    def getItems(self):
+        return self.urls
+
+class NeweggScenario(Scenario):
+    name = 'newegg'
+    term = 'Devil Canyon'
+    category = 'processors'
+
+    def setUp(self):
+        Scenario.setUp(self)
+        from scrapese import newegg
+        self.module = newegg
+
+    def resolve(self):
+        return self.module.resolve(self.term, self.category)
+
+    def query(self, url):
+        return self.module.query(url)
+
+    def getItems(self):
+        return [self.module.getUrl(code) for code in self.module._getList(self.term, self.category)]
+
+class WikiMediaScenario(Scenario):
+    name = 'wm'
+    titles = ['Saturn V', 'Space Shuttle', 'Falcon 9', 'Ariane 5']
+
+    def setUp(self):
+        Scenario.setUp(self)
+        from scrapese import wm
+        self.module = wm
+        self.curidPath = wm.curidPath
+        wm.curidPath = self.getPath('curids.json')
+        wm._curids = None
+
+    def tearDown(self):
+        self.module.curidPath = self.curidPath
+        self.module._curids = None
+        Scenario.tearDown(self)
+
+    def resolve(self):
+        # Measures the API round trip, not the local title cache
+        self.module._curids = None
+        if os.path.isfile(self.module.curidPath):
+            os.remove(self.module.curidPath)
+        return self.module.getUrl(self.titles[0])
+
+    def query(self, url):
+        return self.module.getInfoBox(url)
+
+    def getItems(self):
+        return list(self.module.getUrls(self.titles).values())
+
+class SimbadScenario(Scenario):
+    name = 'simbad'
+    idents = ['SAO 151881', 'HD 48915', 'HIP 32349', 'SAO 113271']
+
+    def setUp(self):
+        Scenario.setUp(self)
+        from scrapese import simbad
+        self.module = simbad
+
+    def query(self, ident):
+        return self.module.getIds(ident)
+
+    def getItems(self):
+        return self.idents
+
+scenarios = OrderedDict((s.name, s) for s in [
+    CelestrakScenario,
+    AstronautixScenario,
+    NeweggScenario,
+    WikiMediaScenario,
+    SimbadScenario
+])
+
+def _getLatency(func, *args):
+    """Returns latency statistics (seconds) over repeated calls of func.
+    """
+    times = []
+    for _ in range(repeats):
+        t0 = time.perf_counter()
+        func(*args)
+        times.append(time.perf_counter() - t0)
+    times.sort()
+    return {'min': times[0], 'median': times[len(times) // 2], 'max': times[-1]}
+
+def _runCalls(scenario, items, workers):
+    calls = [items[i % len(items)] for i in range(throughputCalls)]
+    for item, _, error in fetch.imap(scenario.query, calls, workers):
+        if error is not None:
+            raise error
+
+def _getThroughput(scenario, items, workers):
+    """Returns (calls per second, peak traced bytes) for throughputCalls query
+       calls made with the given number of workers. Memory is traced in a
+       separate pass so tracing overhead does not skew the timing.
+    """
+    fetch.reset()
+    t0 = time.perf_counter()
+    _runCalls(scenario, items, workers)
+    rate = throughputCalls / (time.perf_counter() - t0)
+    tracemalloc.start()
+    try:
+        _runCalls(scenario, items, workers)
+        _, peak = tracemalloc.get_traced_memory()
+    finally:
+        tracemalloc.stop()
+    return rate, peak
+
+def measure(scenario):
+    """Runs the given scenario (instance) against its fixtures, returning its
+       measurements as a dictionary.
+    """
+    results = OrderedDict()
+    with replay.Replay(scenario.name) as rp:
+        scenario.setUp()
+        try:
+            items = scenario.getItems()
+            if scenario.resolve is not None:
+                results['resolve'] = _getLatency(scenario.resolve)
+                item = scenario.resolve()
+            else:
+                results['resolve'] = None
+                item = items[0]
+            results['query'] = _getLatency(scenario.query, item)
+            results['throughput'] = OrderedDict()
+            results['peakBytes'] = OrderedDict()
+            for workers in concurrencyLevels:
+                rate, peak = _getThroughput(scenario, items, workers)
+                results['throughput'][str(workers)] = rate
+                results['peakBytes'][str(workers)] = peak
+        finally:
+            scenario.tearDown()
+    if len(rp.misses) > 0:
+        raise Exception('Requests with no fixture in "%s": %s' % (scenario.name, ', '.join(sorted(set(rp.misses)))))
+    return results
+
+def record(scenario):
+    """Re-captures the fixtures for the given scenario (instance) from the
+       live sites, exercising every request the benchmark makes.
+    """
+    with replay.Recorder(scenario.name):
+        scenario.setUp()
+        try:
+            items = scenario.getItems()
+            if scenario.resolve is not None:
+                scenario.resolve()
+            for item in items:
+                scenario.query(item)
+        finally:
+            scenario.tearDown()
+
+def run(names=None):
+    if names is None or len(names) == 0:
+        names = list(scenarios.keys())
+    return OrderedDict((name, measure(scenarios[name]())) for name in names)
+
+def report(results, out=sys.stdout):
+    out.write('%-12s %10s %10s' % ('scenario', 'resolve', 'query'))
+    for workers in concurrencyLevels:
+        out.write(' %9s %9s' % ('%ux /s' % workers, '%ux MB' % workers))
+    out.write('\n')
+    for name, r in results.items():
+        resolve = '-' if r['resolve'] is None else '%.1f ms' % (1e3 * r['resolve']['median'])
+        out.write('%-12s %10s %10s' % (name, resolve, '%.1f ms' % (1e3 * r['query']['median'])))
+        for workers in concurrencyLevels:
+            out.write(' %9.1f %9.2f' % (r['throughput'][str(workers)], r['peakBytes'][str(workers)] / 2.0**20))
+        out.write('\n')
+
+def main():
+    parser = argparse.ArgumentParser(description='Runs the network-free scraper benchmarks')
+    parser.add_argument('names', nargs='*', help='scenarios to run (default: all)')
+    parser.add_argument('--record', action='store_true', help='re-record fixtures from the live sites first')
+    parser.add_argument('--out', help='path to which results are written as JSON')
+    args = parser.parse_args()
+    if args.record:
+        for name in args.names or scenarios.keys():
+            record(scenarios[name]())
+    results = run(args.names)
+    report(results)
+    if args.out is not None:
+        with open(args.out, 'w') as f:
+            json.dump(results, f, indent=4)
+
+if __name__ == '__main__':
+    main()
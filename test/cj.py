@@ -0,0 +1,107 @@
+"""Test cases for grid-indexed conjunction screening, compared with a brute-force
+   search over every pair
+"""
+
+import datetime
+import unittest
+import numpy as np
+from scrapese import conjunction, propagate
+from scrapese.test import pg
+
+def _findPairs(r, threshold, apsides=None, pad=0.0):
+    """Brute-force form of conjunction.findPairs(), returning a dictionary of
+       distances keyed by (i, j).
+    """
+    pairs = {}
+    for i in range(len(r)):
+        for j in range(i + 1, len(r)):
+            if not (np.all(np.isfinite(r[i])) and np.all(np.isfinite(r[j]))):
+                continue
+            if apsides is not None and not conjunction.filterApsides(np.array([i]), np.array([j]), apsides[0], apsides[1], pad)[0]:
+                continue
+            d = np.linalg.norm(r[i] - r[j])
+            if d < threshold:
+                pairs[i, j] = d
+    return pairs
+
+class FindPairs(unittest.TestCase):
+    def setUp(self):
+        self.random = np.random.RandomState(7)
+
+    def _check(self, r, threshold, apsides=None, pad=0.0):
+        i, j, d = conjunction.findPairs(r, threshold, apsides, pad)
+        self.assertTrue(np.all(i < j))
+        pairs = dict(((a, b), c) for a, b, c in zip(i, j, d))
+        self.assertEqual(len(pairs), len(i)) # no pair reported twice
+        expected = _findPairs(r, threshold, apsides, pad)
+        self.assertEqual(sorted(pairs), sorted(expected))
+        for k in expected:
+            self.assertAlmostEqual(pairs[k], expected[k], places=9)
+        return pairs
+
+    def test_random(self):
+        for n, scale, threshold in [(300, 100.0, 8.0), (500, 7000.0, 400.0), (200, 1.0, 0.2)]:
+            self._check(self.random.uniform(-scale, scale, (n, 3)), threshold)
+
+    def test_clustered(self):
+        # Most points share a cell, and the span is far larger than the threshold
+        r = np.concatenate([self.random.normal(0.0, 0.5, (150, 3)), self.random.uniform(-4e4, 4e4, (50, 3))])
+        self._check(r, 1.0)
+
+    def test_invalid(self):
+        r = self.random.uniform(0.0, 50.0, (120, 3))
+        r[::7] = np.nan
+        r[3, 1] = np.inf
+        r[5] = r[4] # duplicate point
+        r[12] = r[4]
+        pairs = self._check(r, 5.0)
+        self.assertEqual(pairs[4, 5], 0.0)
+        self.assertFalse(any(7 in k or 3 in k for k in pairs))
+        self.assertEqual(len(conjunction.findPairs(np.full((4, 3), np.nan), 1.0)[0]), 0)
+        self.assertEqual(len(conjunction.findPairs(r[0:1], 1.0)[0]), 0)
+
+    def test_boundaries(self):
+        # With the first point at the origin, cells are threshold wide, so
+        # these points sit exactly on cell boundaries along each axis and
+        # diagonal, at distances just under, at, and just over the threshold
+        threshold = 2.0
+        grid = np.array([(x, y, z) for x in range(4) for y in range(4) for z in range(4)], dtype=np.float64) * threshold
+        offsets = np.array([[threshold - 1e-9, 0, 0], [0, threshold, 0], [0, 0, threshold + 1e-9], [1.0, 1.0, 1.0], [-1.0, 1.0, -1.0]])
+        r = np.concatenate([grid, grid[21] + offsets, grid[42] - offsets])
+        pairs = self._check(r, threshold)
+        self.assertTrue((21, 64) in pairs)
+        self.assertFalse((21, 65) in pairs)
+        self._check(r, threshold * 1.5)
+
+    def test_apsides(self):
+        n = 300
+        r = self.random.uniform(-500.0, 500.0, (n, 3))
+        perigee = self.random.uniform(300.0, 1000.0, n)
+        apogee = perigee + self.random.uniform(0.0, 300.0, n)
+        perigee[::11] = np.nan
+        for pad in [0.0, 50.0]:
+            pairs = self._check(r, 60.0, (perigee, apogee), pad)
+        self.assertTrue(len(pairs) < len(_findPairs(r, 60.0)))
+
+class Screen(unittest.TestCase):
+    def test_screen(self):
+        catalog = pg._getCatalog()
+        start = datetime.datetime(2019, 12, 10)
+        jd, fr = propagate.getTimes(start, start + datetime.timedelta(hours=12), 300.0)
+        conjunction.stepsPerBlock, stepsPerBlock = 16, conjunction.stepsPerBlock
+        try:
+            results = list(conjunction.screen(catalog, jd, fr, 2000.0))
+        finally:
+            conjunction.stepsPerBlock = stepsPerBlock
+        _, r, _ = propagate.propagate(catalog, jd, fr)
+        expected = {}
+        for k in range(len(jd)):
+            pairs = _findPairs(r[:, k], 2000.0)
+            if len(pairs) > 0:
+                expected[k] = pairs
+        self.assertEqual([k for k, _, _, _ in results], sorted(expected))
+        for k, i, j, d in results:
+            self.assertEqual(sorted(zip(i, j)), sorted(expected[k]))
+
+if __name__ == '__main__':
+    unittest.main()
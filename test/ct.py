@@ -1,13 +1,311 @@
 """Contains unit tests for evaluating the celetrack scraping module
 """
 
+import os
+import csv
+import shutil
+import tempfile
+import time
 import unittest
-from scrapese import celestrak as ct
+import numpy as np
+from collections import OrderedDict
+from scrapese import celestrak as ct, fetch, scheduler
+from scrapese.test import server
+
+# (id, catNum, payload, status, name, owner, launch, site, decay, period,
+#  inclination, apogee, perigee, rcs, code)
+SATCAT = [
+    ('1957-001A', '00001', ' ', 'D', 'SL-1 R/B', 'CIS', '1957-10-04', 'TYMSC', '1957-12-01', '96.19', '65.10', '938', '214', '20.4200', '   '),
+    ('1957-001B', '00002', '*', 'D', 'SPUTNIK 1', 'CIS', '1957-10-04', 'TYMSC', '1958-01-03', '96.10', '65.00', '1080', '64', 'N/A', '   '),
+    ('1958-002B', '00005', '*', '+', 'VANGUARD 1', 'US', '1958-03-17', 'AFETR', '', '132.70', '34.25', '3834', '650', '0.1220', '   '),
+    ('1960-007C', '00045', ' ', ' ', 'SHIJIAN DEB', 'PRC', '1960-06-22', 'AFETR', '', '97.50', '28.40', '1000', '800', '', 'NEA'),
+    ('1998-067A', '25544', '*', '+', 'ISS (ZARYA)', 'ISS', '1998-11-20', 'TYMSC', '', '92.96', '51.64', '421', '408', '399.0524', 'EA0'),
+    ('2016-051A', '41765', '*', '+', 'SHIJIAN-16 (SJ-16)', 'PRC', '2016-09-15', 'JSC', '', '94.80', '97.40', '600', '580', '3.1000', 'MO1'),
+    ('2017-066A', '42970', '*', '+', 'SHIJIAN-17', 'PRC', '2016-11-03', 'WSC', '', '1436.10', '0.10', '35800', '35770', '', 'SS2'),
+    ('2018-099A', '43700', ' ', '-', 'ES HAIL 2', 'QAT', '2018-11-15', 'AFETR', '', 'N/A', '', '', '', '', 'NCE'),
+    ('1969-059C', '04041', ' ', ' ', 'APOLLO 11 S-IVB', 'US', '1969-07-16', 'AFETR', '1969-07-20', '', '', '', '', '', 'DOC'),
+    ('2001-049A', '26999', '*', 'D', 'COLLIDER', 'US', '2001-10-01', 'AFWTR', '2002-01-01', '90.10', '45.00', '250', '200', '1.0000', 'NIE'),
+    ('2001-049B', '27000', ' ', ' ', 'COLLIDER R/B', 'US', '2001-10-01', 'AFWTR', '', '90.10', '45.00', '250', '200', '1.0000', 'MA3')
+]
+
+def _getLine(entry):
+    """Formats a satcat entry as a fixed-width satcat.txt line.
+    """
+    chars = [' '] * ct.satcatWidth
+    for value, start in zip(entry, [0, 13, 20, 21, 23, 49, 56, 68, 75, 87, 96, 103, 111, 119, 129]):
+        chars[start:start + len(value)] = value
+    return ''.join(chars)
+
+def _writeSatcat(path, entries):
+    with open(path, 'w') as f:
+        f.writelines(_getLine(entry) + '\n' for entry in entries)
+
+def _scan(path, term):
+    """Returns the catalog numbers matching the given term by a linear scan of
+       the catalog, as resolve() did before it was indexed.
+    """
+    term = term.lower()
+    catNums = []
+    with open(path, 'r') as f:
+        for line in f.read().splitlines():
+            name, id, catNum = ct._readSatCatLine(line)
+            if term in name.lower() or term == id.lower() or term == catNum.lower():
+                catNums.append(catNum)
+    return catNums
+
+def _convert(scPath, csvPath):
+    """Converts the catalog row by row, as convertSatcat() did before it was
+       vectorized.
+    """
+    with open(scPath, 'r') as f:
+        lines = f.readlines()
+    entries = []
+    for line in lines:
+        code = line[129:132].strip()
+        name = line[23:47].strip()
+        objType = "PAY" if line[20] == "*" else "R/B" if name.endswith("R/B") else "DEB" if name.endswith("DEB") else "UNK"
+        dataStatus = code if code in ["NCE", "NIE", "NEA"] else ""
+        orbCenter = ([c for c in ct.orbitCenterCodes if code.startswith(c)] + ["EA"])[0]
+        orbType = ct.orbitTypeCodes.get(line[131], "DOC" if code == "DOC" else "IMP" if line[21] == "D" else "ORB")
+        entries.append(OrderedDict([
+            ("OBJECT_NAME", name),
+            ("OBJECT_ID", line[0:11].strip()),
+            ("NORAD_CAT_ID", line[13:18].strip()),
+            ("OBJECT_TYPE", objType),
+            ("OPS_STATUS_CODE", line[21].strip()),
+            ("OWNER", line[49:54].strip()),
+            ("LAUNCH_DATE", line[56:66].strip()),
+            ("LAUNCH_SITE", line[68:73].strip()),
+            ("DECAY_DATE", line[75:85].strip()),
+            ("PERIOD", line[87:94].strip()),
+            ("INCLINATION", line[96:101].strip()),
+            ("APOGEE", line[103:109].strip()),
+            ("PERIGEE", line[111:117].strip()),
+            ("RCS", line[119:127].strip()),
+            ("DATA_STATUS_CODE", dataStatus),
+            ("ORBIT_CENTER", orbCenter),
+            ("ORBIT_TYPE", orbType)
+        ]))
+    with open(csvPath, 'w') as f:
+        dw = csv.DictWriter(f, fieldnames=entries[0].keys(), lineterminator="\n")
+        dw.writeheader()
+        dw.writerows(entries)
+
+class Convert(unittest.TestCase):
+    def setUp(self):
+        self.path = tempfile.mkdtemp()
+        self.scPath = os.path.join(self.path, 'satcat.txt')
+        _writeSatcat(self.scPath, SATCAT)
+
+    def tearDown(self):
+        shutil.rmtree(self.path)
+
+    def test_csv(self):
+        _convert(self.scPath, os.path.join(self.path, 'expected.csv'))
+        ct.convertSatcat(self.scPath)
+        with open(os.path.join(self.path, 'expected.csv'), 'rb') as f:
+            expected = f.read()
+        with open(os.path.join(self.path, 'satcat.csv'), 'rb') as f:
+            self.assertEqual(f.read(), expected)
+
+    def test_npz(self):
+        ct.convertSatcat(self.scPath)
+        satcat = ct.loadSatcat(os.path.join(self.path, 'satcat.npz'))
+        self.assertEqual(sorted(satcat), sorted(ct.satcatFields))
+        for k in ct.satcatFloatFields:
+            self.assertEqual(satcat[k].dtype, np.float64)
+        for k in ct.satcatDateFields:
+            self.assertEqual(satcat[k].dtype, np.dtype('datetime64[D]'))
+        self.assertEqual(satcat['NORAD_CAT_ID'].dtype, np.int64)
+        self.assertEqual(satcat['OBJECT_NAME'].dtype.kind, 'U')
+        self.assertTrue(all(len(satcat[k]) == len(SATCAT) for k in satcat))
+
+        # Values round-trip, with blank or non-numeric entries as NaN/NaT
+        with open(os.path.join(self.path, 'satcat.csv'), 'r') as f:
+            rows = list(csv.DictReader(f))
+        for n, row in enumerate(rows):
+            self.assertEqual(satcat['NORAD_CAT_ID'][n], int(row['NORAD_CAT_ID']))
+            for k in ['OBJECT_NAME', 'OBJECT_ID', 'OBJECT_TYPE', 'ORBIT_CENTER', 'ORBIT_TYPE']:
+                self.assertEqual(satcat[k][n], row[k])
+            for k in ct.satcatFloatFields:
+                if row[k] in ['', 'N/A']:
+                    self.assertTrue(np.isnan(satcat[k][n]))
+                else:
+                    self.assertEqual(satcat[k][n], float(row[k]))
+            for k in ct.satcatDateFields:
+                if row[k] == '':
+                    self.assertTrue(np.isnat(satcat[k][n]))
+                else:
+                    self.assertEqual(str(satcat[k][n]), row[k])
+
+class Index(unittest.TestCase):
+    def setUp(self):
+        self.path = tempfile.mkdtemp()
+        self.paths = ct.catPath, ct.idxPath
+        ct.catPath = os.path.join(self.path, 'satcat.txt')
+        ct.idxPath = os.path.join(self.path, 'satcat.idx')
+        ct._indices.clear()
+        _writeSatcat(ct.catPath, SATCAT)
+
+    def tearDown(self):
+        ct.catPath, ct.idxPath = self.paths
+        ct._indices.clear()
+        shutil.rmtree(self.path)
+
+    def test_resolveAll(self):
+        terms = ['SHIJIAN', 'shijian-1', 'sj', 'a', 'R/B', ' 1', '1998-067A', '2001-049b', '25544', '00005', '5',
+            'SPUTNIK 1', 'ISS (ZARYA)', 'hail', 'xyz', 'apollo 11 s-ivb']
+        for term in terms:
+            expected = [ct.resolveTle(catNum) for catNum in _scan(ct.catPath, term)]
+            self.assertEqual(ct.resolveAll(term), expected, term)
+        self.assertEqual(ct.resolve('shijian'), ct.resolveTle(45))
+        self.assertEqual(ct.resolve('25544'), ct.resolveTle(25544))
+        self.assertRaises(Exception, ct.resolve, 'xyz')
+
+    def test_persisted(self):
+        builds = []
+        buildIndex = ct._buildIndex
+        def _buildIndex(scPath):
+            builds.append(scPath)
+            return buildIndex(scPath)
+        ct._buildIndex = _buildIndex
+        try:
+            ct.resolveAll('ISS')
+            self.assertEqual(builds, [ct.catPath])
+            self.assertTrue(os.path.isfile(ct.idxPath))
+
+            # Unchanged catalog (size and mtime): the pickled index is reused
+            ct._indices.clear()
+            self.assertEqual(ct.resolveAll('VANGUARD'), [ct.resolveTle(5)])
+            self.assertEqual(len(builds), 1)
+
+            # Changed catalog: the index is rebuilt, and written back
+            entry = ('2019-001A', '43999', '*', '+', 'NEWSAT', 'US', '2019-01-01', 'AFETR', '', '95.00', '50.00', '500', '490', '', 'EA0')
+            _writeSatcat(ct.catPath, SATCAT + [entry])
+            self.assertEqual(ct.resolveAll('NEWSAT'), [ct.resolveTle(43999)])
+            self.assertEqual(len(builds), 2)
+            ct._indices.clear()
+            self.assertEqual(ct.resolveAll('NEWSAT'), [ct.resolveTle(43999)])
+            self.assertEqual(len(builds), 2)
+
+            # Same size, but a new mtime: rebuilt
+            st = os.stat(ct.catPath)
+            os.utime(ct.catPath, (st.st_atime, st.st_mtime - 60))
+            ct.resolveAll('NEWSAT')
+            self.assertEqual(len(builds), 3)
+        finally:
+            ct._buildIndex = buildIndex
+
+def _getTle(catNum):
+    return [
+        'SAT %05u' % catNum,
+        '1 %05uU 98067A   19343.69339541  .00001764  00000-0  38792-4 0  9991' % catNum,
+        '2 %05u  51.6439 211.2001 0007417  17.6667  85.6398 15.50103472202482' % catNum
+    ]
+
+class _Site(object):
+    """Stand-in for the plain-text GP endpoint. Lower catalog numbers are
+       answered more slowly, so responses arrive out of order; 404 is not
+       found, and 999 returns no TLE.
+    """
+    def __call__(self, path, query):
+        if 'GROUP' in query:
+            return 200, {'Content-Type': 'text/plain'}, '\r\n'.join(sum([_getTle(n) for n in range(1, 6)], []))
+        catNum = int(query['CATNR'])
+        if catNum == 404:
+            return 404, {}, 'Not found'
+        if catNum == 999:
+            return 200, {'Content-Type': 'text/plain'}, 'No GP data found'
+        time.sleep(max(0.0, 0.1 - 0.01 * catNum))
+        return 200, {'Content-Type': 'text/plain'}, '\r\n'.join(_getTle(catNum))
+
+class _Lines(object):
+    """Streaming response that records how many lines have been read.
+    """
+    status_code = 200
+    headers = {}
+
+    def __init__(self, lines):
+        self.lines = lines
+        self.read = 0
+        self.closed = False
+
+    def raise_for_status(self):
+        pass
+
+    def iter_lines(self):
+        for line in self.lines:
+            self.read += 1
+            yield line.encode('ascii')
+
+    def close(self):
+        self.closed = True
+
+class Query(unittest.TestCase):
+    def setUp(self):
+        self.hostOverrides = dict(fetch.hostOverrides)
+        self.hostLimits = scheduler.hostLimits
+        scheduler.hostLimits = {}
+        scheduler.reset()
+
+    def tearDown(self):
+        fetch.hostOverrides.clear()
+        fetch.hostOverrides.update(self.hostOverrides)
+        scheduler.hostLimits = self.hostLimits
+        scheduler.reset()
+
+    def _queryMany(self, sscids, ordered):
+        with server.StandIn(_Site()) as si:
+            fetch.hostOverrides['celestrak.com'] = si.url
+            return list(ct.queryMany(sscids, workers=4, ordered=ordered)), si
+
+    def test_queryMany(self):
+        sscids = [1, 2, 404, 3, '4', 999, 5, 6, 7, 8]
+        results, si = self._queryMany(sscids, True)
+        self.assertEqual([sscid for sscid, _, _ in results], sscids)
+        self.assertEqual(len(si.requests), len(sscids))
+        for sscid, tle, error in results:
+            if sscid in [404, 999]:
+                self.assertTrue(tle is None)
+                self.assertTrue(str(sscid) in str(error))
+            else:
+                self.assertEqual(tle, _getTle(int(sscid)))
+                self.assertTrue(error is None)
+
+        # Unordered, results stream back as they arrive, each with its own TLE
+        results, _ = self._queryMany(sscids, False)
+        self.assertNotEqual([sscid for sscid, _, _ in results], sscids)
+        self.assertEqual(sorted(str(sscid) for sscid, _, _ in results), sorted(str(sscid) for sscid in sscids))
+        self.assertTrue(all(tle == _getTle(int(sscid)) for sscid, tle, error in results if error is None))
+        self.assertEqual(sorted(sscid for sscid, _, error in results if error is not None), [404, 999])
+
+    def test_queryGroup(self):
+        with server.StandIn(_Site()) as si:
+            fetch.hostOverrides['celestrak.com'] = si.url
+            tles = list(ct.queryGroup('stations'))
+        self.assertEqual(tles, [_getTle(n) for n in range(1, 6)])
+        self.assertEqual(si.requests[0][1], {'GROUP': 'stations', 'FORMAT': 'TLE'})
+
+        # Each TLE is yielded as soon as its lines are read
+        lines = ['', 'BLANK LINE ABOVE'] + sum([_getTle(n) for n in range(1, 4)], [])
+        response = _Lines(lines)
+        get = ct.fetch.get
+        ct.fetch.get = lambda url, **kwargs: response if kwargs.get('stream') else None
+        try:
+            tles = ct.queryGroup('stations')
+            self.assertEqual(next(tles), _getTle(1))
+            self.assertEqual(response.read, 5)
+            self.assertEqual(next(tles), _getTle(2))
+            self.assertEqual(response.read, 8)
+            tles.close()
+        finally:
+            ct.fetch.get = get
+        self.assertTrue(response.closed)
 
 class TestShijan(unittest.TestCase):
     def test_resolve(self):
         url = ct.resolve('SHIJIAN')
-        
+
     def test_query(self):
         url = ct.resolve('SHIJIAN')
         tle = ct.query(url)
@@ -0,0 +1,105 @@
+"""Test cases for downloading factbook flags, run against a local stand-in
+   server
+"""
+
+import os
+import shutil
+import tempfile
+import unittest
+from email import utils
+from scrapese import factbook
+from scrapese.test import server
+
+FLAGS = {
+    'us': b'GIF89a' + b'\x01' * 200000,
+    'fr': b'GIF89a' + b'\x02' * 1000
+}
+MODIFIED = 'Tue, 01 Mar 2016 12:00:00 GMT'
+
+PAGE = """<html><body>%s</body></html>""" % ''.join(
+    '<div class="flag-image"><img src="../graphics/flags/large/%s-lgflag.gif"></div>' % name for name in ['us', 'fr', 'zz'])
+
+class _Site(object):
+    def __init__(self):
+        self.standIn = None
+
+    def __call__(self, path, query):
+        if path.endswith('flagsoftheworld.html'):
+            return 200, {'Content-Type': 'text/html'}, PAGE
+        name = path.split('/')[-1].split('-')[0]
+        if name not in FLAGS:
+            return 404, {}, 'Not found'
+        since = self.standIn.requests[-1][2].get('If-Modified-Since')
+        if since is not None and utils.parsedate_tz(since) >= utils.parsedate_tz(MODIFIED):
+            return 304, {'Last-Modified': MODIFIED}, ''
+        return 200, {'Content-Type': 'image/gif', 'Last-Modified': MODIFIED}, FLAGS[name]
+
+class _Truncated(object):
+    """Streaming response whose body fails partway through.
+    """
+    status_code = 200
+    headers = {}
+
+    def raise_for_status(self):
+        pass
+
+    def iter_content(self, size):
+        yield b'GIF89a'
+        raise IOError('Connection reset')
+
+    def close(self):
+        pass
+
+class Flags(unittest.TestCase):
+    def setUp(self):
+        self.path = tempfile.mkdtemp()
+        self.factbookUrl = factbook.FACTBOOK_URL
+
+    def tearDown(self):
+        factbook.FACTBOOK_URL = self.factbookUrl
+        shutil.rmtree(self.path)
+
+    def _getFlags(self, site):
+        with server.StandIn(site) as si:
+            site.standIn = si
+            factbook.FACTBOOK_URL = si.url.rstrip('/')
+            manifest = factbook.getFlags(self.path, workers=1)
+        return dict((flag['name'], flag) for flag in manifest), si
+
+    def test_getFlags(self):
+        flags, _ = self._getFlags(_Site())
+        self.assertEqual(flags['us']['status'], 'downloaded')
+        self.assertEqual(flags['us']['bytes'], len(FLAGS['us']))
+        with open(flags['fr']['path'], 'rb') as f:
+            self.assertEqual(f.read(), FLAGS['fr'])
+        self.assertEqual(os.path.getmtime(flags['fr']['path']), utils.mktime_tz(utils.parsedate_tz(MODIFIED)))
+        self.assertEqual(flags['zz']['status'], 'failed')
+        self.assertTrue('404' in flags['zz']['error'])
+        self.assertFalse(os.path.exists(flags['zz']['path']))
+
+        # Re-run: local copies are revalidated, not downloaded again
+        flags, si = self._getFlags(_Site())
+        self.assertEqual([flags[n]['status'] for n in ['us', 'fr', 'zz']], ['unchanged', 'unchanged', 'failed'])
+        self.assertEqual(flags['us']['bytes'], len(FLAGS['us']))
+        self.assertTrue(all('If-Modified-Since' in headers for path, _, headers in si.requests if 'us-' in path or 'fr-' in path))
+        self.assertEqual(sorted(os.listdir(self.path)), ['fr.gif', 'us.gif'])
+
+    def test_checksum(self):
+        # A changed timestamp alone leaves an identical file marked unchanged
+        flags, _ = self._getFlags(_Site())
+        os.utime(flags['fr']['path'], (0, 0))
+        flags, _ = self._getFlags(_Site())
+        self.assertEqual(flags['fr']['status'], 'unchanged')
+
+    def test_partial(self):
+        flag = {'name': 'us', 'url': 'http://localhost/us.gif', 'path': os.path.join(self.path, 'us.gif')}
+        get = factbook.fetch.get
+        factbook.fetch.get = lambda *args, **kwargs: _Truncated()
+        try:
+            self.assertRaises(IOError, factbook._getFlag, flag)
+        finally:
+            factbook.fetch.get = get
+        self.assertEqual(os.listdir(self.path), [])
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,91 @@
+"""Test cases for the on-disk response cache, against a local stand-in server
+"""
+
+import os
+import shutil
+import tempfile
+import unittest
+import requests
+from scrapese import httpcache
+from scrapese.test import server
+
+class ResponseCache(unittest.TestCase):
+    def setUp(self):
+        self.path = tempfile.mkdtemp()
+        self.session = requests.Session()
+        self.pages = {}
+        self.standIn = server.StandIn(self._serve)
+        self.standIn.__enter__()
+
+    def tearDown(self):
+        self.standIn.__exit__()
+        self.session.close()
+        shutil.rmtree(self.path)
+
+    def _serve(self, path, query):
+        body = self.pages.get(path)
+        if body is None:
+            return 404, {}, ''
+        etag = '"%s"' % httpcache._hash(body.encode('utf-8'))
+        if self.standIn.requests[-1][2].get('If-None-Match') == etag:
+            return 304, {'ETag': etag}, ''
+        return 200, {'ETag': etag, 'Content-Type': 'text/html'}, body
+
+    def _getCache(self, **kwargs):
+        return httpcache.ResponseCache(self.path, **kwargs)
+
+    def test_ttl(self):
+        self.pages['/a'] = 'alpha'
+        cache = self._getCache(defaultTtl=3600)
+        res = cache.get(self.session, self.standIn.url + 'a')
+        self.assertEqual(res.text, 'alpha')
+        self.assertFalse(getattr(res, 'fromCache', False))
+        res = cache.get(self.session, self.standIn.url + 'a')
+        self.assertEqual(res.text, 'alpha')
+        self.assertTrue(res.fromCache)
+        self.assertEqual(len(self.standIn.requests), 1)
+
+    def test_revalidation(self):
+        self.pages['/a'] = 'alpha'
+        cache = self._getCache(defaultTtl=0)
+        cache.get(self.session, self.standIn.url + 'a')
+        res = cache.get(self.session, self.standIn.url + 'a')
+        self.assertEqual(res.text, 'alpha')
+        self.assertTrue(res.revalidated)
+        self.assertTrue('If-None-Match' in self.standIn.requests[-1][2])
+        self.pages['/a'] = 'beta'
+        res = cache.get(self.session, self.standIn.url + 'a')
+        self.assertEqual(res.text, 'beta')
+        self.assertFalse(getattr(res, 'fromCache', False))
+        self.assertEqual(len(self.standIn.requests), 3)
+
+    def test_eviction(self):
+        names = ['/%u' % i for i in range(12)]
+        for name in names:
+            self.pages[name] = os.urandom(256).hex()
+        cache = self._getCache(maxBytes=2048, defaultTtl=3600)
+        for name in names:
+            cache.get(self.session, self.standIn.url + name[1:])
+            cache.get(self.session, self.standIn.url + '0')
+        self.assertTrue(cache.getSize() <= 2048)
+        self.assertTrue(httpcache.getKey(self.standIn.url + '0') in cache.index)
+        self.assertFalse(httpcache.getKey(self.standIn.url + '1') in cache.index)
+        self.assertTrue(httpcache.getKey(self.standIn.url + '11') in cache.index)
+        blobs = set(meta['digest'] for meta in cache.index.values())
+        self.assertEqual(cache.getSize(), sum(os.path.getsize(cache._getBlobPath(d)) for d in blobs))
+        cache.flush()
+        self.assertEqual(self._getCache(maxBytes=2048).getSize(), cache.getSize())
+
+    def test_missingBlob(self):
+        self.pages['/a'] = 'alpha'
+        cache = self._getCache(defaultTtl=3600)
+        cache.get(self.session, self.standIn.url + 'a')
+        key = httpcache.getKey(self.standIn.url + 'a')
+        os.remove(cache._getBlobPath(cache.index[key]['digest']))
+        res = cache.get(self.session, self.standIn.url + 'a')
+        self.assertEqual(res.text, 'alpha')
+        self.assertEqual(len(self.standIn.requests), 2)
+        self.assertTrue(os.path.isfile(cache._getBlobPath(cache.index[key]['digest'])))
+
+if __name__ == '__main__':
+    unittest.main()
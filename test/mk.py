@@ -0,0 +1,74 @@
+"""Test cases for the shared markup parsing, under each parser backend
+"""
+
+import sys
+import importlib
+import unittest
+from scrapese import markup
+
+try:
+    import lxml
+except ImportError:
+    lxml = None
+
+PAGE = """<html><body>
+<table class="infobox vcard"><tr><th>Height</th><td>110.6 m</td></tr></table>
+<table class="wikitable sortable"><tr><th>Flight</th></tr><tr><td>AS-501</td></tr></table>
+<table class="wikitable-like"><tr><td>Not a wikitable</td></tr></table>
+<div id="col1"><p>Lead</div>
+</body></html>"""
+
+class Parser(unittest.TestCase):
+    def tearDown(self):
+        sys.modules.pop('lxml', None)
+        if lxml is not None:
+            sys.modules['lxml'] = lxml
+        importlib.reload(markup)
+
+    @unittest.skipIf(lxml is None, 'lxml is not installed')
+    def test_lxml(self):
+        importlib.reload(markup)
+        self.assertEqual(markup.parser, 'lxml')
+        self.assertEqual(markup.getSoup(PAGE).builder.NAME, 'lxml')
+
+    def test_fallback(self):
+        sys.modules['lxml'] = None # makes the import fail
+        importlib.reload(markup)
+        self.assertEqual(markup.parser, 'html.parser')
+        self.assertEqual(markup.getSoup(PAGE).builder.NAME, 'html.parser')
+
+class Strain(unittest.TestCase):
+    def _getParsers(self):
+        return ['html.parser'] + (['lxml'] if lxml is not None else [])
+
+    def test_hasClass(self):
+        pattern = markup.hasClass('wikitable')
+        self.assertTrue(pattern.search('wikitable') is not None)
+        self.assertTrue(pattern.search('wikitable sortable') is not None)
+        self.assertTrue(pattern.search('sortable  wikitable') is not None)
+        self.assertTrue(pattern.search('wikitable-like') is None)
+        self.assertTrue(markup.hasClass('a.b').search('axb') is None)
+
+    def test_strain(self):
+        results = []
+        for parser in self._getParsers():
+            soup = markup.getSoup(PAGE, markup.strain('table', class_=markup.hasClass('wikitable')), parser)
+            tables = soup.find_all('table')
+            results.append([t.get_text(' ', strip=True) for t in tables])
+            soup = markup.getSoup(PAGE, markup.strain('div', attrs={'id': 'col1'}), parser)
+            results.append([d.get_text(strip=True) for d in soup.find_all('div')])
+        self.assertEqual(results[0], ['Flight AS-501'])
+        self.assertEqual(results[1], ['Lead'])
+        self.assertEqual(results[2:], results[0:2] if lxml is not None else [])
+
+    def test_defaults(self):
+        # Strainers must not share (or change) attribute dictionaries
+        attrs = {'id': 'col1'}
+        markup.strain('div', attrs, class_='lead')
+        self.assertEqual(attrs, {'id': 'col1'})
+        markup.strain('table', class_=markup.hasClass('infobox'))
+        soup = markup.getSoup(PAGE, markup.strain('table'), 'html.parser')
+        self.assertEqual(len(soup.find_all('table')), 3)
+
+if __name__ == '__main__':
+    unittest.main()
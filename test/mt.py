@@ -0,0 +1,53 @@
+"""Test cases for pipeline instrumentation, run against a local stand-in server
+"""
+
+import json
+import unittest
+from scrapese import metrics, simbad
+from scrapese.test import server
+
+def _handle(path, query):
+    return 200, {'Content-Type': 'text/plain'}, 'HD 48915\nNAME Sirius\n'
+
+class Metrics(unittest.TestCase):
+    def setUp(self):
+        self.simbadUrl = simbad.simbadUrl
+        self.events = []
+        metrics.reset()
+        metrics.addSink(self.events.append)
+
+    def tearDown(self):
+        simbad.simbadUrl = self.simbadUrl
+        metrics.removeSink(self.events.append)
+        metrics.reset()
+
+    def test_stages(self):
+        with server.StandIn(_handle) as si:
+            simbad.simbadUrl = si.url
+            simbad.getIds('HD 48915')
+        host = si.url.split('/')[2]
+        records = dict((r['stage'], r) for r in metrics.registry.getRecords())
+        self.assertEqual(records['fetch']['module'], 'simbad')
+        self.assertEqual(records['fetch']['host'], host)
+        self.assertEqual(records['fetch']['bytes'], 21)
+        self.assertEqual(records['extract']['host'], host)
+        self.assertEqual([e['stage'] for e in self.events], ['fetch', 'extract'])
+
+    def test_errors(self):
+        def _fail():
+            with metrics.timer('extract', host='example.com'):
+                raise ValueError('bad markup')
+        self.assertRaises(ValueError, _fail)
+        record = metrics.registry.getRecords()[0]
+        self.assertEqual(record['module'], 'mt')
+        self.assertEqual(record['errors'], 1)
+
+    def test_export(self):
+        metrics.record('fetch', 0.25, module='wm', host='en.wikipedia.org', bytes=1024, cache='hit')
+        text = metrics.toPrometheus()
+        self.assertTrue('scrapese_bytes_total{module="wm",host="en.wikipedia.org",stage="fetch"} 1024' in text)
+        self.assertTrue('scrapese_cache_total{module="wm",host="en.wikipedia.org",outcome="hit"} 1' in text)
+        self.assertEqual(json.loads(metrics.toJson())[0]['seconds'], 0.25)
+
+if __name__ == '__main__':
+    unittest.main()
@@ -2,8 +2,39 @@
    from NewEgg.com
 """
 
+import os
+import json
+import shutil
+import tempfile
 import unittest
 from scrapese import newegg
+from scrapese.test import server
+
+ITEM = """<div class="itemCell"><a title="View Details" href="Product.aspx?Item=%s"><span>Item %s</span></a></div>"""
+
+PRODUCT = """<html><body><h1 id="grpDescrip_h">Item %s</h1>
+<div id="frmSeller">{"price":%u.99,"currency":"USD"}</div>
+<div id="Specs"><dl><dt>Brand</dt><dd>Intel</dd></dl><dl><dt>Socket</dt><dd>LGA 1150</dd></dl></div>
+</body></html>"""
+
+class _Catalog(object):
+    """Stand-in listing of products in pages of three, repeating the last page
+       past the end (as the site does), with products that can be made to fail.
+    """
+
+    def __init__(self, codes):
+        self.codes = codes
+        self.failing = set()
+
+    def __call__(self, path, query):
+        if path.endswith('ProductList.aspx'):
+            pages = [self.codes[n:n+3] for n in range(0, len(self.codes), 3)]
+            page = pages[min(int(query['Page']), len(pages)) - 1]
+            return 200, {'Content-Type': 'text/html'}, '<html><body>%s</body></html>' % ''.join(ITEM % (c, c) for c in page)
+        code = query['Item']
+        if code in self.failing:
+            return 200, {'Content-Type': 'text/html'}, '<html><body>Unavailable</body></html>'
+        return 200, {'Content-Type': 'text/html'}, PRODUCT % (code, self.codes.index(code) + 100)
 
 class Systems(unittest.TestCase):
     def test_resolve(self):
@@ -41,6 +72,117 @@ class Graphics(unittest.TestCase):
         model = newegg.query(url)
         self.assertEquals(model['Form Factor'], 'ATX')
         
+class Crawl(unittest.TestCase):
+    def setUp(self):
+        self.path = tempfile.mkdtemp()
+        self.settings = newegg.baseUrl, newegg.entriesPerScrape, newegg.checkpointEvery
+        newegg.entriesPerScrape = 3
+        newegg.checkpointEvery = 1
+
+    def tearDown(self):
+        newegg.baseUrl, newegg.entriesPerScrape, newegg.checkpointEvery = self.settings
+        shutil.rmtree(self.path)
+
+    def test_resume(self):
+        catalog = _Catalog(['A', 'B', 'C', 'D', 'E', 'F', 'G'])
+        catalog.failing.add('B')
+        checkpointPath = os.path.join(self.path, 'crawl.json')
+        succeeded = []
+        with server.StandIn(catalog) as si:
+            newegg.baseUrl = si.url
+            crawl = newegg.crawl('processors', workers=1, checkpointPath=checkpointPath)
+            failed = []
+            for url, specs, error in crawl:
+                if error is not None:
+                    failed.append(url)
+                else:
+                    succeeded.append(specs['title'])
+                if len(succeeded) + len(failed) == 4:
+                    break
+            crawl.close()
+            with open(checkpointPath, 'r') as f:
+                checkpoint = json.load(f)
+            self.assertEqual(failed, [newegg.getUrl('B')])
+            self.assertTrue('B' in checkpoint['pending'])
+            self.assertEqual(sorted(checkpoint['done']), sorted(t.split()[1] for t in succeeded))
+            catalog.failing.clear()
+            listed = len([r for r in si.requests if r[0].endswith('ProductList.aspx')])
+            results = list(newegg.crawl('processors', workers=1, checkpointPath=checkpointPath))
+            pages = [int(r[1]['Page']) for r in si.requests[listed:] if r[0].endswith('ProductList.aspx')]
+        self.assertTrue(all(error is None for _, _, error in results))
+        succeeded += [specs['title'] for _, specs, _ in results]
+        self.assertEqual(sorted(succeeded), ['Item ' + c for c in catalog.codes])
+        self.assertTrue(1 not in pages)
+        with open(checkpointPath, 'r') as f:
+            self.assertEqual(json.load(f)['pending'], [])
+
+PARTS = [
+    ('processors', 'cpu1', {'title': 'Core i7', 'price': 329.99, 'CPU Socket Type': 'LGA 1150', 'Thermal Design Power': '88W', 'Memory Type': 'DDR3 1333/1600'}),
+    ('processors', 'cpu2', {'title': 'Ryzen 5', 'price': 199.99, 'CPU Socket Type': 'Socket AM4', 'Thermal Design Power': '65 W'}),
+    ('motherboard', 'mb1', {'title': 'Z97 Board', 'price': 149.99, 'CPU Socket Type': 'LGA1150', 'Form Factor': 'ATX', 'Memory Standard': 'DDR3 1600 / DDR3 1333'}),
+    ('motherboard', 'mb2', {'title': 'B450 Board', 'price': 89.99, 'CPU Socket Type': 'AM4', 'Form Factor': 'Micro ATX', 'Memory Standard': 'DDR4 3200'}),
+    ('motherboard', 'mb3', {'title': 'H97 Board', 'price': 99.99, 'CPU Socket Type': 'LGA 1150', 'Form Factor': 'Mini-ITX', 'Memory Standard': 'DDR3'}),
+    ('case', 'case1', {'title': 'Tower', 'price': 79.99, 'Motherboard Compatibility': 'ATX / Micro-ATX / Mini-ITX'}),
+    ('case', 'case2', {'title': 'Cube', 'price': 59.99, 'Motherboard Compatibility': 'Mini ITX'}),
+    ('memory', 'ram1', {'title': 'DDR3 Kit', 'price': 49.99, 'Type': '240-Pin DDR3 SDRAM'}),
+    ('memory', 'ram2', {'title': 'DDR4 Kit', 'price': 69.99, 'Type': '288-Pin DDR4 SDRAM'})
+]
+
+class Components(unittest.TestCase):
+    def setUp(self):
+        self.path = tempfile.mkdtemp()
+        self.db = newegg.ComponentDb(os.path.join(self.path, 'newegg.db'))
+        self.db.addMany(PARTS)
+
+    def tearDown(self):
+        self.db.close()
+        shutil.rmtree(self.path)
+
+    def _getTitles(self, records):
+        return [r['title'] for r in records]
+
+    def test_normalize(self):
+        fields = newegg.normalize(PARTS[0][2])
+        self.assertEqual(fields['socket'], ['LGA1150'])
+        self.assertEqual(fields['wattage'], 88.)
+        self.assertEqual(fields['memoryType'], ['DDR3'])
+        self.assertEqual(fields['price'], 329.99)
+        self.assertEqual(newegg.normalize(PARTS[1][2])['socket'], ['AM4'])
+        self.assertEqual(newegg.normalize(PARTS[5][2])['formFactor'], ['ATX', 'MICRO ATX', 'MINI ITX'])
+        self.assertEqual(newegg.normalize(PARTS[8][2])['memoryType'], ['DDR4'])
+        fields = newegg.normalize({'title': 'Fan'})
+        self.assertEqual((fields['socket'], fields['formFactor'], fields['wattage']), ([], [], None))
+
+    def test_find(self):
+        self.assertEqual(self._getTitles(self.db.find('motherboard')), ['B450 Board', 'H97 Board', 'Z97 Board'])
+        self.assertEqual(self._getTitles(self.db.find('motherboard', socket='Socket LGA 1150')), ['H97 Board', 'Z97 Board'])
+        self.assertEqual(self._getTitles(self.db.find('motherboard', socket='LGA1150', maxPrice=120)), ['H97 Board'])
+        self.assertEqual(self._getTitles(self.db.find('motherboard', formFactor=['micro-atx', 'ATX'])), ['B450 Board', 'Z97 Board'])
+        self.assertEqual(self._getTitles(self.db.find('processors', minWattage=80)), ['Core i7'])
+        self.assertEqual(self.db.find('motherboard', socket='unknown'), [])
+        self.assertRaises(Exception, self.db.find, 'motherboard', color='red')
+
+    def test_findCompatible(self):
+        cpu = self.db.get('cpu1')
+        self.assertEqual(self._getTitles(self.db.findCompatible('motherboard', [cpu])), ['H97 Board', 'Z97 Board'])
+        board = self.db.get('mb3')
+        self.assertEqual(self._getTitles(self.db.findCompatible('case', [board])), ['Cube', 'Tower'])
+        self.assertEqual(self._getTitles(self.db.findCompatible('memory', [board])), ['DDR3 Kit'])
+        case = self.db.get('case2')
+        self.assertEqual(self._getTitles(self.db.findCompatible('motherboard', [cpu, case])), ['H97 Board'])
+        self.assertEqual(self.db.findCompatible('motherboard', [self.db.get('cpu2'), case]), [])
+
+    def test_storedFields(self):
+        row = self.db.db.execute('SELECT fields FROM components WHERE url = ?', ('case1',)).fetchone()
+        self.assertEqual(json.loads(row[0])['formFactor'], ['ATX', 'MICRO ATX', 'MINI ITX'])
+        self.db.db.execute('UPDATE components SET fields = NULL')
+        self.assertEqual(self.db.get('case1')['formFactor'], ['ATX', 'MICRO ATX', 'MINI ITX'])
+
+    def test_replace(self):
+        self.db.add('motherboard', 'mb3', {'title': 'H97 Board', 'price': 99.99, 'CPU Socket Type': 'AM4', 'Form Factor': 'Mini-ITX'})
+        self.assertEqual(self.db.get('mb3')['socket'], ['AM4'])
+        self.assertEqual(self._getTitles(self.db.find('motherboard', socket='LGA1150')), ['Z97 Board'])
+
 if __name__ == '__main__':
     unittest.main()
    
\ No newline at end of file
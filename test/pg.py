@@ -0,0 +1,70 @@
+"""Test cases for batch SGP4 propagation, compared with sgp4's per-satellite
+   propagation
+"""
+
+import datetime
+import unittest
+import numpy as np
+from sgp4.api import Satrec, WGS72
+from scrapese import propagate
+
+ISS = [
+    'ISS (ZARYA)',
+    '1 25544U 98067A   19343.69339541  .00001764  00000-0  38792-4 0  9991',
+    '2 25544  51.6439 211.2001 0007417  17.6667  85.6398 15.50103472202482'
+]
+
+def _getSatrec(k, ecco=0.001, no=0.0675):
+    satrec = Satrec()
+    satrec.sgp4init(WGS72, 'i', k, 25545.5, 2.8e-5, 0.0, 0.0, ecco, 1.0 + 0.3 * k, 0.2 + 0.1 * k, 0.5 * k, no * (1 - 0.04 * k), 0.2 * k)
+    return satrec
+
+def _getCatalog():
+    # Orbits of varied shape, one with its perigee inside the Earth (which
+    # fails to propagate), and one given as TLE lines
+    satrecs = [_getSatrec(k) for k in range(7)] + [_getSatrec(7, ecco=0.6), _getSatrec(8, ecco=0.3, no=0.01)]
+    return satrecs + [ISS]
+
+class Propagate(unittest.TestCase):
+    def setUp(self):
+        self.catalog = _getCatalog()
+        start = datetime.datetime(2019, 12, 10)
+        self.jd, self.fr = propagate.getTimes(start, start + datetime.timedelta(hours=6), 600.0)
+
+    def test_getTimes(self):
+        self.assertEqual(len(self.jd), 37)
+        self.assertTrue(np.all(self.fr >= 0) and np.all(self.fr < 1))
+        self.assertAlmostEqual((self.jd[-1] + self.fr[-1]) - (self.jd[0] + self.fr[0]), 0.25, places=9)
+
+    def test_matchesSgp4(self):
+        e, r, v = propagate.propagate(self.catalog, self.jd, self.fr)
+        self.assertEqual(e.shape, (len(self.catalog), len(self.jd)))
+        self.assertEqual(r.shape, (len(self.catalog), len(self.jd), 3))
+        for n, tle in enumerate(self.catalog):
+            se, sr, sv = propagate.getSatrec(tle).sgp4_array(self.jd, self.fr)
+            np.testing.assert_array_equal(e[n], se)
+            np.testing.assert_array_equal(r[n], sr)
+            np.testing.assert_array_equal(v[n], sv)
+        self.assertEqual(list(np.flatnonzero(np.any(e != 0, axis=1))), [7])
+        self.assertFalse(np.any(np.isnan(r[e == 0])))
+
+    def test_chunks(self):
+        expected = propagate.propagate(self.catalog, self.jd, self.fr)
+        for chunkSize in [1, 3, 4, len(self.catalog), len(self.catalog) + 1]:
+            results = propagate.propagate(self.catalog, self.jd, self.fr, chunkSize)
+            for a, b in zip(expected, results):
+                np.testing.assert_array_equal(a, b)
+        starts = [start for start, _, _, _ in propagate.propagateChunks(self.catalog, self.jd, self.fr, 4)]
+        self.assertEqual(starts, [0, 4, 8])
+
+    def test_propagateAt(self):
+        when = datetime.datetime(2019, 12, 10, 1, 30)
+        e, r, v = propagate.propagateAt(self.catalog, when)
+        self.assertEqual(r.shape, (len(self.catalog), 3))
+        _, sr, _ = propagate.getSatrec(ISS).sgp4_array(*propagate.getTimes(when, when, 1.0))
+        np.testing.assert_array_equal(r[-1], sr[0])
+        e, r, v = propagate.propagateAt([ISS])
+        self.assertEqual(e.shape, (1,))
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,45 @@
+"""Test cases for the fetch/parse pipeline, comparing its models with those of
+   the synchronous queries against recorded fixtures
+"""
+
+import functools
+import unittest
+from scrapese import metrics, newegg, pipeline, wm
+from scrapese.test import replay
+
+class Pipeline(unittest.TestCase):
+    @classmethod
+    def setUpClass(cls):
+        cls.pool = pipeline.getPool(2)
+
+    @classmethod
+    def tearDownClass(cls):
+        cls.pool.shutdown()
+
+    def test_newegg(self):
+        with replay.Replay('newegg') as rp:
+            urls = [newegg.getUrl(code) for code in newegg._getList('Devil Canyon', 'processors')]
+            expected = dict((url, newegg.query(url)) for url in urls)
+            metrics.reset()
+            models = pipeline.query(newegg.readProduct, urls, fetchWorkers=4, pool=self.pool)
+        self.assertEqual(models, expected)
+        self.assertEqual(rp.misses, [])
+        stages = dict((r['stage'], r) for r in metrics.registry.getRecords() if r['module'] == 'newegg')
+        self.assertEqual(stages['parse']['calls'], len(urls))
+        self.assertEqual(stages['extract']['host'], 'www.newegg.com')
+
+    def test_table(self):
+        url = 'https://en.wikipedia.org/?curid=27715'
+        with replay.Replay('wm'):
+            expected = wm.getTable(url, 0)
+            models = pipeline.query(functools.partial(wm.readTable, table=0), [url] * 4, pool=self.pool)
+        self.assertEqual(models[url], expected)
+
+    def test_errors(self):
+        with replay.Replay('newegg'):
+            results = list(pipeline.imap(newegg.readProduct, [newegg.getUrl('missing'), 'http://www.newegg.com/'], pool=self.pool, window=1))
+        self.assertEqual(len(results), 2)
+        self.assertTrue(all(error is not None for _, _, error in results))
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,142 @@
+"""Record/replay layer for exercising scraper modules without the network.
+   Responses are captured (while recording) into one JSON fixture file per
+   module under test/fixtures/, keyed by host, path, and sorted query, and
+   later served from a local stand-in server that fetch redirects every
+   recorded host to.
+"""
+
+import os
+import json
+import base64
+import requests
+from scrapese import fetch, scheduler
+from scrapese.test import server
+
+try:
+    from urllib.parse import urlparse, parse_qsl, urlencode
+except ImportError:
+    from urlparse import urlparse, parse_qsl
+    from urllib import urlencode
+
+fixturePath = os.path.join(os.path.dirname(os.path.realpath(__file__)), 'fixtures')
+storedHeaders = ['Content-Type', 'ETag', 'Last-Modified']
+
+def getFixturePath(name):
+    return os.path.join(fixturePath, name + '.json')
+
+def _getKey(netloc, path, query):
+    key = netloc.lower() + path
+    if len(query) > 0:
+        key += '?' + urlencode(sorted(query.items()))
+    return key
+
+def getKey(url, params=None):
+    """Returns the fixture key for a request, matching the key the stand-in
+       server derives from the redirected request (single-valued, non-blank
+       query parameters, in sorted order).
+    """
+    url = requests.Request('GET', url, params=params).prepare().url
+    pr = urlparse(url)
+    query = {}
+    for k, v in parse_qsl(pr.query):
+        query.setdefault(k, v)
+    return _getKey(pr.netloc, pr.path or '/', query)
+
+def loadFixtures(name):
+    path = getFixturePath(name)
+    if not os.path.isfile(path):
+        return {}
+    with open(path, 'r') as f:
+        return json.load(f)
+
+def saveFixtures(name, fixtures):
+    if not os.path.isdir(fixturePath):
+        os.makedirs(fixturePath)
+    with open(getFixturePath(name), 'w') as f:
+        json.dump(fixtures, f, indent=1, sort_keys=True)
+
+def _getBody(entry):
+    if entry.get('encoding') == 'base64':
+        return base64.b64decode(entry['body'])
+    return entry['body'].encode('utf-8')
+
+class Recorder(object):
+    """Captures every response returned by fetch.get() while used as a context
+       manager, merging them into the named fixture file on exit.
+    """
+
+    def __init__(self, name):
+        self.name = name
+        self.fixtures = {}
+
+    def record(self, url, params, res):
+        entry = {
+            'status': res.status_code,
+            'headers': dict((k, res.headers[k]) for k in storedHeaders if k in res.headers)
+        }
+        try:
+            entry['body'] = res.content.decode('utf-8')
+        except UnicodeDecodeError:
+            entry['body'] = base64.b64encode(res.content).decode('ascii')
+            entry['encoding'] = 'base64'
+        self.fixtures[getKey(url, params)] = entry
+
+    def __enter__(self):
+        self.get = fetch.get
+        def _get(url, **kwargs):
+            res = self.get(url, **kwargs)
+            self.record(url, kwargs.get('params'), res)
+            return res
+        fetch.get = _get
+        return self
+
+    def __exit__(self, *args):
+        fetch.get = self.get
+        if len(self.fixtures) > 0:
+            fixtures = loadFixtures(self.name)
+            fixtures.update(self.fixtures)
+            saveFixtures(self.name, fixtures)
+
+class Replay(object):
+    """Serves the named fixtures from a local stand-in server while used as a
+       context manager, with fetch redirecting every recorded host to it, and
+       its response cache and the recorded hosts' rate limits set aside (the
+       stand-in is not the live site). Requests with no fixture get a 404 and
+       are listed in misses.
+    """
+
+    def __init__(self, name):
+        self.name = name
+        self.fixtures = loadFixtures(name)
+        self.misses = []
+        self.standIn = server.StandIn(self.handle)
+
+    def handle(self, path, query):
+        key = _getKey('', path.lstrip('/'), query)
+        entry = self.fixtures.get(key)
+        if entry is None:
+            self.misses.append(key)
+            return 404, {'Content-Type': 'text/plain'}, 'No fixture for "%s"' % key
+        return entry['status'], entry['headers'], _getBody(entry)
+
+    def getHosts(self):
+        return sorted(set(key.split('/', 1)[0] for key in self.fixtures))
+
+    def __enter__(self):
+        self.standIn.__enter__()
+        self.hostOverrides = dict(fetch.hostOverrides)
+        self.responseCache = fetch.responseCache
+        fetch.responseCache = None
+        fetch.hostOverrides.update((host, self.standIn.url) for host in self.getHosts())
+        self.hostLimits = scheduler.hostLimits
+        scheduler.hostLimits = {}
+        scheduler.reset()
+        return self
+
+    def __exit__(self, *args):
+        fetch.hostOverrides.clear()
+        fetch.hostOverrides.update(self.hostOverrides)
+        fetch.responseCache = self.responseCache
+        scheduler.hostLimits = self.hostLimits
+        scheduler.reset()
+        self.standIn.__exit__(*args)
@@ -0,0 +1,40 @@
+"""Test cases for the record/replay layer, recording from a local stand-in
+   server in place of a live site
+"""
+
+import os
+import tempfile
+import unittest
+from scrapese import fetch
+from scrapese.test import replay, server
+
+def _handle(path, query):
+    return 200, {'Content-Type': 'text/plain', 'ETag': '"v1"'}, 'path=%s item=%s' % (path, query.get('item', ''))
+
+class RecordReplay(unittest.TestCase):
+    def setUp(self):
+        self.fixturePath = replay.fixturePath
+        replay.fixturePath = tempfile.mkdtemp()
+
+    def tearDown(self):
+        replay.fixturePath = self.fixturePath
+
+    def test_roundTrip(self):
+        with server.StandIn(_handle) as si:
+            with replay.Recorder('site') as rec:
+                live = fetch.get(si.url + 'list', params={'item': 'b', 'page': 1}).text
+                fetch.get(si.url + 'item?x=1')
+        self.assertEqual(len(rec.fixtures), 2)
+        self.assertTrue(os.path.isfile(replay.getFixturePath('site')))
+        with replay.Replay('site') as rp:
+            res = fetch.get(si.url + 'list?page=1&item=b')
+            missing = fetch.get(si.url + 'other')
+        self.assertEqual(res.text, live)
+        self.assertEqual(res.headers['ETag'], '"v1"')
+        self.assertEqual(missing.status_code, 404)
+        self.assertEqual(len(rp.misses), 1)
+        self.assertEqual(len(rp.standIn.requests), 2)
+        self.assertEqual(fetch.hostOverrides, {})
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,64 @@
+"""Test cases for SIMBAD cross-identification, run against a local stand-in
+   server
+"""
+
+import os
+import shutil
+import tempfile
+import unittest
+from scrapese import simbad
+from scrapese.test import server
+
+IDS = {
+    'SAO 151881': ['* alf CMa', 'HD 48915', 'HIP 32349', 'NAME Sirius'],
+    'HD 48915': ['* alf CMa', 'HD 48915', 'HIP 32349', 'NAME Sirius']
+}
+
+def _handle(path, query):
+    ident = query['script'].splitlines()[-1].replace('query id ', '')
+    if ident not in IDS:
+        return 200, {}, '::error::::::::::::::::::::::::::::::::::::::::::::::::::::::::::::::\n\n[3] Identifier not found in the database : %s\n' % ident
+    return 200, {'Content-Type': 'text/plain'}, '\n'.join(IDS[ident]) + '\n'
+
+class CrossMatch(unittest.TestCase):
+    def setUp(self):
+        self.simbadUrl = simbad.simbadUrl
+        self.cachePath = simbad.cachePath
+        self.path = tempfile.mkdtemp()
+        simbad.cachePath = os.path.join(self.path, 'simbad.json')
+        simbad._cache = None
+
+    def tearDown(self):
+        simbad.simbadUrl = self.simbadUrl
+        simbad.cachePath = self.cachePath
+        simbad._cache = None
+        shutil.rmtree(self.path)
+
+    def test_getIds(self):
+        with server.StandIn(_handle) as si:
+            simbad.simbadUrl = si.url
+            ids = simbad.getIds('SAO 151881')
+        self.assertEqual(ids['HD'], '48915')
+        self.assertEqual(ids['NAME'], 'Sirius')
+        self.assertEqual(si.requests[0][0], '/sim-script')
+
+    def test_crossMatch(self):
+        with server.StandIn(_handle) as si:
+            simbad.simbadUrl = si.url
+            results = dict((i, (ids, e)) for i, ids, e in simbad.crossMatch(['SAO 151881', 'HD 48915', 'SAO 1', 'SAO 151881']))
+            self.assertEqual(results['HD 48915'][0]['HIP'], '32349')
+            self.assertTrue(results['SAO 1'][1] is not None)
+            self.assertEqual(len(si.requests), 3)
+            results = list(simbad.crossMatch(['SAO  151881', 'HD 48915']))
+            self.assertEqual(len(si.requests), 3)
+            self.assertEqual(sorted(i for i, _, _ in results), ['HD 48915', 'SAO  151881'])
+            idents = ['HD  48915', 'SAO 2', 'SAO\t2', 'SAO 2']
+            matches = list(simbad.crossMatch(idents))
+            self.assertEqual(len(si.requests), 4)
+        self.assertTrue(all(e is None for _, _, e in results))
+        self.assertEqual(sorted(i for i, _, _ in matches), sorted(idents))
+        self.assertEqual([e is not None for i, _, e in matches if i != 'HD  48915'], [True] * 3)
+        self.assertTrue(os.path.isfile(simbad.cachePath))
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,102 @@
+"""Test cases for per-host request scheduling, run against local stand-in
+   servers
+"""
+
+import time
+import threading
+import unittest
+from scrapese import fetch, scheduler
+from scrapese.test import server
+
+class Throttled(object):
+    """Handler answering the first few requests with 429, then 200, and
+       tracking how many requests it is serving at once.
+    """
+
+    def __init__(self, failures=0, retryAfter=None, delay=0.0):
+        self.failures = failures
+        self.retryAfter = retryAfter
+        self.delay = delay
+        self.lock = threading.Lock()
+        self.active = 0
+        self.peak = 0
+        self.times = []
+
+    def __call__(self, path, query):
+        with self.lock:
+            self.times.append(time.monotonic())
+            self.active += 1
+            self.peak = max(self.peak, self.active)
+            isThrottled = self.failures > 0
+            self.failures -= 1
+        time.sleep(self.delay)
+        with self.lock:
+            self.active -= 1
+        if isThrottled:
+            headers = {} if self.retryAfter is None else {'Retry-After': self.retryAfter}
+            return 429, headers, 'slow down'
+        return 200, {'Content-Type': 'text/plain'}, 'ok'
+
+class Scheduling(unittest.TestCase):
+    def setUp(self):
+        self.hostLimits = scheduler.hostLimits
+        self.backoffBase = scheduler.backoffBase
+        scheduler.hostLimits = {}
+        scheduler.backoffBase = 0.05
+        scheduler.reset()
+
+    def tearDown(self):
+        scheduler.hostLimits = self.hostLimits
+        scheduler.backoffBase = self.backoffBase
+        scheduler.reset()
+
+    def _limit(self, si, **limits):
+        scheduler.hostLimits[si.url.split('/')[2].split(':')[0]] = limits
+        scheduler.reset()
+
+    def test_retryAfter(self):
+        handler = Throttled(failures=2, retryAfter='1')
+        with server.StandIn(handler) as si:
+            self._limit(si, rate=100.0, burst=1)
+            t0 = time.monotonic()
+            res = fetch.get(si.url)
+            elapsed = time.monotonic() - t0
+        self.assertEqual(res.status_code, 200)
+        self.assertEqual(len(handler.times), 3)
+        self.assertTrue(elapsed >= 2.0)
+        self.assertTrue(scheduler.getScheduler(si.url.split('/')[2]).bucket.rate < 100.0)
+
+    def test_giveUp(self):
+        handler = Throttled(failures=10)
+        with server.StandIn(handler) as si:
+            res = fetch.get(si.url)
+        self.assertEqual(res.status_code, 429)
+        self.assertEqual(len(handler.times), scheduler.maxRetries + 1)
+
+    def test_concurrency(self):
+        handler = Throttled(delay=0.05)
+        with server.StandIn(handler) as si:
+            self._limit(si, concurrency=2)
+            list(fetch.imap(lambda i: fetch.get(si.url), range(8), workers=8))
+        self.assertEqual(handler.peak, 2)
+
+    def test_rate(self):
+        handler = Throttled()
+        with server.StandIn(handler) as si:
+            self._limit(si, rate=20.0, burst=1)
+            list(fetch.imap(lambda i: fetch.get(si.url), range(6), workers=6))
+        self.assertTrue(handler.times[-1] - handler.times[0] >= 0.2)
+
+    def test_independentHosts(self):
+        slow = Throttled(delay=0.2)
+        fast = Throttled()
+        with server.StandIn(slow) as ss, server.StandIn(fast) as fs:
+            scheduler.hostLimits['127.0.0.1'] = {'concurrency': 1}
+            scheduler.reset()
+            t0 = time.monotonic()
+            urls = [ss.url] * 3 + [fs.url] * 10
+            done = dict((url, time.monotonic() - t0) for url, _, _ in fetch.imap(fetch.get, urls, workers=13))
+        self.assertTrue(done[fs.url] < 0.2)
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,60 @@
+"""Local stand-in HTTP server for exercising scraper modules without reaching
+   the live sites they target.
+"""
+
+import threading
+
+try:
+    from http.server import BaseHTTPRequestHandler, HTTPServer
+    from socketserver import ThreadingMixIn
+    from urllib.parse import urlparse, parse_qs
+except ImportError:
+    from BaseHTTPServer import BaseHTTPRequestHandler, HTTPServer
+    from SocketServer import ThreadingMixIn
+    from urlparse import urlparse, parse_qs
+
+class _Server(ThreadingMixIn, HTTPServer):
+    daemon_threads = True
+
+class StandIn(object):
+    """Serves responses from the given handler on a local port, in a background
+       thread, while used as a context manager. The handler is called with the
+       request path and a dictionary of (single-valued) query parameters, and
+       returns a (status, headers, body) tuple. Requests are recorded as
+       (path, query, headers) tuples in the requests list.
+    """
+
+    def __init__(self, handler):
+        self.handler = handler
+        self.requests = []
+        standIn = self
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = 'HTTP/1.1'
+            disable_nagle_algorithm = True
+            def do_GET(self):
+                pr = urlparse(self.path)
+                query = dict((k, v[0]) for k, v in parse_qs(pr.query).items())
+                standIn.requests.append((pr.path, query, dict(self.headers.items())))
+                status, headers, body = standIn.handler(pr.path, query)
+                if not isinstance(body, bytes):
+                    body = body.encode('utf-8')
+                self.send_response(status)
+                for k, v in headers.items():
+                    self.send_header(k, v)
+                self.send_header('Content-Length', str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+            def log_message(self, *args):
+                pass
+        self.server = _Server(('127.0.0.1', 0), Handler)
+        self.url = 'http://127.0.0.1:%u/' % self.server.server_address[1]
+
+    def __enter__(self):
+        self.thread = threading.Thread(target=self.server.serve_forever)
+        self.thread.daemon = True
+        self.thread.start()
+        return self
+
+    def __exit__(self, *args):
+        self.server.shutdown()
+        self.server.server_close()
@@ -0,0 +1,38 @@
+"""Test cases for the local model store
+"""
+
+import os
+import tempfile
+import unittest
+from scrapese import store
+
+class ModelStore(unittest.TestCase):
+    def setUp(self):
+        self.store = store.ModelStore(os.path.join(tempfile.mkdtemp(), 'models.db'))
+
+    def tearDown(self):
+        self.store.close()
+
+    def test_cacheMany(self):
+        count = self.store.cacheMany('celestrak', [(25544, ['ISS (ZARYA)', '1 25544U', '2 25544']), (20580, ['HST', '1 20580U', '2 20580'])])
+        self.assertEqual(count, 2)
+        self.assertEqual(self.store.catalog('celestrak'), ['20580', '25544'])
+        self.assertEqual(self.store.get('celestrak', 25544)[0], 'ISS (ZARYA)')
+        self.assertEqual(self.store.sources(), ['celestrak'])
+
+    def test_upsert(self):
+        self.store.cache('astronautix', 'http://www.astronautix.com/s/saturnv.html', {'title': 'Saturn V'})
+        self.store.cache('astronautix', 'http://www.astronautix.com/s/saturnv.html', {'title': 'Saturn V (rev)'})
+        self.assertEqual(len(self.store.catalog('astronautix')), 1)
+        self.assertEqual(self.store.load('astronautix')['http://www.astronautix.com/s/saturnv.html']['title'], 'Saturn V (rev)')
+
+    def test_missing(self):
+        self.assertEqual(self.store.catalog('wm'), [])
+        self.assertTrue(self.store.get('wm', 'x') is None)
+        ids = [str(i) for i in range(1200)]
+        self.store.cacheMany('wm', [(i, {'i': i}) for i in ids[::2]])
+        self.assertEqual(len(self.store.getMany('wm', ids)), 600)
+        self.assertRaises(Exception, self.store.catalog, 'wm; DROP TABLE wm')
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,94 @@
+"""Test cases for WikiMedia scraping, run against a local stand-in server
+"""
+
+import json
+import datetime
+import unittest
+from scrapese import wm
+from scrapese.test import server
+
+INFOBOX = """<table class="infobox vcard"><tbody>
+<tr><th colspan="2">Saturn V</th></tr>
+<tr><th>Function</th><td>Crewed lunar launch vehicle</td></tr>
+<tr><th>Height</th><td>110.6 m (363.0 ft)<sup>[1]</sup></td></tr>
+<tr><th>Manufacturer</th><td>Boeing</td></tr>
+<tr><th>Manufacturer</th><td>North American</td></tr>
+</tbody></table>"""
+
+LIST = """<table class="wikitable"><tbody>
+<tr><th>Route</th><th>Length (km)</th><th>Opened</th><th>Note</th></tr>
+<tr><td>E40</td><td>8,000</td><td>15 March 1975</td><td>Longest</td></tr>
+<tr><td>E45</td><td>4,920[2]</td><td>1975-03-15</td><td></td></tr>
+<tr><td>E55</td><td>3.5e3</td><td>June 1, 1983</td><td>Extended</td></tr>
+</tbody></table>"""
+
+ARTICLE = "<html><body><p>Lead</p>%s<table class=\"wikitable\"><tr><th>Flight</th></tr><tr><td>1</td></tr></table></body></html>" % INFOBOX
+
+def _handle(path, query):
+    if path.endswith('api.php'):
+        text = '<div class="mw-parser-output">%s<p>Lead</p></div>' % INFOBOX
+        return 200, {'Content-Type': 'application/json'}, json.dumps({'parse': {'title': query.get('page'), 'text': text}})
+    return 200, {'Content-Type': 'text/html'}, ARTICLE
+
+class InfoBox(unittest.TestCase):
+    def test_api(self):
+        with server.StandIn(_handle) as si:
+            model = wm.getInfoBoxApi('Saturn V', si.url)
+        self.assertEqual(model['Height'], '110.6 m (363.0 ft)')
+        self.assertEqual(model['Manufacturer'], 'Boeing; North American')
+        path, query, _ = si.requests[0]
+        self.assertEqual(query['action'], 'parse')
+        self.assertEqual(query['section'], '0')
+        self.assertEqual(query['page'], 'Saturn V')
+
+    def test_matchesPage(self):
+        with server.StandIn(_handle) as si:
+            expected = wm.getInfoBox(si.url + 'wiki/Saturn_V')
+            model = wm.getInfoBoxApi('Saturn V', si.url)
+        self.assertEqual(model, expected)
+
+    def test_curid(self):
+        with server.StandIn(_handle) as si:
+            wm.getInfoBoxApi(45044, si.url)
+        self.assertEqual(si.requests[0][1]['pageid'], '45044')
+
+class Cells(unittest.TestCase):
+    def test_parseNumber(self):
+        self.assertEqual(wm.parseNumber('1,234'), 1234)
+        self.assertEqual(wm.parseNumber('-12.5[3]'), -12.5)
+        self.assertEqual(wm.parseNumber(u'\u22123'), -3)
+        self.assertEqual(wm.parseNumber('.5e2'), 50.)
+        for value in ['E40', 'e5', '1,23', '.', '12 m', '']:
+            self.assertTrue(wm.parseNumber(value) is None, value)
+
+    def test_parseDate(self):
+        self.assertEqual(wm.parseDate('1969-07-16'), datetime.date(1969, 7, 16))
+        self.assertEqual(wm.parseDate('1969-07-16T13:32'), datetime.datetime(1969, 7, 16, 13, 32))
+        self.assertEqual(wm.parseDate('July 16, 1969[4]'), datetime.date(1969, 7, 16))
+        self.assertEqual(wm.parseDate('16 Jul 1969'), datetime.date(1969, 7, 16))
+        for value in ['1969-13-01', 'Saturn V', '110.6 m']:
+            self.assertTrue(wm.parseDate(value) is None, value)
+
+    def test_inferType(self):
+        self.assertEqual(wm.inferType(['1', '2', '', '3,000']), 'number')
+        self.assertEqual(wm.inferType(['1969-07-16', 'July 20, 1969']), 'date')
+        self.assertEqual(wm.inferType(['E40', 'E45', 'e5']), 'text')
+        self.assertEqual(wm.inferType(['']), 'text')
+        self.assertEqual(wm.inferType(['1', '2', 'n/a', 'n/a']), 'text')
+        # conversions are memoized, so must not be compared with equal (but distinct) strings by identity
+        self.assertEqual(wm.inferType([''.join(['n', '/a']) for _ in range(3)]), 'text')
+
+    def test_getColumns(self):
+        table = wm._readTable(LIST, 0)
+        columns = wm.getColumns('', table)
+        self.assertEqual(list(columns.keys()), ['Route', 'Length (km)', 'Opened', 'Note'])
+        self.assertEqual(columns['Route'], ['E40', 'E45', 'E55'])
+        self.assertEqual(columns['Length (km)'], [8000, 4920, 3500.])
+        self.assertEqual(columns['Opened'], [datetime.date(1975, 3, 15), datetime.date(1975, 3, 15), datetime.date(1983, 6, 1)])
+        self.assertEqual(columns['Note'], ['Longest', '', 'Extended'])
+        arrays = wm.getColumns('', table, asArray=True)
+        self.assertEqual(str(arrays['Length (km)'].dtype), 'float64')
+        self.assertEqual(str(arrays['Opened'].dtype), 'datetime64[s]')
+
+if __name__ == '__main__':
+    unittest.main()
@@ -3,11 +3,19 @@
 """
 
 import sys
-import requests
-import bs4
+import os
 import re
 import json
+import atexit
+import asyncio
+import datetime
+import functools
+import threading
+import bs4
+import numpy as np
+from collections import OrderedDict
 from dateutil import parser
+from scrapese import afetch, data, fetch, markup, metrics
 
 def parseLatLon(text):
     """Degrees/minutes/seconds notation (including cardinal direction) parsed
@@ -31,6 +39,27 @@ def getLatLon(soup):
         lonval = -1 * lonval
     return latval, lonval
 
+infoboxStrainer = markup.strain('table', class_=markup.hasClass('infobox'))
+tableStrainer = markup.strain('table')
+wikiTableStrainer = markup.strain('table', class_=markup.hasClass('wikitable'))
+
+sampleSize = 25 # cells sampled per column when deciding its type
+typeThreshold = 0.8 # fraction of sampled cells that must parse as the type
+numberPattern = re.compile(r'^[-+\u2212]?((\d{1,3}(,\d{3})+|\d+)(\.\d+)?|\.\d+)([eE][-+]?\d+)?$')
+isoDatePattern = re.compile(r'^(\d{4})-(\d{1,2})-(\d{1,2})(?:[T ](\d{1,2}):(\d{2})(?::(\d{2}))?)?Z?$')
+monthNames = ['january', 'february', 'march', 'april', 'may', 'june', 'july',
+    'august', 'september', 'october', 'november', 'december']
+monthNumbers = dict([(m, n + 1) for n, m in enumerate(monthNames)] + [(m[0:3], n + 1) for n, m in enumerate(monthNames)])
+mdyPattern = re.compile(r'^([A-Za-z]{3,9})\.? (\d{1,2}),? (\d{4})$')
+dmyPattern = re.compile(r'^(\d{1,2}) ([A-Za-z]{3,9})\.?,? (\d{4})$')
+dateHintPattern = re.compile(r'\d{1,4}[/.-]\d{1,2}[/.-]\d{1,4}|\b(%s)[a-z]*\.?\s' % '|'.join(m[0:3] for m in monthNames), re.IGNORECASE)
+titleBatchSize = 50 # maximum titles per MediaWiki API query
+curidPath = data.get_path('curids.json')
+
+_curids = None
+_curidLock = threading.Lock()
+_unsavedCurids = 0
+
 def isInfobox(tag):
     """Filter for determining if a given table element is a WikiMedia infobox
     """
@@ -63,30 +92,73 @@ def filter(phrase, isSpecCharsFiltered=True):
         phrase = re.sub('[^\w\s\d]+', '', phrase)
     return phrase
     
+def _readInfoBox(content):
+    """Returns a dictionary of the entries in the first infobox in the given
+       markup, with keys and values normalized by filter() and the values of
+       duplicate keys merged with '; '.
+    """
+    soup = markup.getSoup(content, infoboxStrainer)
+    entry = {}
+    with metrics.timer('extract'):
+        table = soup.find_all(isInfobox)[0]
+        for r in table.find_all(isRow):
+            k, v = [c.text for c in r.find_all(['td','th'])]
+            key = filter(k).strip()
+            if key in entry:
+                entry[key] = entry[key] + '; ' + filter(v, False)
+            else:
+                entry[key] = filter(v, False)
+    return entry
+
 def getInfoBox(url):
     """Returns a dictionary corresponding to the entries in the first infobox
        (usually an article card) from the page at the given URL.
     """
-    res = requests.get(url)
-    soup = bs4.BeautifulSoup(res.content, 'html.parser')
-    table = soup.find_all(isInfobox)[0]
-    entry = {}
-    for r in table.find_all(isRow):
-        k, v = [c.text for c in r.find_all(['td','th'])]
-        key = filter(k).strip()
-        if key in entry:
-            entry[key] = entry[key] + '; ' + filter(v, False)
-        else:
-            entry[key] = filter(v, False)
-    return entry
+    res = fetch.get(url)
+    return _readInfoBox(res.content)
+
+async def agetInfoBox(url):
+    """Awaitable form of getInfoBox().
+    """
+    res = await afetch.get(url)
+    return _readInfoBox(res.content)
+
+def getInfoBoxApi(article, fqdn='https://en.wikipedia.org/', apiPath='w/api.php'):
+    """Returns the same dictionary as getInfoBox(), but requests only the
+       rendered lead section (section 0, where infoboxes live) of the given
+       article through the MediaWiki parse API instead of the full page. The
+       article may be given by title or by curid (an integer).
+    """
+    params = {
+        'action': 'parse',
+        'prop': 'text',
+        'section': 0,
+        'format': 'json',
+        'formatversion': 2,
+        'redirects': 1,
+        'disablelimitreport': 1,
+        'disableeditsection': 1
+    }
+    if type(article) in [type(0)]:
+        params['pageid'] = article
+    else:
+        params['page'] = article
+    res = fetch.get(fqdn + apiPath, params=params)
+    parsed = json.loads(res.content)
+    if 'error' in parsed:
+        raise Exception('Unable to parse article "%s": %s' % (article, parsed['error'].get('info', '')))
+    text = parsed['parse']['text']
+    if type(text) is dict:
+        text = text['*']
+    return _readInfoBox(text)
     
 def getTables(url):
     """Returns a set of parsed tables for all tables in the given page. No
        schema is assumed; table cells are simply parsed as filtered text values.
     """
     result = []
-    res = requests.get(url)
-    soup = bs4.BeautifulSoup(res.content, 'html.parser')
+    res = fetch.get(url)
+    soup = markup.getSoup(res.content, tableStrainer)
     tables = soup.find_all('table')
     for table in tables:
         result.append(getTable('', table))
@@ -104,31 +176,140 @@ def getVisibleChildren(tag):
 def attemptDate(value):
     try:
         value = parser.parse(value)
-        if value.hour is 0 and value.minute is 0 and value.second is 0:
+        if value.hour == 0 and value.minute == 0 and value.second == 0:
             value = value.date()
-    except:
+    except (ValueError, OverflowError):
         pass
     return value
+
+def parseNumber(value):
+    """Returns the int or float value of a numeric cell string (thousands
+       separators and bracketed references allowed), or None if it is not one.
+    """
+    value = re.sub(r'\[.+?\]', '', value).strip()
+    if numberPattern.match(value) is None:
+        return None
+    value = value.replace(',', '').replace(u'\u2212', '-')
+    try:
+        if re.match(r'^[-+]?\d+$', value):
+            return int(value)
+        return float(value)
+    except ValueError:
+        return None
+
+def parseDate(value):
+    """Returns the date (or datetime, when a time of day is given) for a date
+       cell string, or None if it is not one. ISO-like and month-name forms are
+       matched directly; dateutil is only consulted for other strings that look
+       like dates.
+    """
+    value = re.sub(r'\[.+?\]', '', value).strip()
+    try:
+        m = isoDatePattern.match(value)
+        if m is not None:
+            y, mo, d, h, mi, s = [int(g) if g is not None else None for g in m.groups()]
+            if h is None or (h == 0 and mi == 0 and not s):
+                return datetime.date(y, mo, d)
+            return datetime.datetime(y, mo, d, h, mi, s or 0)
+        m = mdyPattern.match(value)
+        if m is not None and m.group(1).lower() in monthNumbers:
+            return datetime.date(int(m.group(3)), monthNumbers[m.group(1).lower()], int(m.group(2)))
+        m = dmyPattern.match(value)
+        if m is not None and m.group(2).lower() in monthNumbers:
+            return datetime.date(int(m.group(3)), monthNumbers[m.group(2).lower()], int(m.group(1)))
+    except ValueError:
+        return None
+    if dateHintPattern.search(value) is None:
+        return None
+    value = attemptDate(value)
+    if isinstance(value, datetime.date):
+        return value
+    return None
+
+cellParsers = {
+    'number': parseNumber,
+    'date': parseDate
+}
+
+@functools.lru_cache(maxsize=2**16)
+def convertCell(value, kind):
+    """Converts a cell string to the given column type ('number', 'date', or
+       'text'), returning the original string if it does not parse. Results are
+       memoized, since list tables repeat many cell values.
+    """
+    if kind not in cellParsers or len(value) == 0:
+        return value
+    converted = cellParsers[kind](value)
+    return value if converted is None else converted
+
+def inferType(values):
+    """Decides a column type ('number', 'date', or 'text') from a sample of its
+       non-empty cell strings.
+    """
+    sample = [v for v in values if len(v.strip()) > 0][0:sampleSize]
+    if len(sample) == 0:
+        return 'text'
+    for kind in ['number', 'date']:
+        hits = sum(1 for v in sample if not isinstance(convertCell(v, kind), str))
+        if hits >= typeThreshold * len(sample):
+            return kind
+    return 'text'
+
+def typeColumns(rows, skip=[]):
+    """Converts the cells of the given rows (lists of strings) in place, column
+       by column, using the type inferred for each column. Rows whose indices
+       are listed in skip (like header rows) are left as text and excluded from
+       type inference. Returns the list of column types.
+    """
+    skip = set(skip)
+    nCols = max([len(r) for r in rows] + [0])
+    kinds = []
+    for c in range(nCols):
+        values = [r[c] for n, r in enumerate(rows) if n not in skip and c < len(r)]
+        kind = inferType(values)
+        kinds.append(kind)
+        if kind == 'text':
+            continue
+        for n, r in enumerate(rows):
+            if n not in skip and c < len(r):
+                r[c] = convertCell(r[c], kind)
+    return kinds
+
+def _toArray(values, kind):
+    """Returns a NumPy array for a typed column, using NaN/NaT for cells that
+       did not parse.
+    """
+    if kind == 'number':
+        return np.array([v if isinstance(v, (int, float)) else np.nan for v in values], dtype=np.float64)
+    if kind == 'date':
+        return np.array([np.datetime64(v) if isinstance(v, datetime.date) else np.datetime64('NaT') for v in values], dtype='datetime64[s]')
+    return np.array(values, dtype=object)
     
-def getTable(url='', table=None):
-    """Fetches, parses, and returns the desired table (defaults to the first) on
-       the given WikiMedia-served page. Technically, would work with any .HTML
-       page with a table, in fact. The main difference between getTable() and
-       getCompList() is the lack of assumption regarding table schema--no
-       headers are required and data is simply returned as a list of lists.
+def _readTable(content, table=None):
+    """Returns the desired table (by index; defaults to the first) from the
+       given markup.
+    """
+    soup = markup.getSoup(content, tableStrainer)
+    tables = soup.find_all('table')
+    if type(table) in [type(0), type(0.)]:
+        return tables[int(table)]
+    return tables[0]
+
+def _getRows(url='', table=None):
+    """Returns the cell strings of the desired table, by row, along with the
+       indices of its header rows (rows made up entirely of th cells).
     """
     if type(table) is not bs4.element.Tag:
-        res = requests.get(url)
-        soup = bs4.BeautifulSoup(res.content, 'html.parser')
-        tables = soup.find_all('table')
-        if type(table) in [type(0), type(0.)]:
-            table = tables[int(table)]
-        else:
-            table = tables[0]
+        res = fetch.get(url)
+        table = _readTable(res.content, table)
     entries = []
+    headers = []
     for r in table.find_all('tr'):
         entry = []
-        for ndx, cell in enumerate(r.find_all(['th','td'])):
+        cells = r.find_all(['th','td'])
+        if len(cells) > 0 and all(cell.name == 'th' for cell in cells):
+            headers.append(len(entries))
+        for ndx, cell in enumerate(cells):
             chi = getVisibleChildren(cell)
             values = []
             for ch in chi:
@@ -141,54 +322,290 @@ def getTable(url='', table=None):
             else:
                 value = ' '.join(values).strip()
             value = value.replace(u'\xa0', ' ')
-            value = attemptDate(value)
-            if type(value) in [type(0),type(0.)]:
-                value = re.sub('\[.+?\]', '', value)
             entry.append(value)
         entries.append(entry)
+    return entries, headers
+
+def readTable(content, url=None, table=None):
+    """Returns the desired table (by index; defaults to the first) from the
+       given page markup, typed as for getTable(). As a module-level function,
+       it can be run on a process pool (see pipeline.imap(); pass the table
+       index with functools.partial).
+    """
+    entries, headers = _getRows(url, _readTable(content, table))
+    typeColumns(entries, headers)
+    return entries
+
+def getTable(url='', table=None):
+    """Fetches, parses, and returns the desired table (defaults to the first) on
+       the given WikiMedia-served page. Technically, would work with any .HTML
+       page with a table, in fact. The main difference between getTable() and
+       getCompList() is the lack of assumption regarding table schema--no
+       headers are required and data is simply returned as a list of lists.
+       Cells are typed by column (see typeColumns()), so numeric and date
+       columns come back as numbers and dates; header rows are left as text.
+    """
+    entries, headers = _getRows(url, table)
+    typeColumns(entries, headers)
     return entries
+
+async def agetTable(url='', table=None):
+    """Awaitable form of getTable().
+    """
+    if type(table) is bs4.element.Tag:
+        return getTable(url, table)
+    res = await afetch.get(url)
+    return readTable(res.content, url, table)
+
+def getColumns(url='', table=None, asArray=False, asFrame=False):
+    """Returns the desired table (as for getTable()) as typed columns, keyed by
+       the text of its first row. Columns are lists of values by default, NumPy
+       arrays (float, datetime64, or object) if asArray is set, or a pandas
+       DataFrame if asFrame is set.
+    """
+    entries, _ = _getRows(url, table)
+    if len(entries) == 0:
+        return OrderedDict()
+    names = entries[0]
+    body = [r + [''] * (len(names) - len(r)) for r in entries[1:]]
+    kinds = typeColumns(body)
+    columns = OrderedDict()
+    for c, name in enumerate(names):
+        values = [r[c] for r in body]
+        if asArray or asFrame:
+            values = _toArray(values, kinds[c] if c < len(kinds) else 'text')
+        columns[name] = values
+    if asFrame:
+        import pandas
+        return pandas.DataFrame(columns)
+    return columns
     
+class Page(object):
+    """A WikiMedia page fetched and parsed once, from which any number of
+       wikitables can be read. Tables are indexed by caption and by the text of
+       their first header cell (case-insensitive), and their rows are produced
+       lazily.
+    """
+
+    def __init__(self, url, content=None):
+        self.url = url
+        if content is None:
+            content = fetch.get(url).content
+        soup = markup.getSoup(content, wikiTableStrainer)
+        self.tables = soup.find_all(isWikiTable)
+        self.index = {}
+        for ndx, t in enumerate(self.tables):
+            keys = []
+            caption = t.find('caption')
+            if caption is not None:
+                keys.append(filter(caption.text).strip().lower())
+            th = t.find('th')
+            if th is not None:
+                keys.append(filter(th.text).lower())
+                keys.append(filter(th.text).strip().lower())
+            for key in keys:
+                self.index.setdefault(key, ndx)
+
+    def getKeys(self):
+        """Returns the caption or first-header key of each table, in order.
+        """
+        keys = [None] * len(self.tables)
+        for key, ndx in self.index.items():
+            if keys[ndx] is None or len(key) < len(keys[ndx]):
+                keys[ndx] = key
+        return keys
+
+    def getTable(self, table=None):
+        """Returns the table element identified by caption/first-header string,
+           by index, or (by default) the first table.
+        """
+        if type(table) in [type(''),type(u'')]:
+            key = table.lower()
+            if key not in self.index:
+                key = key.strip()
+            return self.tables[self.index[key]]
+        elif type(table) in [type(0),type(0.)]:
+            return self.tables[int(table)]
+        return self.tables[0]
+
+    def iterRows(self, table=None):
+        """Yields a dictionary (keyed by header) for each data row of the given
+           table, as identified for getTable().
+        """
+        table = self.getTable(table)
+        headers = [filter(h.text) for h in table.find_all('th')]
+        for r in table.find_all(isDataRow):
+            entry = {}
+            for ndx, cell in enumerate(r.find_all('td')):
+                value = ' '.join([ch for ch in cell.children if type(ch) is bs4.element.NavigableString])
+                if len(value) == 0:
+                    value = cell.text
+                entry[headers[ndx]] = filter(value, False)
+            yield entry
+
+    def iterTables(self, tables=None):
+        """Yields (table, rows) pairs for the given tables (by default, every
+           table on the page), where rows is a generator as from iterRows().
+        """
+        if tables is None:
+            tables = range(len(self.tables))
+        for table in tables:
+            yield table, self.iterRows(table)
+
+    def getCompList(self, table=None):
+        """Returns the rows of the given table as a list; see getCompList().
+        """
+        return list(self.iterRows(table))
+
 def getCompList(url, table=None):
     """Returns a list of dictionaries corresponding to the table entries (header
        row assumed) from the first WikiMedia-style table on the page at the 
        given URL. This is typically used for 'Comparison of' or 'List of' pages.
+       To read several tables from one page, construct a Page instead, which
+       fetches and parses the page only once.
     """
-    res = requests.get(url)
-    soup = bs4.BeautifulSoup(res.content, 'html.parser')
-    tables = soup.find_all(isWikiTable)
-    if type(table) in [type(''),type(u'')]:
-        ths = [filter(t.find('th').text).lower() for t in tables]
-        table = tables[ths.index(table.lower())]
-    elif type(table) in [type(0),type(0.)]:
-        table = tables[int(table)]
-    else:
-        table = tables[0]
-    headers = [filter(h.text) for h in table.find_all('th')]
-    entries = []
-    for r in table.find_all(isDataRow):
-        entry = {}
-        for ndx, cell in enumerate(r.find_all('td')):
-            value = ' '.join([ch for ch in cell.children if type(ch) is bs4.element.NavigableString])
-            if len(value) == 0:
-                value = cell.text
-            entry[headers[ndx]] = filter(value, False)
-        entries.append(entry)
-    return entries
+    return Page(url).getCompList(table)
+
+async def agetCompList(url, table=None):
+    """Awaitable form of getCompList().
+    """
+    res = await afetch.get(url)
+    return Page(url, res.content).getCompList(table)
     
+def _getCurids(site):
+    """Returns the locally-cached title-to-curid mapping for the given site
+       (API URL), loading the cache file on first use.
+    """
+    global _curids
+    if _curids is None:
+        _curids = {}
+        if os.path.isfile(curidPath):
+            with open(curidPath, 'r') as f:
+                _curids = json.load(f)
+    return _curids.setdefault(site, {})
+
+def _saveCurids():
+    global _unsavedCurids
+    tmpPath = curidPath + '.tmp'
+    with open(tmpPath, 'w') as f:
+        json.dump(_curids, f)
+    os.replace(tmpPath, curidPath)
+    _unsavedCurids = 0
+
+@atexit.register
+def flushCurids():
+    """Writes any title-to-curid mappings not yet saved to the cache file
+       (done automatically at exit).
+    """
+    with _curidLock:
+        if _curids is not None and _unsavedCurids > 0:
+            _saveCurids()
+
+def _getCuridParams(titles):
+    return {
+        'action': 'query',
+        'prop': 'info',
+        'format': 'json',
+        'redirects': 1,
+        'titles': '|'.join(titles)
+    }
+
+def _queryCurids(titles, site):
+    """Resolves up to titleBatchSize titles with one API query, following
+       normalization and redirects. Returns a title-to-curid mapping in which
+       missing pages have negative IDs.
+    """
+    res = fetch.get(site, params=_getCuridParams(titles))
+    return _readCurids(res.content, titles)
+
+async def _aqueryCurids(titles, site):
+    res = await afetch.get(site, params=_getCuridParams(titles))
+    return _readCurids(res.content, titles)
+
+def _readCurids(content, titles):
+    query = json.loads(content)['query']
+    normalized = dict((n['from'], n['to']) for n in query.get('normalized', []))
+    redirects = dict((r['from'], r['to']) for r in query.get('redirects', []))
+    ids = dict((p['title'], int(k)) for k, p in query['pages'].items())
+    curids = {}
+    for title in titles:
+        target = normalized.get(title, title)
+        target = redirects.get(target, target)
+        curids[title] = ids.get(target, -1)
+    return curids
+
+def getUrls(titles, fqdn='https://en.wikipedia.org/', apiPath='w/api.php', exceptNull=False):
+    """Batch form of getUrl(), returning an ordered dictionary of stable URLs
+       keyed by the given article titles. Titles are resolved (following
+       normalization and redirects) up to titleBatchSize per API request, and
+       title-to-curid mappings are cached locally so repeated titles cost no
+       requests at all.
+    """
+    site = fqdn + apiPath
+    cached, batches = _getPending(titles, site)
+    resolved = {}
+    for batch in batches:
+        resolved.update(_queryCurids(batch, site))
+    return _getStableUrls(titles, fqdn, site, cached, resolved, exceptNull)
+
+async def agetUrls(titles, fqdn='https://en.wikipedia.org/', apiPath='w/api.php', exceptNull=False):
+    """Awaitable form of getUrls(), querying its batches of titles
+       concurrently.
+    """
+    site = fqdn + apiPath
+    cached, batches = _getPending(titles, site)
+    resolved = {}
+    for curids in await asyncio.gather(*[_aqueryCurids(batch, site) for batch in batches]):
+        resolved.update(curids)
+    return _getStableUrls(titles, fqdn, site, cached, resolved, exceptNull)
+
+def _getPending(titles, site):
+    """Returns the cached title-to-curid mappings for the given site, and the
+       remaining titles in batches of up to titleBatchSize.
+    """
+    with _curidLock:
+        cached = dict(_getCurids(site))
+    pending = []
+    seen = set()
+    for title in titles:
+        if title not in cached and title not in seen:
+            seen.add(title)
+            pending.append(title)
+    return cached, [pending[ndx:ndx+titleBatchSize] for ndx in range(0, len(pending), titleBatchSize)]
+
+def _getStableUrls(titles, fqdn, site, cached, resolved, exceptNull):
+    """Adds the resolved mappings to the cache, which is written once at least
+       titleBatchSize new titles have accumulated (so resolving titles one at a
+       time with getUrl() does not rewrite it per title), and at exit.
+    """
+    global _unsavedCurids
+    if len(resolved) > 0:
+        with _curidLock:
+            curids = _getCurids(site)
+            curids.update((t, i) for t, i in resolved.items() if i > 0)
+            _unsavedCurids += len(resolved)
+            if _unsavedCurids >= titleBatchSize:
+                _saveCurids()
+    cached.update(resolved)
+    urls = OrderedDict()
+    for title in titles:
+        id = cached[title]
+        if id < 0 and exceptNull:
+            raise Exception('Null page returned for article name "%s"' % title)
+        urls[title] = '%s?curid=%u' % (fqdn, id)
+    return urls
+
 def getUrl(articleName, fqdn='https://en.wikipedia.org/', apiPath='w/api.php', exceptNull=False):
     """Uses the WikiMedia API to determine the ID of a page with the given
        title, which is then used to construct a stable URL for the corresponding
        page.
     """
-    queryString = '?action=query&prop=info&format=json&titles=' + articleName.replace(' ', '%20')
-    res = requests.get(fqdn + apiPath + queryString)
-    data = json.loads(res.content)
-    pages = data['query']['pages']
-    keys = list(pages.keys())
-    id = int(keys[0])
-    if id < 0 and exceptNull:
-        raise Exception('Null page returned for article name "%s"' % articleName)
-    return '%s?curid=%u' % (fqdn, id)
+    return getUrls([articleName], fqdn, apiPath, exceptNull)[articleName]
+
+async def agetUrl(articleName, fqdn='https://en.wikipedia.org/', apiPath='w/api.php', exceptNull=False):
+    """Awaitable form of getUrl().
+    """
+    return (await agetUrls([articleName], fqdn, apiPath, exceptNull))[articleName]
 
 def main(topic):
     """By default, scrapes the infobox from the given topic page into a